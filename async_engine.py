@@ -0,0 +1,412 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from os import environ
+from playwright.async_api import async_playwright,TimeoutError,Error as PlaywrightError
+import pandas as pd
+from response_capture import is_search_response,check_response,load_payload,parse_search_payload
+from page_parsing import (parse_upper_table,parse_carrier_table,table_rows,dataframe_rows,sheet_name_for,fare_matrix,CARRIER_TABLE_SCRIPT,
+                          UPPER_TABLE_SCRIPT,FARE_MATRIX_ATTR)
+from row_collector import RowCollector
+from failure_queue import FAILURES_ATTR,date_failure,failures_of,error_text
+from metrics import METRICS
+from readiness import (Budget,BudgetExceeded,backoff_delay,wait_for_stable_table_async,TABLE_STATE_SCRIPT,DATE_BUDGET,CARRIER_BUDGET,
+                       SEARCH_TIMEOUT,CARRIER_TIMEOUT,UPPER_TABLE_SELECTOR,CARRIER_TABLE_SELECTOR)
+
+#Ver 1.3 --MATRIX_URL points the scraper at another server, e.g. the local replay server of the benchmark.
+url = environ.get("MATRIX_URL","https://matrix.itasoftware.com")
+#Ver 1.3 --Carrier tables that can wait on the results queue per worker before the workers have to wait for the writer.
+RESULT_QUEUE_PARTS = 4
+
+
+async def wait_for_table_load(page,worker,budget):
+    """
+    Async version of wait_for_table_load in the main script. The search response is awaited by search_date, here the rows of
+    the upper table are waited until they stop changing, with the learned timeout, backoff between tries and the budget of the date.
+
+    Args:
+        page (playwright.async_api.Page): page of the worker
+        worker (int): worker number, only used for the prints
+        budget (Budget): time budget of the date
+
+    Returns:
+        bool: returns True if error
+    """
+    for counter in range(1,6):
+        timeout = budget.cap(SEARCH_TIMEOUT.current())
+        started = time.monotonic()
+        with METRICS.stage("wait_table",attempt=counter) as stage:
+            if await wait_for_stable_table_async(page,UPPER_TABLE_SELECTOR,max(0.1,timeout - (time.monotonic() - started))) is None:
+                stage.outcome = "timeout"
+        if stage.outcome == "ok":
+            SEARCH_TIMEOUT.record(time.monotonic() - started)
+            return False
+        print(f"[worker {worker}] TimeoutError... Retrying...Total Tries :{counter}")
+        METRICS.retry("wait_table")
+        await asyncio.sleep(backoff_delay(counter))
+    return True
+
+
+async def wait_for_carrier_table_load(page,carrier,worker,previous,budget):
+    """
+    Async version of wait_for_carrier_table_load in the main script.
+
+    Args:
+        page (playwright.async_api.Page): page of the worker
+        carrier (str): name of the carrier to be waited
+        worker (int): worker number, only used for the prints
+        previous (dict): state of the carrier table before the click
+        budget (Budget): time budget of the carrier
+
+    Returns:
+        bool: returns True if error
+    """
+    started = time.monotonic()
+    with METRICS.stage("carrier_wait",carrier=carrier) as stage:
+        if await wait_for_stable_table_async(page,CARRIER_TABLE_SELECTOR,budget.cap(CARRIER_TIMEOUT.current()),previous=previous) is None:
+            stage.outcome = "timeout"
+    if stage.outcome != "ok":
+        print(f"[worker {worker}] a problem occured while loading the tables for {carrier}...")
+        return True
+    CARRIER_TIMEOUT.record(time.monotonic() - started)
+    return False
+
+
+async def submit_search(page):
+    """
+    Async version of submit_search in the main script.
+    """
+    await page.keyboard.down(key="Enter")
+    await page.keyboard.up(key="Enter")
+    await page.click('//button[@value="Search"]',no_wait_after=True)
+
+
+async def search_date(context,origin,destination,starting_date,ending_date,worker,capture=False,limiter=None,controller=None,page=None):
+    """
+    This function fills the search form on a new page of the worker's context and waits until the result tables are loaded.
+    A timed out search closes the page and starts again on a new one. With capture=True the search response is captured instead of waiting for the tables.
+    Every attempt takes a token of the shared rate limiter first, the latency and timeouts of the searches are reported to the concurrency controller.
+    A warm page that already shows the empty search form can be given, the first attempt uses it without loading the site again.
+
+    Args:
+        context (playwright.async_api.BrowserContext): isolated context owned by the worker
+        origin (str): origin IATA code
+        destination (str): destination IATA code
+        starting_date (str): start date in MM/DD/YYYY format
+        ending_date (str): end date in MM/DD/YYYY format
+        worker (int): worker number, only used for the prints
+        capture (bool): capture the search result payload
+        limiter (TokenBucket): rate limiter shared by the workers, None doesn't limit
+        controller (AimdController): concurrency controller of the pool, None disables it
+        page (playwright.async_api.Page): warm page of the context with the site loaded, None opens a new page
+
+    Returns:
+        page,payload: page with the search results loaded and the decoded payload, payload is None without capture
+
+    Raises:
+        BudgetExceeded: if the date could not be searched within DATE_BUDGET seconds
+    """
+    budget = Budget(DATE_BUDGET,f"Search for {starting_date}")
+    attempt = 0
+    while True:
+        attempt += 1
+        if limiter is not None:
+            with METRICS.stage("rate_limit"):
+                await limiter.acquire_async()
+        if page is None:
+            page = await context.new_page()
+        try:
+            started = time.monotonic()
+            if not page.url.startswith(url):
+                with METRICS.stage("goto"):
+                    await page.goto(url)
+            with METRICS.stage("fill"):
+                await page.type("input[id=mat-mdc-chip-list-input-1]",destination.upper())
+                await page.type("input[id=mat-mdc-chip-list-input-0]",origin.upper())
+                await page.get_by_placeholder("Start Date").fill(starting_date)
+                await page.get_by_placeholder("End Date").fill(ending_date)
+            if capture:
+                with METRICS.stage("capture_response"):
+                    async with page.expect_response(is_search_response,timeout=budget.cap(SEARCH_TIMEOUT.maximum)*1000) as response_info:
+                        await submit_search(page)
+                    response = await response_info.value
+                    check_response(response.status)
+                    payload = load_payload(await response.text())
+                if controller is not None:
+                    controller.success(time.monotonic() - started)
+                return page,payload
+            with METRICS.stage("submit"):
+                async with page.expect_response(is_search_response,timeout=budget.cap(SEARCH_TIMEOUT.maximum)*1000) as response_info:
+                    await submit_search(page)
+                check_response((await response_info.value).status)
+            print(f"[worker {worker}] Search completed for {starting_date}... Waiting for tables to load...")
+            if await wait_for_table_load(page,worker,budget):
+                raise TimeoutError("Timelimit exceeded")
+            if controller is not None:
+                controller.success(time.monotonic() - started)
+            return page,None
+        except (TimeoutError,ValueError) as error:
+            print(f"[worker {worker}] Search failed for {starting_date} ({error})... Retrying on a new page...")
+            if controller is not None:
+                controller.timeout()
+            METRICS.retry("search",attempt=attempt)
+            await page.close()
+            page = None
+            await asyncio.sleep(min(backoff_delay(attempt),max(0,budget.remaining())))
+            budget.check()
+        except BudgetExceeded:
+            await page.close()
+            raise
+
+
+async def read_carriers(page,carriers,worker,done_carriers=None,skipped=None):
+    """
+    Extract stage of a date. Clicks every carrier of the upper table and yields its table as soon as it is read,
+    before the next carrier is clicked.
+
+    Args:
+        page (playwright.async_api.Page): page with the search results loaded
+        carriers (list): header of the upper table, the first column is not a carrier
+        worker (int): worker number, only used for the prints
+        done_carriers (dict): carrier -> (columns,rows) finished in an earlier run, these carriers are not clicked
+        skipped (dict): carriers whose table didn't load within their budget are added to it with the reason
+
+    Yields:
+        carrier,columns,rows,new: carrier table, new is False for the carriers taken from done_carriers
+    """
+    done_carriers = done_carriers or {}
+    for carrier in carriers[1:]:
+        if carrier in done_carriers:
+            yield carrier,*done_carriers[carrier],False
+            continue
+        #Every carrier gets CARRIER_BUDGET seconds for its clicks and waits, then it is skipped.
+        budget = Budget(CARRIER_BUDGET,carrier)
+        previous = await page.evaluate(TABLE_STATE_SCRIPT,CARRIER_TABLE_SELECTOR)
+        loaded = False
+        error = None
+        attempt = 0
+        while not loaded:
+            attempt += 1
+            try:
+                with METRICS.stage("carrier_click",carrier=carrier,attempt=attempt):
+                    await page.get_by_role("columnheader", name=f"{carrier} Carrier logo",exact= True).get_by_role("img",exact=True).click(
+                        no_wait_after=True,timeout=budget.cap(10)*1000)
+                loaded = not await wait_for_carrier_table_load(page,carrier,worker,previous,budget)
+            except TimeoutError:
+                print(f"[worker {worker}] TimeoutError while clicking {carrier}... Retrying...")
+            except BudgetExceeded:
+                break
+            except PlaywrightError as click_error:
+                #Other errors of the page are not retried, the carrier is skipped and goes to the failure queue.
+                error = click_error
+                break
+            if not loaded:
+                METRICS.retry("carrier",carrier=carrier)
+                await asyncio.sleep(min(backoff_delay(attempt),max(0,budget.remaining())))
+        if loaded:
+            try:
+                with METRICS.stage("read_screen") as stage:
+                    table = await page.evaluate(CARRIER_TABLE_SCRIPT)
+                    if table is not None:
+                        columns,rows = table_rows(table)
+                    else:
+                        stage.outcome = "fallback"
+                        columns,rows = dataframe_rows(parse_carrier_table(await page.content()))
+            except (PlaywrightError,ValueError) as read_error:
+                #A table the parser doesn't understand (e.g. a changed header) skips the carrier as well.
+                loaded,error = False,read_error
+        if not loaded:
+            reason = error_text(error) if error is not None else f"table didn't load within {CARRIER_BUDGET}s"
+            print(f"[worker {worker}] Couldn't get the table for {carrier} ({reason}), skipping.")
+            METRICS.record("carrier_skipped",budget.seconds - budget.remaining(),"budget" if error is None else "error",{"carrier":carrier})
+            if skipped is not None:
+                skipped[carrier] = reason
+            continue
+        yield carrier,columns,rows,True
+
+
+async def date_parts(context,origin,destination,starting_date,ending_date,worker,capture=False,journal=None,limiter=None,controller=None,page=None):
+    """
+    Ver 1.3 -- Search and extract stages of the streaming pipeline. Runs a full search for one date and yields the rows of every carrier
+    as a separate part as soon as its table is read, so a date never has to be held in memory as a whole.
+    With capture=True the rows come from the captured search payload in a single part and no carrier is clicked.
+    The last part is always final and carries the fare matrix of the upper table in its attrs, it has no rows after the carrier parts.
+    With a checkpoint journal, carriers finished in an earlier run are taken from the journal and every new carrier is recorded in it.
+    Carriers skipped after their budget are listed in the attrs of the last part (FAILURES_ATTR) for the failure queue.
+    The page of the search is closed when the date is done, also a warm page given by the caller.
+
+    Yields:
+        dataframes,final: rows of a carrier with start_date and end_date, final is True for the last part of the date
+    """
+    page,payload = await search_date(context,origin,destination,starting_date,ending_date,worker,capture=capture,limiter=limiter,controller=controller,
+                                     page=page)
+    if payload is not None:
+        await page.close()
+        with METRICS.stage("parse_payload"):
+            dataframes = parse_search_payload(payload,starting_date,ending_date)
+        yield dataframes,True
+        return
+    try:
+        with METRICS.stage("parse_upper"):
+            table = await page.evaluate(UPPER_TABLE_SCRIPT)
+            if table is not None:
+                carriers,upper_rows = table["carriers"],table["rows"]
+            else:
+                carriers,upper_rows = parse_upper_table(await page.content())
+        collector = RowCollector(starting_date,ending_date)
+        job = (origin,destination,starting_date,ending_date)
+        done_carriers = journal.finished_carriers(job) if journal is not None else {}
+        skipped = {}
+        async for carrier,columns,rows,new in read_carriers(page,carriers,worker,done_carriers,skipped):
+            if new and journal is not None:
+                journal.carrier_done(job,carrier,columns,rows)
+            collector.add_rows(columns,rows)
+            if len(collector):
+                yield collector.materialize(),False
+    finally:
+        await page.close()
+    dataframes = collector.materialize()
+    dataframes.attrs[FARE_MATRIX_ATTR] = fare_matrix(carriers,upper_rows)
+    if skipped:
+        dataframes.attrs[FAILURES_ATTR] = {"carriers":skipped}
+    yield dataframes,True
+
+
+async def scrape_date(context,origin,destination,starting_date,ending_date,worker,capture=False,journal=None,limiter=None,controller=None,page=None):
+    """
+    This function runs a full search for one date and returns the rows of every carrier at once, see date_parts.
+    The service mode answers one date at a time, the pool writes the parts as they come instead.
+
+    Returns:
+        pandas.DataFrame: rows of all the carriers for the date
+    """
+    parts = [dataframes async for dataframes,_ in date_parts(context,origin,destination,starting_date,ending_date,worker,capture=capture,
+                                                             journal=journal,limiter=limiter,controller=controller,page=page)]
+    if len(parts) == 1:
+        return parts[0]
+    dataframes = pd.concat([part for part in parts if not part.empty] or parts[-1:],ignore_index=True)
+    dataframes.attrs = parts[-1].attrs
+    return dataframes
+
+
+async def worker_loop(browser,queue,results,worker,capture=False,journal=None,request_filter=None,limiter=None,controller=None,browser_cache=None):
+    """
+    Every worker owns an isolated browser context and pulls jobs from the shared queue until it is empty.
+    Jobs can belong to different routes, so one pool serves a whole batch.
+    A request filter is installed on the context with its own measurements.
+    With a concurrency controller a worker only searches while it holds one of the controller's slots.
+    Ver 1.3 -- Every carrier is put on the bounded results queue as soon as it is read, a worker waits for the writer when the queue is full.
+    A date that can't be searched puts a final part with only its failure, see date_failure, so the writer still counts it.
+    Ver 1.3 -- With a browser cache the context starts with the saved storage state and saves its own after the first search.
+    """
+    with METRICS.stage("new_context",worker=worker):
+        if browser_cache is not None:
+            context = await browser.new_context(**browser_cache.context_options())
+            await browser_cache.attach_async(context)
+        else:
+            context = await browser.new_context()
+        if request_filter is not None:
+            request_filter = request_filter.clone()
+            await request_filter.attach_async(context)
+    state_saved = False
+    try:
+        while True:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            origin,destination,starting_date,ending_date = job
+            print(f"[worker {worker}] Starting the search for {origin}-{destination} on {starting_date}...")
+            if request_filter is not None:
+                request_filter.start_search()
+            METRICS.bind(route=f"{origin}-{destination}",date=starting_date,worker=worker)
+            try:
+                async with controller.slot() if controller is not None else nullcontext():
+                    with METRICS.stage("date"):
+                        async for df,final in date_parts(context,origin,destination,starting_date,ending_date,worker,capture=capture,
+                                                         journal=journal,limiter=limiter,controller=controller):
+                            await results.put((job,df,final))
+            except BudgetExceeded as error:
+                #The date is left out of the output and goes to the failure queue.
+                print(f"[worker {worker}] {error}... Skipping the date...")
+                await results.put((job,date_failure(error),True))
+            except (PlaywrightError,ValueError) as error:
+                #So is a date the page or the parser failed on, the worker goes on with the next one.
+                print(f"[worker {worker}] Search for {starting_date} failed ({error_text(error)})... Skipping the date...")
+                await results.put((job,date_failure(error_text(error)),True))
+            else:
+                if browser_cache is not None and not state_saved:
+                    try:
+                        await browser_cache.save_state_async(context)
+                    except (PlaywrightError,OSError) as error:
+                        print(f"[worker {worker}] Couldn't save the browser storage state ({error})...")
+                    state_saved = True
+            if request_filter is not None:
+                request_filter.finish_search(f"[worker {worker}] {origin}{destination} {sheet_name_for(starting_date)}")
+    finally:
+        await context.close()
+
+
+async def run_search_pool(jobs,concurrency,on_result,headless=True,capture=False,journal=None,request_filter=None,limiter=None,controller=None,
+                          browser_cache=None):
+    """
+    This function runs the searches of every job with concurrency parallel workers sharing one browser.
+    Ver 1.3 -- Results are streamed: workers put the rows of every carrier on a bounded queue and on_result writes them in the order they arrive,
+    so memory only holds a few carrier tables however many dates and routes the run has. The parts of different dates can interleave,
+    the sinks keep a sheet per date and the excel export puts the sheets back in date order.
+    Ver 1.3 -- Every search of every worker takes a token of the shared limiter. With an AIMD controller concurrency is only the highest
+    number of parallel searches, the controller raises the limit while searches are fast and halves it when they time out.
+
+    Args:
+        jobs (list): list of (origin,destination,starting_date,ending_date) tuples, dates in MM/DD/YYYY format
+        concurrency (int): number of parallel browser contexts
+        on_result (callable): called with (origin,destination,starting_date,ending_date,dataframe,final) for every part of a date,
+            final is True for the last one
+        headless (bool): runs firefox headless if True
+        capture (bool): read the results from the captured search payload
+        journal (CheckpointJournal): records finished carriers, None disables it
+        request_filter (RequestFilter): settings of the filter installed on every worker context, None disables it
+        limiter (TokenBucket): rate limiter shared by the workers, None doesn't limit
+        controller (AimdController): adapts the number of parallel searches, None runs concurrency searches all the time
+        browser_cache (BrowserCache): on-disk cache of the site's files and storage state shared by the workers, None disables it
+
+    Returns:
+        int: number of dates written, dates that couldn't be searched are not counted
+    """
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    #Ver 1.3 --The queue between the workers and the writer is bounded, a slow disk makes the workers wait instead of piling up rows.
+    results = asyncio.Queue(maxsize=RESULT_QUEUE_PARTS*concurrency)
+    finished = 0
+    written = 0
+    async with async_playwright() as p:
+        with METRICS.stage("launch"):
+            browser = await p.firefox.launch(headless=headless,timeout=10000)
+        try:
+            workers = [asyncio.create_task(worker_loop(browser,queue,results,worker,capture=capture,journal=journal,
+                                                       request_filter=request_filter,limiter=limiter,controller=controller,
+                                                       browser_cache=browser_cache))
+                       for worker in range(1,max(1,min(concurrency,len(jobs)))+1)]
+            while finished < len(jobs):
+                getter = asyncio.create_task(results.get())
+                done,_ = await asyncio.wait(workers+[getter],return_when=asyncio.FIRST_COMPLETED)
+                if getter not in done:
+                    getter.cancel()
+                    #A worker that died with an exception would leave its job behind forever, so stop the run instead.
+                    for task in done:
+                        if task.exception() is not None:
+                            raise task.exception()
+                    workers = [task for task in workers if not task.done()]
+                    continue
+                job,df,final = getter.result()
+                on_result(*job,df,final)
+                if final:
+                    finished += 1
+                    if not failures_of(df).get("date"):
+                        written += 1
+                        print(f"Completed the search for date {sheet_name_for(job[2])}...")
+            await asyncio.gather(*workers)
+        finally:
+            await browser.close()
+    return written
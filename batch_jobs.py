@@ -0,0 +1,170 @@
+import json
+from datetime import datetime,date,timedelta
+
+#Ver 1.3 --Keys of a query line in the batch file, period is optional and defaults to 0 (only the start date).
+QUERY_KEYS = ("origin","destination","start_date","end_date")
+#Flights can only be booked up to this many days ahead.
+BOOKING_WINDOW_DAYS = 365
+
+
+def check_date(date_input,today=None):
+    """
+    This function checks a MM/DD/YY date the way the site accepts it: not in the past and within the booking window.
+
+    Raises:
+        ValueError: with the reason if the date can't be searched
+
+    Returns:
+        datetime.date: the date
+    """
+    try:
+        day = datetime.strptime(date_input,"%m/%d/%y").date()
+    except (TypeError,ValueError):
+        raise ValueError(f"{date_input!r} is not in MM/DD/YY format")
+    today = today or date.today()
+    if day < today:
+        raise ValueError(f"{date_input} is in the past")
+    if day > today + timedelta(days=BOOKING_WINDOW_DAYS):
+        raise ValueError(f"{date_input} is more than {BOOKING_WINDOW_DAYS} days away")
+    return day
+
+
+def validate_query(query,label,today=None):
+    """
+    This function validates a route query the same way the input prompts do, and checks that every searched date
+    (start_date + period and its return) is in the booking window.
+
+    Args:
+        query (dict): origin, destination, start_date, end_date (MM/DD/YY) and period
+        label (str): where the query comes from, used in the error message, e.g. "line 3"
+        today (datetime.date): date the window is checked from, today if None
+
+    Raises:
+        ValueError: if the query is not valid
+
+    Returns:
+        dict: query with upper case IATA codes and an int period
+    """
+    if not isinstance(query,dict):
+        raise ValueError(f"{label}: not a JSON object")
+    missing = [key for key in QUERY_KEYS if query.get(key) is None]
+    if missing:
+        raise ValueError(f"{label}: missing {', '.join(missing)}")
+    for key in ("origin","destination"):
+        code = str(query[key])
+        if len(code) != 3 or not code.isalpha():
+            raise ValueError(f"{label}: {key} {code!r} is not a 3 char IATA code")
+        query[key] = code.upper()
+    if query["origin"] == query["destination"]:
+        raise ValueError(f"{label}: origin and destination are the same")
+    for key in ("start_date","end_date"):
+        try:
+            datetime.strptime(query[key],"%m/%d/%y")
+        except (TypeError,ValueError):
+            raise ValueError(f"{label}: {key} {query[key]!r} is not in MM/DD/YY format")
+    try:
+        query["period"] = int(query.get("period") or 0)
+    except (TypeError,ValueError):
+        raise ValueError(f"{label}: period {query['period']!r} is not a number")
+    if not 0 <= query["period"] <= 355:
+        raise ValueError(f"{label}: period has to be between 0-355")
+    start_date = datetime.strptime(query["start_date"],"%m/%d/%y")
+    end_date = datetime.strptime(query["end_date"],"%m/%d/%y")
+    if end_date < start_date:
+        raise ValueError(f"{label}: end_date {query['end_date']} is before start_date {query['start_date']}")
+    try:
+        check_date(query["start_date"],today)
+        #The last search of the window departs period days after the start date and returns period days after the end date.
+        check_date((end_date + timedelta(days=query["period"])).strftime("%m/%d/%y"),today)
+    except ValueError as error:
+        raise ValueError(f"{label}: {error}")
+    return query
+
+
+def parse_query(line,line_number):
+    """
+    This function validates one line of the batch file.
+
+    Args:
+        line (str): JSON object with origin, destination, start_date, end_date (MM/DD/YY) and period
+        line_number (int): line number used in the error message
+
+    Raises:
+        ValueError: if the line is not a valid query
+
+    Returns:
+        dict: query with upper case IATA codes and an int period
+    """
+    try:
+        query = json.loads(line)
+    except ValueError:
+        raise ValueError(f"line {line_number}: not a JSON object")
+    return validate_query(query,f"line {line_number}")
+
+
+def read_queries(queries_path):
+    """
+    Ver 1.3 -- This function reads the batch file, one JSON query (route and date window) per line.
+    Empty lines and lines starting with # are skipped.
+
+    Args:
+        queries_path (str): path of the JSONL file
+
+    Raises:
+        SystemExit: if a line is not a valid query, nothing is scraped in that case
+
+    Returns:
+        list: validated queries in file order
+    """
+    queries = []
+    with open(queries_path,encoding="utf-8") as queries_file:
+        for line_number,line in enumerate(queries_file,1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                queries.append(parse_query(line,line_number))
+            except ValueError as error:
+                raise SystemExit(f"Invalid query in {queries_path}, {error}")
+    return queries
+
+
+def unique_jobs(jobs):
+    """
+    This function drops the jobs that are already in the list, so dates covered by overlapping queries are searched once.
+    The order of the first occurrences is kept.
+
+    Args:
+        jobs (list): list of (origin,destination,starting_date,ending_date) tuples
+
+    Returns:
+        list: jobs without duplicates
+    """
+    unique = list(dict.fromkeys(jobs))
+    if len(unique) < len(jobs):
+        print(f"{len(jobs) - len(unique)} searches are covered by more than one query, they are searched once...")
+    return unique
+
+
+def build_date_pairs(start_date,end_date,period):
+    """
+    Ver 1.3 -- This function converts the dates to datetime objects and creates the list of dates to iterate through, this is for the sake of generating more data.
+    We also calculate the timedelta (time difference between start and end date) to fill the form for future iterations.
+
+    Args:
+        start_date (str): start date in MM/DD/YY format
+        end_date (str): end date in MM/DD/YY format
+        period (int): number of days to search after the start date
+
+    Returns:
+        list: (starting_date,ending_date) tuples reformatted to MM/DD/YYYY to pass them into the form in the webpage
+    """
+    start_date_formatted = datetime.strptime(start_date,"%m/%d/%y")
+    end_date_formatted = datetime.strptime(end_date,"%m/%d/%y")
+    time_delta = end_date_formatted - start_date_formatted
+    date_list = [start_date_formatted + timedelta(days) for days in range(period + 1)]
+    date_pairs = []
+    for starting_date in date_list:
+        ending_date_in_dt = starting_date + timedelta(days=time_delta.days)
+        date_pairs.append((datetime.strftime(starting_date,"%m/%d/%Y"),datetime.strftime(ending_date_in_dt,"%m/%d/%Y")))
+    return date_pairs
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from datetime import date,timedelta
+from os import path
+import pandas as pd
+from bs4 import BeautifulSoup
+import async_engine
+from page_parsing import parse_upper_table,fare_matrix
+from replay_server import start_server,generate_payload
+from request_filter import RequestFilter,BLOCKED_RESOURCE_TYPES
+from browser_cache import BrowserCache
+from settings import BROWSER_CACHE_PATH
+from matrix_scraper import load_scraper
+
+#Ver 1.3 --End to end benchmark of the scraper against the local replay server (replay_server.py). It runs the same code path as
+#the script for a fixed set of dates and reports dates per minute, p50/p95 latency per date and peak memory, so every change
+#can be compared against a reproducible baseline without touching the real site.
+
+#Loaded at import, so the worker processes of the process pool that import this file find the scraper functions too.
+scraper = load_scraper()
+
+
+class MemorySampler:
+    """
+    Samples the resident memory of this process and all of its children (playwright driver, browsers, worker processes)
+    every interval seconds and keeps the peak. psutil is needed to see the children, without it only the peak of this
+    process and of the children that already exited is reported.
+
+    Args:
+        interval (float): seconds between samples
+    """
+
+    def __init__(self,interval=0.5):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        try:
+            import psutil
+            self.process = psutil.Process()
+        except ImportError:
+            self.process = None
+        self.thread = threading.Thread(target=self.run,daemon=True)
+
+    def __enter__(self):
+        if self.process is not None:
+            self.thread.start()
+        return self
+
+    def __exit__(self,*exc):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak,self.sample())
+            if self.stopped.wait(self.interval):
+                return
+
+    def sample(self):
+        total = 0
+        for process in [self.process] + self.process.children(recursive=True):
+            try:
+                total += process.memory_info().rss
+            except Exception:
+                continue
+        return total
+
+    def peak_mb(self):
+        if self.process is not None:
+            return round(self.peak / 2**20,1)
+        #ru_maxrss is in kilobytes on linux.
+        usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        return round(usage / 1024,1)
+
+
+def percentile(values,fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1,int(fraction * len(ordered)))],2)
+
+
+def benchmark_jobs(routes,dates,trip_length=7,first_day=30):
+    """
+    This function builds the jobs of the benchmark, dates dates for every route starting first_day days from today.
+
+    Returns:
+        list: (origin,destination,starting_date,ending_date) tuples
+    """
+    start = date.today() + timedelta(days=first_day)
+    jobs = []
+    for route in routes:
+        origin,destination = route.upper().split("-")
+        for offset in range(dates):
+            day = start + timedelta(days=offset)
+            jobs.append((origin,destination,day.strftime("%m/%d/%Y"),(day + timedelta(days=trip_length)).strftime("%m/%d/%Y")))
+    return jobs
+
+
+def count_written(jobs):
+    """
+    Returns:
+        int: number of dates of the jobs found in the csv outputs of the working directory
+    """
+    written = 0
+    for origin,destination in dict.fromkeys(job[:2] for job in jobs):
+        output = f"{origin}{destination}.csv"
+        if path.exists(output):
+            written += pd.read_csv(output,usecols=["start_date"])["start_date"].nunique()
+    return written
+
+
+def run_benchmark(jobs,concurrency=1,processes=1,capture=False,max_searches=scraper.MAX_SEARCHES_PER_BROWSER,browser_cache=False,**server_settings):
+    """
+    This function starts a replay server, points the scraper at it and scrapes the jobs in a temporary directory.
+
+    Returns:
+        dict: dates, seconds, dates_per_minute, p50/p95 seconds per date, kb_per_search and peak_rss_mb
+    """
+    server = start_server(**server_settings)
+    #Set in the environment for the worker processes, which import the scraper again.
+    os.environ["MATRIX_URL"] = server.url
+    scraper.url = async_engine.url = server.url
+    request_filter = RequestFilter(BLOCKED_RESOURCE_TYPES)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            #The outputs are written to a temporary directory, so a benchmark never touches the real results.
+            os.chdir(workdir)
+            try:
+                with MemorySampler() as sampler:
+                    started = time.monotonic()
+                    #The browser cache starts empty in the temporary directory, later contexts of the run are served from it.
+                    scraper.scrape_jobs(jobs,max_searches=max_searches,concurrency=concurrency,processes=processes,capture=capture,
+                                        excel=False,request_filter=request_filter,
+                                        browser_cache=BrowserCache(path.join(workdir,BROWSER_CACHE_PATH)) if browser_cache else None)
+                    seconds = time.monotonic() - started
+                written = count_written(jobs)
+            finally:
+                os.chdir(cwd)
+    finally:
+        server.shutdown()
+    #Worker processes measure their searches in their own filter, so latencies are only known in the single process modes.
+    latencies = [stats["seconds"] for stats in request_filter.searches]
+    transferred = [stats["bytes"] for stats in request_filter.searches]
+    return {"dates":written,"seconds":round(seconds,1),"dates_per_minute":round(written / seconds * 60,2),
+            "p50":percentile(latencies,0.5),"p95":percentile(latencies,0.95),
+            "kb_per_search":round(sum(transferred) / len(transferred) / 1024,1) if transferred else None,"peak_rss_mb":sampler.peak_mb()}
+
+
+def results_page(payload,filler_rows=3000):
+    """
+    This function builds the html of a results page from a payload the way the site renders it: the upper table, the carrier table
+    of the first carrier and filler_rows rows of other markup standing in for the rest of the app.
+
+    Returns:
+        str: html of the page
+    """
+    stops_labels = ["Nonstop","1 stop","2+ stops"]
+    lowest = {}
+    for solution in payload["solutionList"]["solutions"]:
+        carrier = solution["itinerary"]["carriers"][0]["shortName"]
+        stops = min(2,len(solution["itinerary"]["slices"][0]["stops"]))
+        if (carrier,stops) not in lowest or solution["amount"] < lowest[(carrier,stops)]["amount"]:
+            lowest[(carrier,stops)] = solution
+    carriers = list(dict.fromkeys(carrier for carrier,_ in lowest))
+    header = "".join(f'<mat-header-cell role="columnheader"><img role="img" alt="{carrier} Carrier logo">{carrier}</mat-header-cell>' for carrier in carriers)
+    rows = "".join('<mat-row role="row"><mat-cell role="cell">' + label + "</mat-cell>" +
+                   "".join(f'<mat-cell role="cell">{lowest[(carrier,stops)]["displayTotal"] if (carrier,stops) in lowest else ""}</mat-cell>'
+                           for carrier in carriers) + "</mat-row>"
+                   for stops,label in enumerate(stops_labels))
+    upper = (f'<div id="cdk-accordion-child-0"><mat-table role="table"><mat-header-row role="row"><mat-header-cell role="columnheader">Stops</mat-header-cell>'
+             f'{header}</mat-header-row>{rows}</mat-table></div>')
+    filler = "".join(f'<div class="mat-mdc-row"><span class="cell">{number}</span><a href="#{number}">itinerary details</a></div>' for number in range(filler_rows))
+    return f"<html><head><style>{'.x{color:red}' * 2000}</style></head><body><app-root>{upper}{filler}</app-root></body></html>"
+
+
+def full_parse_upper_table(page_content):
+    """
+    The upper table parse before Ver 1.3, the whole page is turned into a tree. Kept for the parsing benchmark.
+    """
+    soup = BeautifulSoup(page_content,"lxml")
+    upper_table_content = soup.find("mat-table",attrs={"role":"table"})
+    carriers = [header_cell.text for header_cell in upper_table_content.find("mat-header-row").find_all("mat-header-cell")]
+    cells = [cell.text for row in upper_table_content.find_all("mat-row") for cell in row.find_all("mat-cell")]
+    return carriers,cells
+
+
+def run_parsing_benchmark(repeat=20,filler_rows=3000):
+    """
+    This function times the full page parse of the upper table against the scoped parse on the same page.
+    The in-page extraction (UPPER_TABLE_SCRIPT) needs a browser, it is measured by the end to end benchmark as the parse_upper stage.
+
+    Returns:
+        dict: page size and milliseconds per parse of both paths
+    """
+    page = results_page(generate_payload("IST","JFK","01/10/2030","01/17/2030",carriers=12,rows=40),filler_rows)
+    result = {"page_kb":round(len(page) / 1024)}
+    for name,parser in (("full_ms",full_parse_upper_table),("scoped_ms",lambda content: fare_matrix(*parse_upper_table(content)))):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            parser(page)
+        result[name] = round((time.perf_counter() - started) / repeat * 1000,2)
+    return result
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmarks the scraper end to end against the local replay server.")
+    parser.add_argument("--routes",default="IST-JFK",help="comma separated routes, e.g. IST-JFK,IST-LHR (default: %(default)s)")
+    parser.add_argument("--dates",type=int,default=10,help="dates per route (default: %(default)s)")
+    parser.add_argument("--concurrency",type=int,default=1)
+    parser.add_argument("--processes",type=int,default=1)
+    parser.add_argument("--capture-responses",action="store_true")
+    parser.add_argument("--browser-cache",action="store_true",help="answer the static files of the site from an on-disk cache")
+    parser.add_argument("--latency",type=float,default=0.3,help="mean delay of a backend call in seconds (default: %(default)s)")
+    parser.add_argument("--failure-rate",type=float,default=0.0,help="probability of a failed backend call (default: %(default)s)")
+    parser.add_argument("--carriers",type=int,default=8,help="carriers per search (default: %(default)s)")
+    parser.add_argument("--rows",type=int,default=15,help="itineraries per carrier (default: %(default)s)")
+    parser.add_argument("--recording",help="recorded search response body replayed for every search")
+    parser.add_argument("--results",help="JSONL file the settings and results of the run are appended to")
+    parser.add_argument("--parsing",action="store_true",help="only time the upper table parse, full page against scoped, no browser needed")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.parsing:
+        result = run_parsing_benchmark()
+        print(f"Upper table of a {result['page_kb']} KB page: full parse {result['full_ms']} ms, scoped parse {result['scoped_ms']} ms")
+        raise SystemExit()
+    jobs = benchmark_jobs(args.routes.split(","),args.dates)
+    result = run_benchmark(jobs,concurrency=args.concurrency,processes=args.processes,capture=args.capture_responses,browser_cache=args.browser_cache,
+                           latency=args.latency,failure_rate=args.failure_rate,carriers=args.carriers,rows=args.rows,recording=args.recording)
+    print(f"{result['dates']}/{len(jobs)} dates in {result['seconds']}s: {result['dates_per_minute']} dates/minute, "
+          f"p50 {result['p50']}s, p95 {result['p95']}s per date, {result['kb_per_search']} KB per search, peak RSS {result['peak_rss_mb']} MB")
+    if args.results:
+        settings = {key:value for key,value in vars(args).items() if key != "results"}
+        with open(args.results,"a",encoding="utf-8") as results:
+            results.write(json.dumps({"settings":settings,"result":result,"time":time.strftime("%Y-%m-%dT%H:%M:%S")}) + "\n")
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from os import path
+from playwright.sync_api import Error as PlaywrightError
+from settings import BROWSER_CACHE_PATH
+
+#Ver 1.3 --Routing requests through context.route turns off the HTTP cache of the browser, and every new context starts with an empty
+#profile anyway, so the static files of the site are cached on disk by the scraper itself and answered from there.
+CACHED_RESOURCE_TYPES = {"script","stylesheet","font","image"}
+#Headers that describe the transfer and not the body, the body is stored decoded.
+DROPPED_HEADERS = {"content-encoding","content-length","transfer-encoding"}
+#The bundle of the site is recognized by the scripts and stylesheets its page loads, their names change with every release.
+BUNDLE_PATTERN = re.compile(rb"""<(?:script|link)\b[^>]*?\b(?:src|href)=["']([^"']+)["']""",re.IGNORECASE)
+
+
+def response_headers(headers):
+    """
+    Returns:
+        dict: headers of a response without the ones that describe the transfer
+    """
+    return {name:value for name,value in headers.items() if name.lower() not in DROPPED_HEADERS}
+
+
+def bundle_version(document):
+    """
+    This function returns a short fingerprint of the site's bundle from the html of its page.
+    The page itself can change on every load (tokens, nonces), so only the scripts and stylesheets it references are used,
+    a page without any is fingerprinted as a whole.
+
+    Args:
+        document (bytes): html of the page
+
+    Returns:
+        str: fingerprint of the bundle
+    """
+    references = sorted(set(BUNDLE_PATTERN.findall(document)))
+    return hashlib.sha1(b"\n".join(references) if references else document).hexdigest()[:16]
+
+
+class BrowserCache:
+    """
+    Ver 1.3 -- On-disk HTTP cache and saved storage state shared by every browser context, worker process and run.
+    Scripts, stylesheets, fonts and images of the site are stored the first time they are loaded and answered from the disk afterwards,
+    and the cookies and local storage of the site (consent, session) are saved once a context has loaded it and given to new contexts.
+    Everything is thrown away when the bundle of the site changes, the version is checked on every load of the page.
+
+    Args:
+        directory (str): directory of the cache, it is created if missing
+    """
+
+    def __init__(self,directory=BROWSER_CACHE_PATH):
+        self.directory = directory
+        self.state_path = path.join(directory,"storage_state.json")
+        self.version_path = path.join(directory,"bundle_version")
+        os.makedirs(directory,exist_ok=True)
+        self.version = self.read_version()
+        self.hits = 0
+        self.stored = 0
+        self.bytes = 0
+
+    def read_version(self):
+        try:
+            with open(self.version_path) as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
+    def context_options(self):
+        """
+        Returns:
+            dict: keyword arguments of browser.new_context, the saved storage state if there is one
+        """
+        return {"storage_state":self.state_path} if path.exists(self.state_path) else {}
+
+    def save_state(self,context):
+        """
+        This function saves the cookies and local storage of a sync context for the next contexts.
+        """
+        temporary = self.temporary_path(self.state_path,context)
+        context.storage_state(path=temporary)
+        os.replace(temporary,self.state_path)
+
+    async def save_state_async(self,context):
+        temporary = self.temporary_path(self.state_path,context)
+        await context.storage_state(path=temporary)
+        os.replace(temporary,self.state_path)
+
+    def temporary_path(self,file_path,owner=None):
+        #Files are written next to their place and moved over it, so other processes never read a half written file.
+        return f"{file_path}.{os.getpid()}.{id(owner)}.tmp"
+
+    def entry_path(self,request_url):
+        return path.join(self.directory,self.version,hashlib.sha1(request_url.encode()).hexdigest())
+
+    def check_bundle(self,document):
+        """
+        This function compares the bundle of a freshly loaded page with the cached one and clears the cache when it changed.
+        """
+        version = bundle_version(document)
+        if version == self.version:
+            return
+        #Another process may have switched to the new bundle already.
+        if self.read_version() != version:
+            if self.version is not None:
+                print(f"The site bundle changed ({self.version} -> {version})... Clearing the browser cache...")
+            for name in os.listdir(self.directory):
+                if path.isdir(path.join(self.directory,name)) and name != version:
+                    shutil.rmtree(path.join(self.directory,name),ignore_errors=True)
+            if path.exists(self.state_path):
+                os.remove(self.state_path)
+            temporary = self.temporary_path(self.version_path)
+            with open(temporary,"w") as file:
+                file.write(version)
+            os.replace(temporary,self.version_path)
+        self.version = version
+
+    def load(self,request_url):
+        """
+        Returns:
+            status,headers,body: the stored response, None if the url is not cached
+        """
+        if self.version is None:
+            return None
+        entry = self.entry_path(request_url)
+        try:
+            with open(entry + ".json") as file:
+                meta = json.load(file)
+            with open(entry + ".body","rb") as file:
+                body = file.read()
+        except (OSError,ValueError):
+            return None
+        self.hits += 1
+        self.bytes += len(body)
+        return meta["status"],meta["headers"],body
+
+    def store(self,request_url,status,headers,body):
+        """
+        This function stores a response of a static file. Responses that are not OK or are marked no-store are not kept.
+        """
+        if self.version is None or status != 200 or "no-store" in headers.get("cache-control",""):
+            return
+        entry = self.entry_path(request_url)
+        try:
+            os.makedirs(path.dirname(entry),exist_ok=True)
+            #The body is written first, an entry only counts once its headers are there.
+            for suffix,mode,content in ((".body","wb",body),(".json","w",json.dumps({"url":request_url,"status":status,"headers":response_headers(headers)}))):
+                temporary = self.temporary_path(entry + suffix)
+                with open(temporary,mode) as file:
+                    file.write(content)
+                os.replace(temporary,entry + suffix)
+        except OSError:
+            return
+        self.stored += 1
+
+    def cacheable(self,request):
+        return request.method == "GET" and request.resource_type in CACHED_RESOURCE_TYPES
+
+    def is_page_load(self,request):
+        return request.is_navigation_request() and request.frame.parent_frame is None
+
+    def attach(self,context):
+        """
+        This function installs the cache on a sync browser context. It has to be attached before the request filter,
+        handlers attached later run first and the filter passes the requests it lets through on to the cache.
+        """
+        context.route("**/*",self.handle)
+
+    def attach_async(self,context):
+        """
+        Async version of attach, returns the coroutine of context.route.
+        """
+        return context.route("**/*",self.handle_async)
+
+    def handle(self,route):
+        request = route.request
+        page_load = self.is_page_load(request)
+        if not page_load and not self.cacheable(request):
+            route.fallback()
+            return
+        cached = None if page_load else self.load(request.url)
+        if cached is not None:
+            status,headers,body = cached
+            route.fulfill(status=status,headers=headers,body=body)
+            return
+        try:
+            response = route.fetch()
+            body = response.body()
+        except PlaywrightError:
+            route.abort()
+            return
+        if page_load:
+            self.check_bundle(body)
+        else:
+            self.store(request.url,response.status,response.headers,body)
+        route.fulfill(status=response.status,headers=response_headers(response.headers),body=body)
+
+    async def handle_async(self,route):
+        request = route.request
+        page_load = self.is_page_load(request)
+        if not page_load and not self.cacheable(request):
+            await route.fallback()
+            return
+        cached = None if page_load else self.load(request.url)
+        if cached is not None:
+            status,headers,body = cached
+            await route.fulfill(status=status,headers=headers,body=body)
+            return
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except PlaywrightError:
+            await route.abort()
+            return
+        if page_load:
+            self.check_bundle(body)
+        else:
+            self.store(request.url,response.status,response.headers,body)
+        await route.fulfill(status=response.status,headers=response_headers(response.headers),body=body)
+
+    def summary(self):
+        """
+        This function prints how many requests of the run were answered from the disk.
+        """
+        print(f"Browser cache: {self.hits} requests ({self.bytes/1024:.0f} KB) answered from {self.directory}, {self.stored} files stored...")
@@ -0,0 +1,141 @@
+from playwright.sync_api import Error as PlaywrightError
+from metrics import METRICS
+
+
+class BrowserManager:
+    """
+    Ver 1.3 -- This class keeps a single Firefox instance alive for the whole date range instead of launching a new browser for every date.
+    The same page is handed out again for the next search, the browser context is renewed when a search fails
+    and the browser itself is only relaunched when the health check fails or after max_searches searches.
+
+    Args:
+        playwright (playwright.sync_api.Playwright): object returned from sync_playwright()
+        headless (bool): runs firefox headless if True
+        max_searches (int): relaunch the browser after this many searches, 0 keeps the same browser for the whole run
+        launch_timeout (int): timeout for launching the browser in milliseconds
+        request_filter (RequestFilter): installed on every new context to block unneeded requests and measure the transfer, None disables it
+        browser_cache (BrowserCache): on-disk cache of the site's files and its storage state shared by every context, None disables it
+    """
+
+    def __init__(self,playwright,headless=True,max_searches=50,launch_timeout=10000,request_filter=None,browser_cache=None):
+        self.playwright = playwright
+        self.headless = headless
+        self.max_searches = max_searches
+        self.launch_timeout = launch_timeout
+        self.request_filter = request_filter
+        self.browser_cache = browser_cache
+        self.state_saved = False
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.searches = 0
+        self.launches = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def launch(self):
+        """
+        This function closes the current browser if there is one and launches a fresh one with a new context and page.
+        """
+        self.close()
+        print("Starting Browser...")
+        with METRICS.stage("launch"):
+            self.browser = self.playwright.firefox.launch(headless=self.headless,timeout=self.launch_timeout)
+        self.launches += 1
+        self.searches = 0
+        self.new_context()
+
+    def new_context(self):
+        """
+        This function throws away the current context (cookies, cache, open page) and opens a new one on the running browser.
+        It is a lot cheaper than launching the whole browser again.
+        """
+        if self.context is not None:
+            try:
+                self.context.close()
+            except PlaywrightError:
+                pass
+        with METRICS.stage("new_context"):
+            #Ver 1.3 --With a browser cache the context starts with the saved cookies and local storage of the site,
+            #the cache is attached before the request filter so the filter sees the requests first.
+            if self.browser_cache is not None:
+                self.context = self.browser.new_context(**self.browser_cache.context_options())
+                self.browser_cache.attach(self.context)
+            else:
+                self.context = self.browser.new_context()
+            if self.request_filter is not None:
+                self.request_filter.attach(self.context)
+            self.page = self.context.new_page()
+        self.state_saved = False
+
+    def save_state(self):
+        """
+        This function saves the storage state of the context to the browser cache once the site is loaded, once per context.
+        """
+        if self.browser_cache is None or self.state_saved:
+            return
+        try:
+            self.browser_cache.save_state(self.context)
+        except (PlaywrightError,OSError) as error:
+            print(f"Couldn't save the browser storage state ({error})...")
+        self.state_saved = True
+
+    def is_healthy(self):
+        """
+        This function checks if the browser is still connected and the page still responds to a trivial script.
+
+        Returns:
+            bool: True if the page can be reused
+        """
+        if self.browser is None or not self.browser.is_connected():
+            return False
+        if self.page is None or self.page.is_closed():
+            return False
+        try:
+            self.page.evaluate("1")
+        except PlaywrightError:
+            return False
+        return True
+
+    def get_page(self):
+        """
+        This function returns a page ready for the next search. It launches the browser on first use,
+        relaunches it if it is unhealthy or if it has reached max_searches, otherwise the page of the previous search is returned.
+
+        Returns:
+            playwright.page: page object, a fresh page is still on about:blank
+        """
+        if self.browser is None or not self.is_healthy():
+            self.launch()
+        elif self.max_searches and self.searches >= self.max_searches:
+            print(f"Browser reached {self.searches} searches... Relaunching...")
+            self.launch()
+        self.searches += 1
+        return self.page
+
+    def recycle(self):
+        """
+        This function is called after a failed search. If the browser is still alive only the context is renewed,
+        otherwise the browser is relaunched.
+        """
+        if self.browser is not None and self.browser.is_connected():
+            self.new_context()
+        else:
+            self.launch()
+
+    def close(self):
+        """
+        This function closes the browser if it is running.
+        """
+        if self.browser is not None:
+            try:
+                self.browser.close()
+            except PlaywrightError:
+                pass
+        self.browser = None
+        self.context = None
+        self.page = None
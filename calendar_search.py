@@ -0,0 +1,91 @@
+from datetime import datetime,timedelta
+import pandas as pd
+from fare_schema import parse_prices
+
+#Ver 1.3 --Calendar (flexible date) searches return the lowest fare of every departure in a window for a fixed length of stay,
+#so a whole month of dates costs one search instead of one search and a carrier click loop per date.
+#Number of departures covered by one calendar search, longer date ranges are split into several windows.
+CALENDAR_DAYS = 30
+#Label of the calendar mode switch and placeholder of the length of stay field on the search form.
+CALENDAR_MODE_LABEL = "See calendar of lowest fares"
+STAY_PLACEHOLDER = "Length of stay"
+#The lowest fares are written next to the results, e.g. ISTJFK_calendar.csv.
+CALENDAR_SUFFIX = "_calendar"
+CALENDAR_COLUMNS = ["start_date","end_date","lowest_price","solutions"]
+
+
+def calendar_windows(date_pairs):
+    """
+    This function splits the dates of a query into calendar search windows. Every pair has the same trip length,
+    it becomes the length of stay of the calendar.
+
+    Args:
+        date_pairs (list): (starting_date,ending_date) tuples in MM/DD/YYYY format, see build_date_pairs
+
+    Returns:
+        list: (first departure,last departure,length of stay in days) of every window
+    """
+    if not date_pairs:
+        return []
+    first_start,first_end = (datetime.strptime(date,"%m/%d/%Y") for date in date_pairs[0])
+    stay = (first_end - first_start).days
+    departures = [starting_date for starting_date,_ in date_pairs]
+    return [(window[0],window[-1],stay) for window in (departures[index:index+CALENDAR_DAYS] for index in range(0,len(departures),CALENDAR_DAYS))]
+
+
+def calendar_days(payload):
+    """
+    Yields the days of the calendar in the search response, the grid is split into months and weeks.
+    """
+    calendar = payload.get("calendar",{})
+    for month in calendar.get("months",[]):
+        for week in month.get("weeks",[]):
+            yield from week.get("days",[])
+    yield from calendar.get("days",[])
+
+
+def parse_calendar_payload(payload,stay):
+    """
+    This function reads the lowest fare of every departure from the captured calendar search response.
+    Days without a fare (sold out or outside the window) are left out.
+
+    Args:
+        payload (dict): decoded search response
+        stay (int): length of stay of the search in days
+
+    Returns:
+        pandas.DataFrame: CALENDAR_COLUMNS, dates in MM/DD/YYYY format like the regular searches
+    """
+    rows = []
+    for day in calendar_days(payload):
+        if not day.get("minPrice"):
+            continue
+        departure = datetime.strptime(day["date"][:10],"%Y-%m-%d")
+        rows.append([departure.strftime("%m/%d/%Y"),(departure + timedelta(days=stay)).strftime("%m/%d/%Y"),day["minPrice"],day.get("solutionCount")])
+    return pd.DataFrame(rows,columns=CALENDAR_COLUMNS)
+
+
+def flag_dates(calendar,dates=(),cheapest=0,date_pairs=()):
+    """
+    This function picks the dates of the calendar that are searched in full: the dates flagged by the user and the cheapest ones.
+    A flagged date of the query without a fare in the calendar (its window was skipped or the site showed no fare) is searched anyway.
+
+    Args:
+        calendar (pandas.DataFrame): lowest fares of a route
+        dates (list): flagged departures in MM/DD/YYYY format
+        cheapest (int): number of the cheapest departures to add
+        date_pairs (list): (starting_date,ending_date) tuples of the query, the end dates of the flagged dates missing from the calendar
+
+    Returns:
+        list: (starting_date,ending_date) tuples in date order
+    """
+    flagged = calendar[calendar["start_date"].isin(set(dates))]
+    if cheapest:
+        prices = parse_prices(calendar["lowest_price"])[0]
+        flagged = pd.concat([flagged,calendar.loc[prices.sort_values(kind="stable").index[:cheapest]]])
+    pairs = dict(flagged[["start_date","end_date"]].itertuples(index=False,name=None))
+    missing = [(starting_date,ending_date) for starting_date,ending_date in date_pairs if starting_date in set(dates) and starting_date not in pairs]
+    if missing:
+        print(f"No calendar fare for {', '.join(starting_date for starting_date,_ in missing)}... Searching them in full anyway...")
+        pairs.update(missing)
+    return sorted(pairs.items(),key=lambda pair:datetime.strptime(pair[0],"%m/%d/%Y"))
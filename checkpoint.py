@@ -0,0 +1,123 @@
+import json
+from os import path,remove,replace
+
+#Ver 1.3 --Default journal file, the dates of a run are removed from it when the run finishes, the file once it is empty.
+CHECKPOINT_PATH = "scraper_checkpoint.jsonl"
+
+
+class CheckpointJournal:
+    """
+    Ver 1.3 -- Append-only journal of the finished work of a run. Every finished carrier is written with its rows and every finished date
+    after it is written to the output, one JSON object per line. When an interrupted run is started again the finished dates are skipped
+    and the finished carriers of a half done date are taken from the journal instead of clicking them again.
+    A line cut off by a crash is ignored when the journal is loaded.
+
+    Args:
+        journal_path (str): path of the journal file
+    """
+
+    def __init__(self,journal_path=CHECKPOINT_PATH):
+        self.path = journal_path
+        self.done = set()
+        self.carriers = {}
+        self.load()
+        self.file = open(self.path,"a",encoding="utf-8")
+        if self.file.tell() > 0:
+            #Starts on a new line in case the last line was cut off by a crash.
+            self.append_newline()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def load(self):
+        if not path.exists(self.path):
+            return
+        with open(self.path,encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                job = tuple(entry["job"])
+                if entry["event"] == "date":
+                    self.done.add(job)
+                    self.carriers.pop(job,None)
+                elif entry["event"] == "carrier":
+                    self.carriers.setdefault(job,{})[entry["carrier"]] = (entry["columns"],entry["rows"])
+        if self.done or self.carriers:
+            print(f"Resuming from {self.path}: {len(self.done)} dates and carriers of {len(self.carriers)} unfinished dates are already done...")
+
+    def append_newline(self):
+        with open(self.path,"rb") as journal:
+            journal.seek(-1,2)
+            if journal.read(1) != b"\n":
+                self.file.write("\n")
+
+    def append(self,entry):
+        self.file.write(json.dumps(entry,default=str) + "\n")
+        #Flushed after every line so a crash loses at most the line being written.
+        self.file.flush()
+
+    def is_done(self,job):
+        """
+        Returns:
+            bool: True if the date of the job was written to the output in an earlier run
+        """
+        return tuple(job) in self.done
+
+    def finished_carriers(self,job):
+        """
+        Returns:
+            dict: carrier -> (columns,rows) for the carriers of the job finished in an earlier run
+        """
+        return self.carriers.get(tuple(job),{})
+
+    def carrier_done(self,job,carrier,columns,rows):
+        """
+        This function records a finished carrier together with its rows.
+        """
+        self.carriers.setdefault(tuple(job),{})[carrier] = (columns,rows)
+        self.append({"event":"carrier","job":list(job),"carrier":carrier,"columns":columns,"rows":rows})
+
+    def date_done(self,job):
+        """
+        This function records a date after all of its rows are written to the output.
+        """
+        self.done.add(tuple(job))
+        self.carriers.pop(tuple(job),None)
+        self.append({"event":"date","job":list(job)})
+
+    def finish(self,jobs):
+        """
+        This function removes the dates of a finished run from the journal, so the next run of them starts from scratch.
+        The file is shared by every run with the same --checkpoint path, the dates and carriers of other interrupted runs are kept
+        and the file is only removed once nothing is left in it.
+
+        Args:
+            jobs (list): (origin,destination,starting_date,ending_date) tuples of the finished run
+        """
+        self.close()
+        finished = set(map(tuple,jobs))
+        self.done -= finished
+        for job in finished:
+            self.carriers.pop(job,None)
+        if not self.done and not self.carriers:
+            if path.exists(self.path):
+                remove(self.path)
+            return
+        #The rest is written next to the journal and moved over it, so a crash never leaves half of it.
+        temporary = f"{self.path}.tmp"
+        with open(temporary,"w",encoding="utf-8") as journal:
+            for job,carriers in self.carriers.items():
+                for carrier,(columns,rows) in carriers.items():
+                    journal.write(json.dumps({"event":"carrier","job":list(job),"carrier":carrier,"columns":columns,"rows":rows},default=str) + "\n")
+            for job in self.done:
+                journal.write(json.dumps({"event":"date","job":list(job)}) + "\n")
+        replace(temporary,self.path)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
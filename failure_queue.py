@@ -0,0 +1,195 @@
+import csv
+import json
+import os
+from datetime import datetime
+from os import path
+import pandas as pd
+from settings import FAILURES_PATH,FAILURE_REPORT_PATH,MAX_ATTEMPTS
+
+#Ver 1.3 --Key of the failures of a date in the attrs of its final part, like the fare matrix it travels with the rows through every engine
+#to the writer: {"date": error of a date that couldn't be searched, "carriers": {carrier: error} of the carriers that were skipped}.
+FAILURES_ATTR = "failures"
+REPORT_COLUMNS = ["status","origin","destination","start_date","end_date","carrier","attempts","error","first_failed","last_failed"]
+
+
+def error_text(error):
+    """
+    Returns:
+        str: type and first line of the message of an error, as it is kept in the failure queue
+    """
+    lines = str(error).strip().splitlines()
+    return f"{type(error).__name__}: {lines[0]}" if lines else type(error).__name__
+
+
+def date_failure(error):
+    """
+    This function builds the final part of a date that couldn't be searched, it has no rows and nothing is written for it.
+
+    Args:
+        error (Exception or str): reason of the failure
+
+    Returns:
+        pandas.DataFrame: empty dataframe with the failure in its attrs
+    """
+    dataframes = pd.DataFrame()
+    dataframes.attrs[FAILURES_ATTR] = {"date":str(error)}
+    return dataframes
+
+
+def failures_of(dataframes):
+    """
+    Returns:
+        dict: failures in the attrs of a part, empty if it has none
+    """
+    return dataframes.attrs.get(FAILURES_ATTR) or {}
+
+
+class FailureQueue:
+    """
+    Ver 1.3 -- Dead-letter queue of the dates and carriers that failed, kept in a JSON file between runs.
+    A failed unit (a whole date, or one carrier of a date) is recorded with its error and the run moves on, the units are retried
+    at the end of the run and with --retry-failures in a later run. After max_attempts failed attempts a unit is given up and only
+    listed in the failure report. A unit is removed from the queue once it is written.
+
+    Args:
+        queue_path (str): path of the JSON file
+        max_attempts (int): failed attempts after which a unit is given up
+    """
+
+    def __init__(self,queue_path=FAILURES_PATH,max_attempts=MAX_ATTEMPTS):
+        self.path = queue_path
+        self.max_attempts = max_attempts
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not path.exists(self.path):
+            return
+        try:
+            with open(self.path,encoding="utf-8") as file:
+                entries = json.load(file)
+        except ValueError:
+            print(f"{self.path} can't be read... Starting with an empty failure queue...")
+            return
+        for entry in entries:
+            self.entries[self.key(entry)] = entry
+        due = len([entry for entry in self.entries.values() if entry["attempts"] < self.max_attempts])
+        if self.entries:
+            print(f"Failure queue {self.path}: {due} failed searches are waiting for a retry, {len(self.entries) - due} were given up...")
+
+    def save(self):
+        #Written next to the file and moved over it, so a crash never leaves half of the queue.
+        temporary = f"{self.path}.tmp"
+        with open(temporary,"w",encoding="utf-8") as file:
+            json.dump(list(self.entries.values()),file,indent=1)
+        os.replace(temporary,self.path)
+
+    @staticmethod
+    def key(entry):
+        return (entry["origin"],entry["destination"],entry["start_date"],entry["end_date"],entry["carrier"])
+
+    def failed(self,job,error,carrier=None,scraped_at=None):
+        """
+        This function records a failed attempt of a date, or of one of its carriers.
+
+        Args:
+            job (tuple): (origin,destination,starting_date,ending_date)
+            error (str): reason of the failure
+            carrier (str): carrier that failed, None if the whole date failed
+            scraped_at (str): stamp of the rows written for the other carriers of the date, a retried carrier is written with it
+        """
+        now = datetime.now().isoformat(timespec="seconds")
+        key = tuple(job) + (carrier,)
+        entry = self.entries.setdefault(key,{"origin":job[0],"destination":job[1],"start_date":job[2],"end_date":job[3],"carrier":carrier,
+                                             "attempts":0,"error":None,"first_failed":now,"last_failed":now,"scraped_at":scraped_at})
+        entry["attempts"] += 1
+        entry["error"] = str(error)
+        entry["last_failed"] = now
+        if scraped_at is not None:
+            entry["scraped_at"] = scraped_at
+        if entry["attempts"] >= self.max_attempts:
+            print(f"Giving up {job[0]}-{job[1]} {job[2]}{' ' + carrier if carrier else ''} after {entry['attempts']} attempts ({error})...")
+        self.save()
+
+    def settle(self,job,failures=None,carriers=None,scraped_at=None):
+        """
+        This function is called when a date is written. The units of the date that were searched and didn't fail again are removed,
+        the failures of the attempt are recorded.
+
+        Args:
+            job (tuple): (origin,destination,starting_date,ending_date)
+            failures (dict): failures of the attempt, see FAILURES_ATTR
+            carriers (set): carriers that were retried, None if the whole date was searched
+            scraped_at (str): stamp of the rows of the date
+        """
+        failed = (failures or {}).get("carriers",{})
+        for key in [key for key in self.entries if key[:4] == tuple(job)]:
+            carrier = key[4]
+            if carrier in failed:
+                continue
+            if carriers is None or carrier in carriers:
+                del self.entries[key]
+        for carrier,error in failed.items():
+            self.failed(job,error,carrier,scraped_at)
+        self.save()
+
+    def due(self,jobs=None):
+        """
+        This function returns the units to retry, the ones that have attempts left.
+
+        Args:
+            jobs (list): only the units of these jobs, every job if None
+
+        Returns:
+            list: (job,carriers) tuples in the order they failed, carriers is None when the whole date is retried
+        """
+        wanted = set(map(tuple,jobs)) if jobs is not None else None
+        units = {}
+        for key,entry in self.entries.items():
+            job = key[:4]
+            if entry["attempts"] >= self.max_attempts or (wanted is not None and job not in wanted):
+                continue
+            if key[4] is None or units.get(job,set()) is None:
+                units[job] = None
+            else:
+                units.setdefault(job,set()).add(key[4])
+        return list(units.items())
+
+    def queued(self,job):
+        """
+        Returns:
+            bool: True if a failed unit of the date is in the queue, waiting for a retry or given up
+        """
+        return any(key[:4] == tuple(job) for key in self.entries)
+
+    def stamp(self,job):
+        """
+        Returns:
+            str: stamp of the rows already written for the date of a failed carrier, None if there is none
+        """
+        stamps = [entry["scraped_at"] for key,entry in self.entries.items() if key[:4] == tuple(job) and entry["scraped_at"]]
+        return stamps[0] if stamps else None
+
+    def report(self,report_path=FAILURE_REPORT_PATH):
+        """
+        This function writes every failed unit to a csv report and prints a summary.
+
+        Args:
+            report_path (str): path of the report
+
+        Returns:
+            str: path of the report, None if nothing failed
+        """
+        if not self.entries:
+            if path.exists(report_path):
+                os.remove(report_path)
+            return None
+        with open(report_path,"w",newline="",encoding="utf-8") as file:
+            writer = csv.DictWriter(file,fieldnames=REPORT_COLUMNS,extrasaction="ignore")
+            writer.writeheader()
+            for entry in sorted(self.entries.values(),key=lambda entry:(entry["origin"],entry["destination"],entry["start_date"],entry["carrier"] or "")):
+                writer.writerow(dict(entry,status="given up" if entry["attempts"] >= self.max_attempts else "retry"))
+        due = len([entry for entry in self.entries.values() if entry["attempts"] < self.max_attempts])
+        print(f"{len(self.entries)} searches failed: {due} will be retried with --retry-failures, {len(self.entries) - due} were given up "
+              f"after {self.max_attempts} attempts... See {report_path}...")
+        return report_path
@@ -0,0 +1,146 @@
+import sqlite3
+import time
+from io import StringIO
+import pandas as pd
+from settings import CACHE_PATH,CACHE_TTL_HOURS,CACHE_MAX_ENTRIES
+
+
+class FareCache:
+    """
+    Ver 1.3 -- Persistent cache of search results kept in a local SQLite file, keyed by (origin, destination, departure, return).
+    A result is served from the cache for ttl seconds after it was scraped, after that the date is searched again.
+    When there are more than max_entries results the least recently used ones are deleted.
+    A result can be stored in several parts, one per carrier the same way it is written to the output. The parts are staged and
+    the result is only served once its final part is stored, so a date interrupted halfway is searched again and not read half empty.
+
+    Args:
+        db_path (str): path of the SQLite file
+        ttl (float): time to live of a result in seconds
+        max_entries (int): maximum number of cached results
+    """
+
+    def __init__(self,db_path=CACHE_PATH,ttl=CACHE_TTL_HOURS*3600,max_entries=CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                departure TEXT NOT NULL,
+                return_date TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                complete INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (origin,destination,departure,return_date)
+            );
+            CREATE TABLE IF NOT EXISTS parts (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                departure TEXT NOT NULL,
+                return_date TEXT NOT NULL,
+                part INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS parts_key ON parts (origin,destination,departure,return_date);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+        """)
+        #Caches created before the complete column can't tell staged results from finished ones, their results are searched again.
+        columns = [column[1] for column in self.connection.execute("PRAGMA table_info(entries)")]
+        if "complete" not in columns:
+            self.connection.execute("ALTER TABLE entries ADD COLUMN complete INTEGER NOT NULL DEFAULT 0")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def get(self,origin,destination,departure,return_date):
+        """
+        This function returns the cached rows of a search if they are younger than the ttl.
+
+        Args:
+            origin (str): origin IATA code
+            destination (str): destination IATA code
+            departure (str): start date in MM/DD/YYYY format
+            return_date (str): end date in MM/DD/YYYY format
+
+        Returns:
+            pandas.DataFrame: cached rows, None if the search is not cached, expired or its final part is missing
+        """
+        key = (origin,destination,departure,return_date)
+        row = self.connection.execute(
+            "SELECT created_at FROM entries WHERE origin=? AND destination=? AND departure=? AND return_date=? AND complete=1",key).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            self.misses += 1
+            return None
+        parts = self.connection.execute(
+            "SELECT data FROM parts WHERE origin=? AND destination=? AND departure=? AND return_date=? ORDER BY part",key).fetchall()
+        self.connection.execute(
+            "UPDATE entries SET last_used=? WHERE origin=? AND destination=? AND departure=? AND return_date=?",(time.time(),)+key)
+        self.connection.commit()
+        self.hits += 1
+        frames = [pd.read_json(StringIO(data),orient="split",dtype=False) for (data,) in parts]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames,ignore_index=True)
+
+    def put(self,origin,destination,departure,return_date,dataframes,append=False,final=True):
+        """
+        This function stores the rows of a search. With append=False an older result of the same search is replaced,
+        with append=True the rows are added as the next part of the result. The result is served by get once its final part is stored.
+
+        Args:
+            origin (str): origin IATA code
+            destination (str): destination IATA code
+            departure (str): start date in MM/DD/YYYY format
+            return_date (str): end date in MM/DD/YYYY format
+            dataframes (pandas.DataFrame): rows of the search
+            append (bool): add to the result stored earlier in this run
+            final (bool): the last part of the result
+        """
+        key = (origin,destination,departure,return_date)
+        now = time.time()
+        if not append:
+            self.delete(*key)
+        self.connection.execute(
+            "INSERT OR IGNORE INTO entries (origin,destination,departure,return_date,created_at,last_used) VALUES (?,?,?,?,?,?)",key+(now,now))
+        part = self.connection.execute(
+            "SELECT COUNT(*) FROM parts WHERE origin=? AND destination=? AND departure=? AND return_date=?",key).fetchone()[0]
+        self.connection.execute("INSERT INTO parts VALUES (?,?,?,?,?,?)",key+(part,dataframes.to_json(orient="split",index=False)))
+        if final:
+            self.connection.execute(
+                "UPDATE entries SET complete=1 WHERE origin=? AND destination=? AND departure=? AND return_date=?",key)
+        self.connection.commit()
+        if not append:
+            self.evict()
+
+    def delete(self,origin,destination,departure,return_date):
+        key = (origin,destination,departure,return_date)
+        self.connection.execute("DELETE FROM entries WHERE origin=? AND destination=? AND departure=? AND return_date=?",key)
+        self.connection.execute("DELETE FROM parts WHERE origin=? AND destination=? AND departure=? AND return_date=?",key)
+
+    def evict(self):
+        """
+        This function deletes expired results and the least recently used ones above max_entries.
+        """
+        self.connection.execute("DELETE FROM entries WHERE created_at < ?",(time.time() - self.ttl,))
+        count = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY last_used LIMIT ?)",(count - self.max_entries,))
+        self.connection.execute("""
+            DELETE FROM parts WHERE NOT EXISTS (
+                SELECT 1 FROM entries WHERE entries.origin=parts.origin AND entries.destination=parts.destination
+                AND entries.departure=parts.departure AND entries.return_date=parts.return_date)
+        """)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,180 @@
+import pandas as pd
+
+#Ver 1.3 --Typed schema of a fare row. Round trips have their outbound and return slices in separate columns instead of
+#being joined with " | " in one text column.
+FARE_COLUMNS = ["price_minor","currency","carrier","origin","destination",
+                "departure","arrival","duration_minutes","stops","flights",
+                "return_departure","return_arrival","return_duration_minutes","return_stops","return_flights",
+                "start_date","end_date"]
+#Prices are shown with a currency code or a symbol in front of the amount.
+CURRENCY_SYMBOLS = {"$":"USD","€":"EUR","£":"GBP","¥":"JPY","₺":"TRY"}
+#Time of day formats of the carrier tables, tried in this order when a value is not a full date and time.
+TIME_FORMATS = ["%I:%M%p","%H:%M"]
+
+
+def parse_prices(prices):
+    """
+    This function splits prices like USD1,234.56 or $1,234 into integer minor units (cents) and a currency code.
+
+    Args:
+        prices (pandas.Series): price texts
+
+    Returns:
+        minor,currency: Int64 series of minor units and categorical series of currency codes
+    """
+    parts = prices.astype("string").str.extract(r"^\s*([A-Z]{3}|[^\d\s.,]+)?\s*([\d,]+(?:\.\d+)?)")
+    currency = parts[0].str.strip().replace(CURRENCY_SYMBOLS).astype("category")
+    amount = pd.to_numeric(parts[1].str.replace(",","",regex=False),errors="coerce")
+    return (amount * 100).round().astype("Int64"),currency
+
+
+def parse_durations(durations):
+    """
+    This function converts durations like 11h 5m, 45m or 2h to minutes.
+
+    Returns:
+        pandas.Series: Int32 minutes, missing if the text has no hours or minutes
+    """
+    parts = durations.astype("string").str.extract(r"(?:(\d+)\s*h)?\s*(?:(\d+)\s*m)?")
+    hours = pd.to_numeric(parts[0],errors="coerce")
+    minutes = pd.to_numeric(parts[1],errors="coerce")
+    total = hours.fillna(0) * 60 + minutes.fillna(0)
+    return total.where(hours.notna() | minutes.notna()).astype("Int32")
+
+
+def parse_times(times,base_dates):
+    """
+    This function converts departure and arrival times to datetimes. Full dates like 2030-01-10T18:37 are used as they are
+    (a utc offset is dropped, times stay local to the airport). A time of day like 6:05 PM +1 is put on the base date,
+    +N moves it N days later.
+
+    Args:
+        times (pandas.Series): time texts
+        base_dates (pandas.Series): dates of the slice, used for the times without a date
+
+    Returns:
+        pandas.Series: datetimes, NaT if the text can't be read
+    """
+    times = times.astype("string").str.strip()
+    parsed = pd.to_datetime(times.str.replace(r"(?:[+-]\d{2}:\d{2}|Z)$","",regex=True),format="ISO8601",errors="coerce")
+    missing = parsed.isna() & times.notna()
+    if missing.any():
+        parts = times[missing].str.extract(r"(\d{1,2}:\d{2})\s*([AaPp][Mm])?\s*(?:\+(\d+))?")
+        clock = (parts[0] + parts[1].fillna("").str.upper()).str.strip()
+        of_day = pd.Series(pd.NaT,index=clock.index,dtype="datetime64[ns]")
+        for time_format in TIME_FORMATS:
+            still_missing = of_day.isna()
+            of_day[still_missing] = pd.to_datetime(clock[still_missing],format=time_format,errors="coerce")
+        days = pd.to_numeric(parts[2],errors="coerce").fillna(0)
+        parsed[missing] = base_dates[missing] + (of_day - of_day.dt.normalize()) + pd.to_timedelta(days,unit="D")
+    return parsed
+
+
+def parse_stops(stops):
+    """
+    This function reads stop counts like 1, 2 stops or Nonstop.
+
+    Returns:
+        pandas.Series: Int8 stop counts
+    """
+    stops = stops.astype("string")
+    counts = pd.to_numeric(stops.str.extract(r"(\d+)")[0],errors="coerce")
+    counts = counts.where(~stops.str.contains("nonstop",case=False,na=False),0)
+    return counts.astype("Int8")
+
+
+def split_slices(values):
+    """
+    This function splits the " | " joined values of a round trip into the outbound and the return slice.
+
+    Returns:
+        outbound,return: string series, the return slice is missing for one way rows
+    """
+    parts = values.astype("string").str.split(" | ",n=1,expand=True,regex=False)
+    if 1 not in parts.columns:
+        parts[1] = pd.NA
+    return parts[0].str.strip(),parts[1].str.strip()
+
+
+def normalize_fares(df):
+    """
+    Ver 1.3 -- This function converts the raw text columns of the carrier tables (or the captured payload) to the typed schema:
+    prices to integer minor units and a currency, durations to minutes, times to datetimes, carriers, airports and currencies
+    to categoricals and the searched dates to dates. Columns that are not part of the schema are kept as strings.
+
+    Args:
+        df (pandas.DataFrame): rows with the RESULT_COLUMNS, start_date and end_date
+
+    Returns:
+        pandas.DataFrame: rows in the FARE_COLUMNS schema
+    """
+    if df.empty:
+        return pd.DataFrame(columns=FARE_COLUMNS)
+    column = lambda name: df[name] if name in df.columns else pd.Series(pd.NA,index=df.index,dtype="string")
+    typed = pd.DataFrame(index=df.index)
+    typed["price_minor"],typed["currency"] = parse_prices(column("Price"))
+    typed["carrier"] = column("Airline filter_alt").astype("string").str.strip().astype("category")
+    routes = split_slices(column("Route"))[0].str.extract(r"^([A-Z]{3}).*?([A-Z]{3})$")
+    typed["origin"] = routes[0].astype("category")
+    typed["destination"] = routes[1].astype("category")
+    start_date = pd.to_datetime(column("start_date"),format="%m/%d/%Y",errors="coerce")
+    end_date = pd.to_datetime(column("end_date"),format="%m/%d/%Y",errors="coerce")
+    departures,return_departures = split_slices(column("Departure"))
+    arrivals,return_arrivals = split_slices(column("Arrival"))
+    durations,return_durations = split_slices(column("Duration"))
+    stops,return_stops = split_slices(column("Stops"))
+    flights,return_flights = split_slices(column("Flights"))
+    typed["departure"] = parse_times(departures,start_date)
+    typed["arrival"] = parse_times(arrivals,start_date)
+    typed["duration_minutes"] = parse_durations(durations)
+    typed["stops"] = parse_stops(stops)
+    typed["flights"] = flights
+    typed["return_departure"] = parse_times(return_departures,end_date)
+    typed["return_arrival"] = parse_times(return_arrivals,end_date)
+    typed["return_duration_minutes"] = parse_durations(return_durations)
+    typed["return_stops"] = parse_stops(return_stops)
+    typed["return_flights"] = return_flights
+    typed["start_date"] = start_date
+    typed["end_date"] = end_date
+    raw = {"Price","Airline filter_alt","Route","Departure","Arrival","Duration","Stops","Flights","start_date","end_date"}
+    for name in df.columns:
+        if name not in raw:
+            typed[str(name)] = df[name].astype("string")
+    return typed.reset_index(drop=True)
+
+
+def normalize_matrix(matrix):
+    """
+    This function converts the fare matrix of the upper table to the typed schema, the lowest price becomes minor units and a currency.
+
+    Args:
+        matrix (pandas.DataFrame): carrier, stops, lowest_price, start_date and end_date columns
+
+    Returns:
+        pandas.DataFrame: typed fare matrix
+    """
+    typed = pd.DataFrame(index=matrix.index)
+    typed["carrier"] = matrix["carrier"].astype("category")
+    typed["stops"] = parse_stops(matrix["stops"])
+    typed["price_minor"],typed["currency"] = parse_prices(matrix["lowest_price"])
+    typed["start_date"] = pd.to_datetime(matrix["start_date"],format="%m/%d/%Y",errors="coerce")
+    typed["end_date"] = pd.to_datetime(matrix["end_date"],format="%m/%d/%Y",errors="coerce")
+    return typed
+
+
+def normalize_calendar(calendar):
+    """
+    This function converts the lowest fares of a calendar search to the typed schema.
+
+    Args:
+        calendar (pandas.DataFrame): start_date, end_date, lowest_price and solutions columns
+
+    Returns:
+        pandas.DataFrame: typed calendar
+    """
+    typed = pd.DataFrame(index=calendar.index)
+    typed["start_date"] = pd.to_datetime(calendar["start_date"],format="%m/%d/%Y",errors="coerce")
+    typed["end_date"] = pd.to_datetime(calendar["end_date"],format="%m/%d/%Y",errors="coerce")
+    typed["price_minor"],typed["currency"] = parse_prices(calendar["lowest_price"])
+    typed["solutions"] = pd.to_numeric(calendar["solutions"],errors="coerce").astype("Int32")
+    return typed
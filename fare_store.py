@@ -0,0 +1,267 @@
+import argparse
+import sqlite3
+import time
+from datetime import datetime
+import pandas as pd
+from fare_schema import normalize_fares
+from settings import STORE_PATH
+
+#Ver 1.3 --Columns of the fares table, in insert order.
+STORE_COLUMNS = ["origin","destination","departure_date","return_date","carrier","price_minor","currency","stops","return_stops",
+                 "duration_minutes","return_duration_minutes","departure","arrival","return_departure","return_arrival",
+                 "flights","return_flights","scraped_at"]
+
+
+class FareStore:
+    """
+    Ver 1.3 -- Indexed history of every scraped fare in a local SQLite file. Rows are stored in the typed schema (prices in minor units,
+    dates as ISO text) with the time they were scraped. The cheapest fare of every carrier of every scrape is kept in the carrier_fares table
+    as the rows are added, so price calendars, carrier trends and route comparisons are indexed aggregations over a few rows per date
+    instead of loading the excel files. Older scrapes are kept, the queries use the latest scrape of every date unless they are about the history.
+
+    Args:
+        db_path (str): path of the SQLite file
+    """
+
+    def __init__(self,db_path=STORE_PATH):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS fares (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                departure_date TEXT NOT NULL,
+                return_date TEXT,
+                carrier TEXT,
+                price_minor INTEGER,
+                currency TEXT,
+                stops INTEGER,
+                return_stops INTEGER,
+                duration_minutes INTEGER,
+                return_duration_minutes INTEGER,
+                departure TEXT,
+                arrival TEXT,
+                return_departure TEXT,
+                return_arrival TEXT,
+                flights TEXT,
+                return_flights TEXT,
+                scraped_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS fares_route_date ON fares (origin,destination,departure_date,scraped_at);
+            CREATE INDEX IF NOT EXISTS fares_carrier ON fares (carrier);
+            CREATE INDEX IF NOT EXISTS fares_scraped_at ON fares (scraped_at);
+            CREATE TABLE IF NOT EXISTS carrier_fares (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                departure_date TEXT NOT NULL,
+                return_date TEXT NOT NULL,
+                scraped_at TEXT NOT NULL,
+                carrier TEXT NOT NULL,
+                price_minor INTEGER NOT NULL,
+                currency TEXT,
+                fares INTEGER NOT NULL,
+                PRIMARY KEY (origin,destination,departure_date,return_date,scraped_at,carrier)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS carrier_fares_trend ON carrier_fares (origin,destination,carrier,scraped_at);
+        """)
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def add(self,origin,destination,starting_date,ending_date,dataframes,scraped_at):
+        """
+        This function adds the raw rows of a search. The parts of one scrape are added with the same scraped_at and merged into
+        one snapshot, a new scrape of the date needs its own scraped_at.
+
+        Args:
+            origin (str): origin IATA code
+            destination (str): destination IATA code
+            starting_date (str): start date in MM/DD/YYYY format
+            ending_date (str): end date in MM/DD/YYYY format
+            dataframes (pandas.DataFrame): raw rows of the search
+            scraped_at (str): scrape time in ISO format
+
+        Returns:
+            int: number of rows added
+        """
+        if dataframes.empty:
+            return 0
+        typed = normalize_fares(dataframes)
+        rows = pd.DataFrame({
+            "origin":origin,
+            "destination":destination,
+            "departure_date":datetime.strptime(starting_date,"%m/%d/%Y").date().isoformat(),
+            "return_date":datetime.strptime(ending_date,"%m/%d/%Y").date().isoformat(),
+            "carrier":typed["carrier"].astype(object),
+            "price_minor":typed["price_minor"].astype(object),
+            "currency":typed["currency"].astype(object),
+            "stops":typed["stops"].astype(object),
+            "return_stops":typed["return_stops"].astype(object),
+            "duration_minutes":typed["duration_minutes"].astype(object),
+            "return_duration_minutes":typed["return_duration_minutes"].astype(object),
+            "departure":typed["departure"].dt.strftime("%Y-%m-%dT%H:%M").astype(object),
+            "arrival":typed["arrival"].dt.strftime("%Y-%m-%dT%H:%M").astype(object),
+            "return_departure":typed["return_departure"].dt.strftime("%Y-%m-%dT%H:%M").astype(object),
+            "return_arrival":typed["return_arrival"].dt.strftime("%Y-%m-%dT%H:%M").astype(object),
+            "flights":typed["flights"].astype(object),
+            "return_flights":typed["return_flights"].astype(object),
+            "scraped_at":scraped_at,
+        },columns=STORE_COLUMNS)
+        #Missing values of every dtype are stored as NULL.
+        rows = rows.where(rows.notna(),None)
+        self.connection.executemany(f"INSERT INTO fares VALUES ({','.join('?' * len(STORE_COLUMNS))})",rows.itertuples(index=False,name=None))
+        #The cheapest fare of every carrier, merged with the earlier parts of the same search.
+        priced = typed[typed["price_minor"].notna()].assign(carrier=typed["carrier"].astype(object).fillna(""))
+        cheapest = priced.sort_values("price_minor").groupby("carrier",sort=False,observed=True)
+        summary = cheapest.first()[["price_minor","currency"]].join(cheapest.size().rename("fares")).reset_index()
+        self.connection.executemany("""
+            INSERT INTO carrier_fares VALUES (?,?,?,?,?,?,?,?,?)
+            ON CONFLICT DO UPDATE SET
+                currency=CASE WHEN excluded.price_minor < price_minor THEN excluded.currency ELSE currency END,
+                price_minor=MIN(price_minor,excluded.price_minor),
+                fares=fares+excluded.fares
+        """,[(origin,destination,rows["departure_date"].iat[0],rows["return_date"].iat[0],scraped_at,carrier,int(price),
+              None if pd.isna(currency) else str(currency),int(fares))
+             for carrier,price,currency,fares in summary[["carrier","price_minor","currency","fares"]].itertuples(index=False,name=None)])
+        self.connection.commit()
+        return len(rows)
+
+    def query(self,sql,params=()):
+        return pd.read_sql_query(sql,self.connection,params=params)
+
+    def price_calendar(self,origin,destination,date_from=None,date_to=None):
+        """
+        This function returns the cheapest fare of every departure date of a route, taken from the latest scrape of the date.
+
+        Args:
+            origin (str): origin IATA code
+            destination (str): destination IATA code
+            date_from (str): first departure date in YYYY-MM-DD format, None for no limit
+            date_to (str): last departure date in YYYY-MM-DD format, None for no limit
+
+        Returns:
+            pandas.DataFrame: departure_date, price_minor, currency, carrier and scraped_at of the cheapest fare
+        """
+        return self.query("""
+            WITH latest AS (
+                SELECT departure_date,return_date,MAX(scraped_at) AS scraped_at FROM carrier_fares
+                WHERE origin=? AND destination=? AND departure_date >= ? AND departure_date <= ?
+                GROUP BY departure_date,return_date
+            ),
+            ranked AS (
+                SELECT c.departure_date,c.return_date,c.price_minor,c.currency,c.carrier,c.scraped_at,
+                       ROW_NUMBER() OVER (PARTITION BY c.departure_date ORDER BY c.price_minor) AS position
+                FROM latest l JOIN carrier_fares c
+                ON c.origin=? AND c.destination=? AND c.departure_date=l.departure_date AND c.return_date=l.return_date AND c.scraped_at=l.scraped_at
+            )
+            SELECT departure_date,return_date,price_minor,currency,carrier,scraped_at FROM ranked WHERE position=1 ORDER BY departure_date
+        """,(origin,destination,date_from or "0000-00-00",date_to or "9999-99-99",origin,destination))
+
+    def carrier_trend(self,origin,destination,carrier=None,date_from=None,date_to=None):
+        """
+        This function returns how the cheapest fare of every carrier changed between the scrape days, over the given departure dates.
+
+        Returns:
+            pandas.DataFrame: one row per scrape day and one column per carrier with the lowest price in minor units
+        """
+        sql = """
+            SELECT substr(scraped_at,1,10) AS scrape_day,carrier,MIN(price_minor) AS price_minor FROM carrier_fares
+            WHERE origin=? AND destination=? AND departure_date >= ? AND departure_date <= ?
+        """
+        params = [origin,destination,date_from or "0000-00-00",date_to or "9999-99-99"]
+        if carrier is not None:
+            sql += " AND carrier=?"
+            params.append(carrier)
+        trend = self.query(sql + " GROUP BY scrape_day,carrier ORDER BY scrape_day",params)
+        if trend.empty:
+            return trend
+        return trend.pivot(index="scrape_day",columns="carrier",values="price_minor")
+
+    def compare_routes(self,routes,date_from=None,date_to=None):
+        """
+        This function compares the price calendars of several routes.
+
+        Args:
+            routes (list): (origin,destination) tuples
+
+        Returns:
+            pandas.DataFrame: dates, min, median, mean and max of the daily cheapest fares and the cheapest date of every route
+        """
+        calendars = [self.price_calendar(origin,destination,date_from,date_to).assign(route=f"{origin}-{destination}")
+                     for origin,destination in routes]
+        calendars = pd.concat(calendars,ignore_index=True)
+        if calendars.empty:
+            return pd.DataFrame()
+        grouped = calendars.groupby("route",sort=False)["price_minor"]
+        summary = grouped.agg(["count","min","median","mean","max"]).rename(columns={"count":"dates"})
+        summary["cheapest_date"] = calendars.loc[grouped.idxmin(),["route","departure_date"]].set_index("route")["departure_date"]
+        summary["currency"] = calendars.groupby("route",sort=False)["currency"].first()
+        return summary
+
+    def close(self):
+        self.connection.close()
+
+
+def import_output(store,output_path,origin,destination):
+    """
+    This function adds a csv output of the scraper written before the store existed, the scrape time of every date is kept.
+
+    Returns:
+        int: number of rows added
+    """
+    data = pd.read_csv(output_path,dtype=str)
+    added = 0
+    for (starting_date,ending_date,scraped_at),rows in data.groupby(["start_date","end_date","scraped_at"],sort=False):
+        added += store.add(origin,destination,starting_date,ending_date,rows.drop(columns=["scraped_at"]),scraped_at=scraped_at)
+    return added
+
+
+def format_prices(frame,columns):
+    """
+    This function converts minor units back to prices for printing, price_minor is renamed to price.
+    """
+    frame = frame.copy()
+    for column in columns:
+        if column in frame.columns:
+            frame[column] = (frame[column] / 100).round(2)
+    return frame.rename(columns={"price_minor":"price"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queries the fare store written by the scraper.")
+    parser.add_argument("--store",default=STORE_PATH,help=f"SQLite file of the store (default: {STORE_PATH})")
+    commands = parser.add_subparsers(dest="command",required=True)
+    calendar = commands.add_parser("calendar",help="cheapest fare of every departure date of a route")
+    trend = commands.add_parser("trend",help="cheapest fare of every carrier per scrape day")
+    compare = commands.add_parser("compare",help="compare the price calendars of routes")
+    backfill = commands.add_parser("import",help="add a csv output written before the store existed")
+    for command in (calendar,trend):
+        command.add_argument("origin")
+        command.add_argument("destination")
+    trend.add_argument("--carrier")
+    compare.add_argument("routes",nargs="+",help="routes like IST-JFK")
+    for command in (calendar,trend,compare):
+        command.add_argument("--from",dest="date_from",help="first departure date, YYYY-MM-DD")
+        command.add_argument("--to",dest="date_to",help="last departure date, YYYY-MM-DD")
+    backfill.add_argument("path",help="csv output, e.g. ISTJFK.csv")
+    backfill.add_argument("origin")
+    backfill.add_argument("destination")
+    args = parser.parse_args()
+    with FareStore(args.store) as store:
+        started = time.perf_counter()
+        if args.command == "calendar":
+            result = format_prices(store.price_calendar(args.origin.upper(),args.destination.upper(),args.date_from,args.date_to),["price_minor"])
+        elif args.command == "trend":
+            result = store.carrier_trend(args.origin.upper(),args.destination.upper(),args.carrier,args.date_from,args.date_to) / 100
+        elif args.command == "compare":
+            routes = [tuple(route.upper().split("-")) for route in args.routes]
+            result = format_prices(store.compare_routes(routes,args.date_from,args.date_to),["min","median","mean","max"])
+        else:
+            result = f"{import_output(store,args.path,args.origin.upper(),args.destination.upper())} rows imported"
+        elapsed = (time.perf_counter() - started) * 1000
+        print(result.to_string() if isinstance(result,pd.DataFrame) else result)
+        print(f"({elapsed:.1f} ms)")
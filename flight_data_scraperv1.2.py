@@ -1,9 +1,36 @@
-from playwright.sync_api import sync_playwright,TimeoutError
-from bs4 import BeautifulSoup
+from playwright.sync_api import sync_playwright,TimeoutError,Error as PlaywrightError
 import pandas as pd
-from datetime import datetime,timedelta
-from os import path
-url = "https://matrix.itasoftware.com"
+from datetime import datetime
+from os import path,remove,environ
+import asyncio
+import time
+from browser_manager import BrowserManager
+from page_parsing import (parse_upper_table,parse_carrier_table,table_rows,dataframe_rows,sheet_name_for,fare_matrix,CARRIER_TABLE_SCRIPT,
+                          UPPER_TABLE_SCRIPT,FARE_MATRIX_ATTR,FARE_MATRIX_COLUMNS)
+from row_collector import RowCollector
+from async_engine import run_search_pool
+from process_pool import run_sharded
+from response_capture import is_search_response,check_response,load_payload,parse_search_payload
+from result_sinks import MATRIX_SUFFIX,open_sink,export_excel
+from fare_cache import FareCache
+from checkpoint import CheckpointJournal
+from request_filter import RequestFilter
+from readiness import (Budget,BudgetExceeded,backoff_delay,wait_for_stable_table,TABLE_STATE_SCRIPT,DATE_BUDGET,CARRIER_BUDGET,
+                       SEARCH_TIMEOUT,CARRIER_TIMEOUT,UPPER_TABLE_SELECTOR,CARRIER_TABLE_SELECTOR)
+from batch_jobs import read_queries,unique_jobs,build_date_pairs,check_date,validate_query
+from metrics import METRICS
+from fare_schema import normalize_fares,normalize_matrix,normalize_calendar
+from fare_store import FareStore
+from scheduler import RefreshScheduler
+from settings import MAX_SEARCHES_PER_BROWSER,RETRY_ROUNDS
+from matrix_scraper import parse_arguments
+from calendar_search import (calendar_windows,parse_calendar_payload,flag_dates,CALENDAR_MODE_LABEL,STAY_PLACEHOLDER,CALENDAR_SUFFIX,
+                             CALENDAR_COLUMNS)
+from rate_control import TokenBucket,AimdController
+from browser_cache import BrowserCache
+from failure_queue import FailureQueue,FAILURES_ATTR,date_failure,failures_of,error_text
+#Ver 1.3 --MATRIX_URL points the scraper at another server, e.g. the local replay server of the benchmark.
+url = environ.get("MATRIX_URL","https://matrix.itasoftware.com")
 
 def period_input():
     """
@@ -57,8 +84,8 @@ def destination_input():
 def start_date_input():
     """
     This function takes in date values, checks if the date is valid but does not check if the date is valid.
-    It is possible to check if the date is in the past to confirm, and since it is only possible to book for a date in the upcoming 365 days
-    this validity check can also be implemented.
+    Ver 1.3 -- Dates in the past are rejected, and since it is only possible to book for a date in the upcoming 365 days
+    dates further away are rejected as well.
 
     Returns:
         str: date
@@ -69,17 +96,23 @@ def start_date_input():
         try:
             
             formatted_date = datetime.strptime(date_input, "%m/%d/%y")
-            print("Succesful, date you provided is: ", formatted_date.strftime("%m/%d/%y"))
-            break
         except ValueError:
             print("Error! Please provide dates in suggested format (MM/DD/YY).")
+            continue
+        try:
+            check_date(date_input)
+        except ValueError as error:
+            print(f"Error! {error}, please provide another date.")
+            continue
+        print("Succesful, date you provided is: ", formatted_date.strftime("%m/%d/%y"))
+        break
     return date_input
 
 def end_date_input():
     """
     This function takes in date values, checks if the date is valid but does not check if the date is valid.
-    It is possible to check if the date is in the past to confirm, and since it is only possible to book for a date in the upcoming 365 days
-    this validity check can also be implemented.
+    Ver 1.3 -- Dates in the past are rejected, and since it is only possible to book for a date in the upcoming 365 days
+    dates further away are rejected as well.
 
     Returns:
         str: date
@@ -90,205 +123,853 @@ def end_date_input():
         try:
             
             formatted_date = datetime.strptime(date_input, "%m/%d/%y")
-            print("Succesful, date you provided is: ", formatted_date.strftime("%m/%d/%y"))
-            break
         except ValueError:
             print("Error! Please provide dates in suggested format (MM/DD/YY).")
+            continue
+        try:
+            check_date(date_input)
+        except ValueError as error:
+            print(f"Error! {error}, please provide another date.")
+            continue
+        print("Succesful, date you provided is: ", formatted_date.strftime("%m/%d/%y"))
+        break
     return date_input
 
 
-def wait_for_table_load(page):
+def wait_for_table_load(page,budget=None):
     """
        This function will wait for the table objects to be loaded, and catch TimeoutError if it happens.
     Ver 1.1 -- With new version we added a counter to keep track of failed attempts and break out of the program because sometimes page never loads 
     and program gets stuck in a never ending loop.
+    Ver 1.3 -- Instead of a fixed 10 second timeout we wait for the actual data: the search response is awaited around the click by
+    search_date, here the rows of the upper table are waited until they stop changing. The network never goes idle on the single page app,
+    so networkidle returned at once after the click. The timeout is learned from the recent searches, retries wait with exponential backoff
+    and jitter and all of it is cut to the budget of the date.
     Args:
         page (playwright.page): takes this value from main function
+        budget (Budget): time budget of the date
 
     Returns:
         bool: returns True if error
     """
     counter = 0
     while True:
-
+        counter +=1
+        timeout = SEARCH_TIMEOUT.current()
+        if budget is not None:
+            timeout = budget.cap(timeout)
+        print("Waiting for tables to load...")
+        started = time.monotonic()
         try:
-            print("Waiting for tables to load...")
-            counter +=1
-            page.locator('div[id="cdk-accordion-child-0"]').wait_for(timeout=10000)
+            with METRICS.stage("wait_table",attempt=counter):
+                page.locator('div[id="cdk-accordion-child-0"]').wait_for(timeout=max(0.1,timeout - (time.monotonic() - started))*1000)
+                if wait_for_stable_table(page,UPPER_TABLE_SELECTOR,max(0.1,timeout - (time.monotonic() - started))) is None:
+                    raise TimeoutError("Rows did not settle")
+            SEARCH_TIMEOUT.record(time.monotonic() - started)
             print("Tables loaded... Parsing the screen...")
-            
-            break
+            return False
         except TimeoutError:
             print(f"TimeoutError... Retrying...Total Tries :{counter}")
+            METRICS.retry("wait_table")
             if counter >= 5:
                 print(f"This took more than {counter} tries. Breaking out and restarting.")
                 
                 return True
+            time.sleep(backoff_delay(counter))
             
-def wait_for_carrier_table_load(page,carrier):
+def wait_for_carrier_table_load(page,carrier,previous=None,budget=None):
     """    
     This function will wait for the table objects to be loaded for each carrier after click action, and catch TimeoutError if it happens.
     Ver 1.1 -- With new version we added a counter to keep track of failed attempts and break out of the program because sometimes page never loads 
     and program gets stuck in a never ending loop.
+    Ver 1.3 -- The table counts as loaded when it is not the table of the previous carrier anymore and its rows stopped changing.
+    The timeout is learned from the recent carriers and cut to the budget of the carrier, retrying is left to the click loop.
 
     Args:
         page (playwright.page): takes this value from main function
         carrier (str): name of the carrier to be waited
+        previous (dict): state of the carrier table before the click
+        budget (Budget): time budget of the carrier
 
     Returns:
         bool: returns True if error
     """
-    counter = 0
-    while True:
-        try:
-            
-            counter += 1
-            page.locator('thead[class="ng-star-inserted"]').wait_for(timeout=10000)
-            print(f"got the table for {carrier}... ")
-            break
-        except TimeoutError:
-            print(f"a problem occured while loading the tables for {carrier}... Retrying...{counter}")
-            if counter >=5:
-                return True
+    timeout = CARRIER_TIMEOUT.current()
+    if budget is not None:
+        timeout = budget.cap(timeout)
+    started = time.monotonic()
+    with METRICS.stage("carrier_wait",carrier=carrier) as stage:
+        if wait_for_stable_table(page,CARRIER_TABLE_SELECTOR,timeout,previous=previous) is None:
+            stage.outcome = "timeout"
+    if stage.outcome != "ok":
+        print(f"a problem occured while loading the tables for {carrier}...")
+        return True
+    CARRIER_TIMEOUT.record(time.monotonic() - started)
+    print(f"got the table for {carrier}... ")
+    return False
 
-def read_screen(page,starting_date,ending_date,dataframes):
+def read_screen(page):
     """    
-    This function will read the table contents for carriers and return the dataframe objects in a list of dataframes. 
+    This function will read the table contents for carriers.
     It will also generate a sheet name representing the first flight date for each query.
+    Ver 1.3 -- The rows are returned as they are and handed down the pipeline one carrier at a time,
+    instead of being concatenated to the placeholder dataframe for every carrier.
 
     Args:
         page (playwright.page): page object
-        starting_date (str): start date
-        ending_date (str): end date
-        dataframes (pandas.DataFrame): placeholder dataframe created outside the function
 
     Returns:
-        dataframes,sheetname: returns dataframes to be written in excel and sheetname for the sheet.
-    """
-    new_html = page.content() 
-    df = pd.read_html(new_html,attrs = {"role":"table"})
-    df=df[0]
-    df = df[df["Airline filter_alt"].notnull()]
-    df["start_date"] = starting_date
-    df["end_date"] = ending_date
-    dataframes = pd.concat([dataframes,df],ignore_index= True)
-    sheet_name = starting_date.replace("/",".")
-    return sheet_name,dataframes
+        columns,rows: column names and rows of the carrier table
+    """
+    #Ver 1.3 --The carrier table is read with a single page.evaluate call returning only its rows as JSON.
+    #The old full page parse is kept as a fallback in case the table is rendered differently.
+    with METRICS.stage("read_screen") as stage:
+        table = page.evaluate(CARRIER_TABLE_SCRIPT)
+        if table is not None:
+            columns,rows = table_rows(table)
+        else:
+            stage.outcome = "fallback"
+            columns,rows = dataframe_rows(parse_carrier_table(page.content()))
+    return columns,rows
     
-def flight_data_scraper(origin,destination,start_date,end_date,period):
-    ## First we initiate our page object from playwright.
-    with sync_playwright() as p:
-        ## Then we convert our dates to datetime object to create a list of dates in order to iterate through the list,this is for the sake of generating more data.
-        start_date_formatted = datetime.strptime(start_date,"%m/%d/%y")
-        end_date_formatted = datetime.strptime(end_date,"%m/%d/%y")
-        time_delta = end_date_formatted - start_date_formatted
-        date_list = pd.date_range(start_date_formatted,start_date_formatted + timedelta(period),freq="D") 
-   
-        for starting_date in date_list:
-            #We have to reformat the dates to pass them into form in the webpage.
-            #We also calculate the timedelta (time difference between start and end date) to fill the form for future iterations.
-            print("Starting Scraper...")
-            ending_date_in_dt = starting_date + timedelta(days=time_delta.days)
-            ending_date = datetime.strftime(ending_date_in_dt,"%m/%d/%Y")
-            starting_date = datetime.strftime(starting_date,"%m/%d/%Y")
-            
-            while True:
-                try:
-                    #In this while loop and try/except block, we try to fill the form and click search button.
-                    #But sometimes page takes too long to load after searching. So when a TimeoutError occurs we catch it in the except block and close the browser to restart the process.
-                    print("Starting Browser...")
-                    browser = p.firefox.launch(headless= True,timeout=10000)
-                    page =  browser.new_page()
-                    page.goto(url)
-                    print("Page is now loaded...")
-                    page.type("input[id=mat-mdc-chip-list-input-1]",destination.upper())
-                    page.type("input[id=mat-mdc-chip-list-input-0]",origin.upper())
-                    page.get_by_placeholder("Start Date").fill(starting_date)
-                    page.get_by_placeholder("End Date").fill(ending_date)
-                    print("Filled parameters...")
-                    page.keyboard.down(key="Enter")
-                    page.keyboard.up(key="Enter")
-                    print("Clicking search button...")
-                    
-                    #Ver 1.1 --We added no_wait_after = True to manually check if the page is loaded but this parameter does not seem to work properly.
-                    #This line of parameters is set for other click lines aswell.
-                    page.click('//button[@value="Search"]',no_wait_after=True)
-                    print("Search completed...")
-                    #Ver 1.1 --We moved wait_for_table_load inside this try block to prevent never ending loads and if the function returns true we raise a TimeoutError
-                    #to breakout and restart the process.
-                    if wait_for_table_load(page):
-                        raise TimeoutError("Timelimit exceeded")
-                    break
-                except TimeoutError:
-                    print("Loading took longer than expected... Closing the page and retrying...")
-                    browser.close()
-                    print("Page is now closed... Restarting the process...")
-               
-            
-            #Parsing the screen to get carriers and content in the upper table.
-            #When we click the carrier names/images in the upper table we get a seperate table that only includes their prices, so we collect their names in carriers list.
-            page_content = page.content()
-            soup = BeautifulSoup(page_content,"lxml")
-            upper_table_content = soup.find("mat-table",attrs={"role":"table"})
-            rows = upper_table_content.find_all("mat-row")    
-            headers = upper_table_content.find("mat-header-row")
-            list = []
-            carriers = []
-            #We also create a pandas.dataframe object in order to collect and append all the carriers prices/durations etc.
-            dataframes = pd.DataFrame()
-            for header_cell in headers.find_all("mat-header-cell"):
-                carriers.append(header_cell.text)
-            for row in rows:
-                cells = row.find_all("mat-cell")
-                for cell in cells:
-                    list.append(cell.text)
-            
-            for carrier in carriers[1:]:
-            #after we get all the data from upper table, we start to iterate through the carriers list and click them.
+def read_upper_table(page):
+    """
+    Ver 1.3 -- This function reads the upper table with a single page.evaluate call that returns only its header and cells.
+    The html parse of the page is kept as a fallback.
+
+    Args:
+        page (playwright.page): page with the search results loaded
+
+    Returns:
+        carriers,rows: carrier names from the header row and the text of the cells of every row
+    """
+    table = page.evaluate(UPPER_TABLE_SCRIPT)
+    if table is not None:
+        return table["carriers"],table["rows"]
+    return parse_upper_table(page.content())
+
+def open_search_form(page):
+    """
+    Ver 1.3 -- This function brings the page back to an empty search form. A fresh page loads the site with page.goto.
+    A page that was used for the previous date is reset in place if the form is still on the screen, otherwise the site is loaded again
+    on the same context, so the browser cache is warm and the bundle is not downloaded again for every date.
+
+    Args:
+        page (playwright.page): page object returned from BrowserManager.get_page()
+    """
+    origin_field = page.locator("input[id=mat-mdc-chip-list-input-0]")
+    if not page.url.startswith(url) or origin_field.count() == 0:
+        with METRICS.stage("goto"):
+            page.goto(url)
+        return
+    with METRICS.stage("reset_form"):
+        #Airport chips left from the previous search are removed, otherwise the new codes would be added next to them.
+        remove_buttons = page.locator("mat-chip-row button[matchipremove]")
+        while remove_buttons.count() > 0:
+            remove_buttons.first.click()
+        page.get_by_placeholder("Start Date").fill("")
+        page.get_by_placeholder("End Date").fill("")
+
+def submit_search(page):
+    """
+    Ver 1.3 -- This function submits the filled search form.
+    """
+    page.keyboard.down(key="Enter")
+    page.keyboard.up(key="Enter")
+    print("Clicking search button...")
+
+    #Ver 1.1 --We added no_wait_after = True to manually check if the page is loaded but this parameter does not seem to work properly.
+    #This line of parameters is set for other click lines aswell.
+    page.click('//button[@value="Search"]',no_wait_after=True)
+    print("Search completed...")
+
+def search_date(manager,origin,destination,starting_date,ending_date,capture=False,limiter=None,stay=None):
+    """
+    Ver 1.3 -- This function fills the search form for a single date and waits for the results. It keeps retrying until the tables are loaded,
+    after a failed attempt only the browser context is renewed, the browser itself is relaunched by the manager when it is not healthy.
+    With capture=True the response of the search call is captured while the search is submitted.
+    Retries wait with exponential backoff, and when the date used up DATE_BUDGET seconds BudgetExceeded is raised so the run can move on.
+    With a rate limiter every attempt waits for a token first.
+    With stay given the form is switched to the calendar of lowest fares, the dates are the first and last departure of the window
+    and the calendar response is captured.
+
+    Args:
+        manager (BrowserManager): browser manager shared by the whole run
+        origin (str): origin IATA code
+        destination (str): destination IATA code
+        starting_date (str): start date in MM/DD/YYYY format
+        ending_date (str): end date in MM/DD/YYYY format
+        capture (bool): capture the search result payload
+        limiter (TokenBucket): rate limiter of the run, None doesn't limit
+        stay (int): length of stay in days of a calendar search, None searches the single date
+
+    Returns:
+        page,payload: page with the search results loaded and the decoded search payload, payload is None without capture
+
+    Raises:
+        BudgetExceeded: if the date could not be searched within DATE_BUDGET seconds
+    """
+    budget = Budget(DATE_BUDGET,f"Search for {starting_date}")
+    attempt = 0
+    while True:
+        attempt += 1
+        if limiter is not None:
+            with METRICS.stage("rate_limit"):
+                limiter.acquire()
+        try:
+            #In this while loop and try/except block, we try to fill the form and click search button.
+            #But sometimes page takes too long to load after searching. So when a TimeoutError occurs we catch it in the except block and renew the browser context to restart the process.
+            page = manager.get_page()
+            open_search_form(page)
+            manager.save_state()
+            print("Page is now loaded...")
+            with METRICS.stage("fill"):
+                page.type("input[id=mat-mdc-chip-list-input-1]",destination.upper())
+                page.type("input[id=mat-mdc-chip-list-input-0]",origin.upper())
+                page.get_by_placeholder("Start Date").fill(starting_date)
+                page.get_by_placeholder("End Date").fill(ending_date)
+                if stay is not None:
+                    page.get_by_label(CALENDAR_MODE_LABEL).check()
+                    page.get_by_placeholder(STAY_PLACEHOLDER).fill(str(stay))
+            print("Filled parameters...")
+            if capture or stay is not None:
+                #Ver 1.3 --The results come in a single backend response, so we only need to wait for that response and not for the tables.
+                with METRICS.stage("capture_response"):
+                    with page.expect_response(is_search_response,timeout=budget.cap(SEARCH_TIMEOUT.maximum)*1000) as response_info:
+                        submit_search(page)
+                    check_response(response_info.value.status)
+                    payload = load_payload(response_info.value.text())
+                return page,payload
+            #Ver 1.3 --The tables are only read after the search response arrived, see wait_for_table_load.
+            with METRICS.stage("submit"):
+                with page.expect_response(is_search_response,timeout=budget.cap(SEARCH_TIMEOUT.maximum)*1000) as response_info:
+                    submit_search(page)
+                check_response(response_info.value.status)
+            #Ver 1.1 --We moved wait_for_table_load inside this try block to prevent never ending loads and if the function returns true we raise a TimeoutError
+            #to breakout and restart the process.
+            if wait_for_table_load(page,budget):
+                raise TimeoutError("Timelimit exceeded")
+            return page,None
+        #Ver 1.3 --A failed or unreadable search response (ValueError) is retried like a timeout, within the budget of the date.
+        except (TimeoutError,ValueError) as error:
+            print(f"Search failed ({error})... Renewing the browser context and retrying...")
+            METRICS.retry("search",attempt=attempt)
+            manager.recycle()
+            print("Browser context is renewed... Restarting the process...")
+            time.sleep(min(backoff_delay(attempt),max(0,budget.remaining())))
+            budget.check()
+
+def date_parts(manager,origin,destination,starting_date,ending_date,capture=False,journal=None,limiter=None,carriers=None):
+    """
+    Ver 1.3 -- Search and extract stages of a date. This function runs the search and yields the rows of every carrier as a separate part
+    as soon as its table is read, the next carrier is only clicked after the part went through the rest of the pipeline.
+    With capture=True the rows are derived from the captured search payload in a single part and the carrier click loop is skipped entirely.
+    The last part is always final and carries the fare matrix of the upper table in its attrs, it has no rows after the carrier parts.
+    With a checkpoint journal, carriers finished in an earlier run are taken from the journal and every new carrier is recorded in it.
+    Ver 1.3 -- Carriers skipped after their budget are listed in the attrs of the last part (FAILURES_ATTR) for the failure queue.
+    With carriers given only those carriers are clicked, to retry the failed carriers of a date, the fare matrix is not written again.
+
+    Yields:
+        dataframes,final: rows of a carrier with start_date and end_date, final is True for the last part of the date
+    """
+    page,payload = search_date(manager,origin,destination,starting_date,ending_date,capture=capture,limiter=limiter)
+    if payload is not None:
+        with METRICS.stage("parse_payload"):
+            dataframes = parse_search_payload(payload,starting_date,ending_date)
+        yield dataframes,True
+        return
+    #Parsing the screen to get carriers and content in the upper table.
+    #When we click the carrier names/images in the upper table we get a seperate table that only includes their prices, so we collect their names in carriers list.
+    with METRICS.stage("parse_upper"):
+        header,upper_rows = read_upper_table(page)
+    collector = RowCollector(starting_date,ending_date)
+    job = (origin,destination,starting_date,ending_date)
+    done_carriers = journal.finished_carriers(job) if journal is not None else {}
+    skipped = {}
+    for carrier,columns,rows,new in read_carriers(page,header,done_carriers,skipped,carriers):
+        if new and journal is not None:
+            journal.carrier_done(job,carrier,columns,rows)
+        collector.add_rows(columns,rows)
+        if len(collector):
+            yield collector.materialize(),False
+    #Ver 1.3 --The lowest fares of the upper table are kept with the last part, the writer stores them in the matrix output.
+    dataframes = collector.materialize()
+    if carriers is None:
+        dataframes.attrs[FARE_MATRIX_ATTR] = fare_matrix(header,upper_rows)
+    if skipped:
+        dataframes.attrs[FAILURES_ATTR] = {"carriers":skipped}
+    yield dataframes,True
+
+def read_carriers(page,carriers,done_carriers=None,skipped=None,only=None):
+    """
+    Ver 1.3 -- This function clicks every carrier of the upper table of a loaded results page and yields its table as soon as it is read.
+
+    Args:
+        page (playwright.page): page with the search results loaded
+        carriers (list): header of the upper table, the first column is not a carrier
+        done_carriers (dict): carrier -> (columns,rows) finished in an earlier run, these carriers are not clicked
+        skipped (dict): carriers whose table didn't load within their budget are added to it with the reason
+        only (set): only these carriers are read, every carrier if None
+
+    Yields:
+        carrier,columns,rows,new: carrier table, new is False for the carriers taken from done_carriers
+    """
+    done_carriers = done_carriers or {}
+
+    for carrier in carriers[1:]:
+    #after we get all the data from upper table, we start to iterate through the carriers list and click them.
+
+        if only is not None and carrier not in only:
+            continue
+        if carrier in done_carriers:
+            print(f"{carrier} is already in the checkpoint journal... Skipping the click...")
+            yield carrier,*done_carriers[carrier],False
+            continue
+        print("Iterating over carriers... Next carrier is: ",carrier)
+        #Ver 1.1 --We implemented a while/try/except method here aswell because sometimes after clicking to carrier image page does not load, so we try a couple of times
+        #If it still does not load we catch the error in the if block, reload the page and skip that carrier for the day.
+        #Ver 1.3 --Every carrier has a hard budget of CARRIER_BUDGET seconds, when it is used up the carrier is skipped instead of retrying forever.
+        budget = Budget(CARRIER_BUDGET,carrier)
+        previous = page.evaluate(TABLE_STATE_SCRIPT,CARRIER_TABLE_SELECTOR)
+        loaded = False
+        error = None
+        attempt = 0
+        while not loaded:
+            attempt += 1
+            try:
+                with METRICS.stage("carrier_click",carrier=carrier,attempt=attempt):
+                    page.get_by_role("columnheader", name=f"{carrier} Carrier logo",exact= True).get_by_role("img",exact=True).click(no_wait_after=True,timeout=budget.cap(10)*1000)
+                #Pages does not load instantly, so wait for the table object to be present/visible.
+                #After screen is loaded we get the table content and pass it down the pipeline.
+                loaded = not wait_for_carrier_table_load(page,carrier,previous,budget)
+            except TimeoutError:
+                print("TimeoutError...Retrying...")
+            except BudgetExceeded:
+                break
+            except PlaywrightError as click_error:
+                #Ver 1.3 --Other errors of the page are not retried, the carrier is skipped and goes to the failure queue.
+                error = click_error
+                break
+            if not loaded:
+                METRICS.retry("carrier",carrier=carrier)
+                time.sleep(min(backoff_delay(attempt),max(0,budget.remaining())))
+        if loaded:
+            #A table the parser doesn't understand (e.g. a changed header) skips the carrier as well.
+            try:
+                columns,rows = read_screen(page)
+            except (PlaywrightError,ValueError) as read_error:
+                loaded,error = False,read_error
+        if not loaded:
+            reason = error_text(error) if error is not None else f"table didn't load within {CARRIER_BUDGET}s"
+            print(f"Couldn't get the table for {carrier} ({reason}), skipping.")
+            METRICS.record("carrier_skipped",budget.seconds - budget.remaining(),"budget" if error is None else "error",{"carrier":carrier})
+            if skipped is not None:
+                skipped[carrier] = reason
+            continue
+
+        yield carrier,columns,rows,True
+
+def search_stage(manager,jobs,capture=False,journal=None,limiter=None,request_filter=None,carriers=None):
+    """
+    Ver 1.3 -- First stage of the streaming pipeline (search -> extract -> normalize -> sink). Searches the jobs one after another and
+    yields the parts of every date, see date_parts. The stages are generators, so nothing is searched ahead of the sink and memory holds
+    one carrier table at a time whatever the period or the number of routes.
+    A date that can't be searched within its budget is skipped with a final part that only holds the failure, see date_failure.
+
+    Args:
+        manager (BrowserManager): browser of the run
+        jobs (list): (origin,destination,starting_date,ending_date) tuples
+        capture (bool): read the results from the captured search payload
+        journal (CheckpointJournal): records finished carriers, None disables it
+        limiter (TokenBucket): rate limiter, None doesn't limit
+        request_filter (RequestFilter): filter installed by the manager, its measurements are reported for every date
+        carriers (dict): job -> carriers to read for the retries of failed carriers, the other jobs are searched in full
+
+    Yields:
+        job,dataframes,final: a part of a date, final is True for the last one
+    """
+    for job in jobs:
+        print(f"Starting Scraper for {job[0]}-{job[1]} on {job[2]}...")
+        if request_filter is not None:
+            request_filter.start_search()
+        METRICS.bind(route=f"{job[0]}-{job[1]}",date=job[2])
+        try:
+            with METRICS.stage("date"):
+                for dataframes,final in date_parts(manager,*job,capture=capture,journal=journal,limiter=limiter,
+                                                   carriers=(carriers or {}).get(job)):
+                    yield job,dataframes,final
+        except BudgetExceeded as error:
+            #Ver 1.3 --The date goes to the failure queue and is retried at the end of the run.
+            print(f"{error}... Skipping the date and continuing for the next day...")
+            yield job,date_failure(error),True
+            continue
+        except (PlaywrightError,ValueError) as error:
+            #Ver 1.3 --So does a date the page or the parser failed on, the next date gets a healthy page from the manager.
+            print(f"Search for {job[2]} failed ({error_text(error)})... Skipping the date and continuing for the next day...")
+            yield job,date_failure(error_text(error)),True
+            continue
+        if request_filter is not None:
+            request_filter.finish_search(f"{job[0]}{job[1]} {sheet_name_for(job[2])}")
+        print(f"Completed the search for date {sheet_name_for(job[2])}... Continuing for the next day...")
+
+def normalize_stage(parts,writer):
+    """
+    Ver 1.3 -- Normalize stage of the streaming pipeline, converts the rows of every part to the output schema of the writer.
+    The raw rows travel with them, the cache and the fare store keep the raw rows.
+
+    Yields:
+        job,dataframes,final,rows: the part and its rows in the output schema
+    """
+    for job,dataframes,final in parts:
+        yield job,dataframes,final,writer.schema(dataframes)
+
+def sink_stage(parts,writer):
+    """
+    Ver 1.3 -- Last stage of the streaming pipeline, writes every part as it comes and drives the stages before it.
+    """
+    for job,dataframes,final,rows in parts:
+        writer(*job,dataframes,final=final,rows=rows)
+
+def scrape_shard(shard,results,max_searches,capture=False,blocked_types=None,metrics_events=None,rate=None,burst=1,browser_cache_path=None):
+    """
+    Ver 1.3 -- Worker of the process pool mode. Runs in its own process with its own playwright instance and browser,
+    searches every job of its shard and sends the parsed rows of every carrier back to the writer process.
+    The results queue is bounded, the worker waits for the writer when it is full.
+
+    Args:
+        shard (list): (origin,destination,starting_date,ending_date) tuples
+        results (multiprocessing.Queue): queue read by the writer process
+        max_searches (int): relaunch the browser after this many searches
+        capture (bool): read the results from the captured search payload
+        blocked_types (set): resource types blocked by the worker's RequestFilter, None disables the filter
+        metrics_events (str): events file the worker appends its stage timings to, None disables it
+        rate (float): searches per second of this worker, its share of the run's rate limit, None doesn't limit
+        burst (int): tokens the worker's rate limiter can save up
+        browser_cache_path (str): directory of the browser cache shared with the other workers, None disables it
+    """
+    METRICS.configure(events_path=metrics_events)
+    limiter = TokenBucket(rate,burst) if rate else None
+    request_filter = RequestFilter(blocked_types) if blocked_types is not None else None
+    browser_cache = BrowserCache(browser_cache_path) if browser_cache_path is not None else None
+    with sync_playwright() as p, BrowserManager(p,headless=True,max_searches=max_searches,request_filter=request_filter,
+                                                browser_cache=browser_cache) as manager:
+        for job,dataframes,final in search_stage(manager,shard,capture=capture,limiter=limiter,request_filter=request_filter):
+            results.put(job+(dataframes,final))
+    METRICS.close()
+
+class ResultWriter:
+    """
+    Ver 1.3 -- Writes the results of every engine. Results of different routes can arrive in any order, so a sink is kept open for every route.
+    Written results are also stored in the result cache, and cached results are written without searching them again.
+    A date is recorded as done in the checkpoint journal after its last part is written.
+
+    Ver 1.3 -- With typed=True the rows are normalized to the typed fare schema before they are written, the cache keeps the raw rows.
+    Scraped rows are also added to the fare store, rows served from the cache are already in it.
+
+    Ver 1.3 -- Dates that couldn't be searched and skipped carriers are recorded in the failure queue, a written date settles its failures.
+    Retried carriers are written with the stamp of the rows of their date, so the excel export keeps them together.
+
+    Args:
+        output (str): csv or parquet
+        cache (FareCache): result cache, None disables it
+        journal (CheckpointJournal): checkpoint journal, None disables it
+        typed (bool): write the typed fare schema instead of the raw table columns
+        store (FareStore): fare store, None disables it
+        failures (FailureQueue): failure queue, None disables it
+    """
+
+    def __init__(self,output,cache=None,journal=None,typed=False,store=None,failures=None):
+        self.output = output
+        self.cache = cache
+        self.journal = journal
+        self.typed = typed
+        self.store = store
+        self.failures = failures
+        self.sinks = {}
+        self.written = set()
+        self.dates = set()
+        self.retrying = {}
+
+    def sink(self,origin,destination,suffix=""):
+        if (origin,destination,suffix) not in self.sinks:
+            self.sinks[(origin,destination,suffix)] = open_sink(self.output,origin,destination,suffix,self.typed)
+        return self.sinks[(origin,destination,suffix)]
+
+    def __call__(self,origin,destination,starting_date,ending_date,dataframes,final=True,rows=None):
+        """
+        Called for every part of a result. A date arrives in one part per carrier, only the last one is final.
+        rows are the rows of the part already in the output schema, see normalize_stage, they are converted here if None.
+        """
+        job = (origin,destination,starting_date,ending_date)
+        failures = failures_of(dataframes)
+        if failures.get("date"):
+            #A date that couldn't be searched has nothing to write. A date that failed after some of its carriers were written
+            #is written again as a new scrape when it is retried.
+            if job in self.written:
+                self.written.discard(job)
+                self.sink(origin,destination).discard(sheet_name_for(starting_date))
+            if self.failures is not None:
+                self.failures.failed(job,failures["date"])
+            return
+        carriers,stamp = self.retrying.get(job,(None,None))
+        if rows is None:
+            rows = self.schema(dataframes)
+        with METRICS.stage("write",rows=len(dataframes),final=final):
+            self.sink(origin,destination).write(sheet_name_for(starting_date),rows,stamp=stamp,append=carriers is not None)
+        matrix = dataframes.attrs.get(FARE_MATRIX_ATTR)
+        if matrix:
+            with METRICS.stage("write_matrix"):
+                matrix = pd.DataFrame(matrix,columns=FARE_MATRIX_COLUMNS).assign(start_date=starting_date,end_date=ending_date)
+                if self.typed:
+                    matrix = normalize_matrix(matrix)
+                self.sink(origin,destination,MATRIX_SUFFIX).write(sheet_name_for(starting_date),matrix)
+        if self.store is not None:
+            with METRICS.stage("store",rows=len(dataframes)):
+                #Same stamp as the rows in the sink, so the fare store and the output agree on when the date was scraped.
+                self.store.add(*job,dataframes,scraped_at=self.sink(origin,destination).stamps[sheet_name_for(starting_date)])
+        if self.cache is not None:
+            self.cache.put(*job,dataframes,append=job in self.written or carriers is not None,final=final)
+        self.written.add(job)
+        if final:
+            self.dates.add(job)
+            if self.journal is not None:
+                self.journal.date_done(job)
+            if self.failures is not None:
+                self.failures.settle(job,failures,carriers,self.sink(origin,destination).stamps.get(sheet_name_for(starting_date)))
+
+    def retry(self,units):
+        """
+        This function prepares the writer for the retries of failed units, see FailureQueue.due.
+        Retried carriers are added to the rows of their date, a retried date is written like any other.
+        """
+        self.retrying = {job:(carriers,self.failures.stamp(job)) for job,carriers in units if carriers is not None}
 
-                print("Iterating over carriers... Next carrier is: ",carrier)
-                #Ver 1.1 --We implemented a while/try/except method here aswell because sometimes after clicking to carrier image page does not load, so we try a couple of times
-                #If it still does not load we catch the error in the if block, reload the page and skip that carrier for the day.
-                while True:
+    def schema(self,dataframes):
+        """
+        Returns:
+            pandas.DataFrame: rows in the schema selected for the output
+        """
+        if not self.typed:
+            return dataframes
+        with METRICS.stage("normalize",rows=len(dataframes)):
+            return normalize_fares(dataframes)
+
+    def write_cached(self,jobs):
+        """
+        This function writes the jobs found in the cache to the output and returns the ones that still have to be searched.
+        A date the checkpoint journal has finished carriers of is resumed from the journal and not read from the cache.
+
+        Args:
+            jobs (list): (origin,destination,starting_date,ending_date) tuples
+
+        Returns:
+            list: jobs missing from the cache
+        """
+        if self.cache is None:
+            return jobs
+        missing = []
+        for job in jobs:
+            if self.journal is not None and self.journal.finished_carriers(job):
+                missing.append(job)
+                continue
+            dataframes = self.cache.get(*job)
+            if dataframes is None:
+                missing.append(job)
+                continue
+            self.sink(*job[:2]).write(sheet_name_for(job[2]),self.schema(dataframes))
+            self.written.add(job)
+            self.dates.add(job)
+            if self.journal is not None:
+                self.journal.date_done(job)
+        if len(missing) < len(jobs):
+            print(f"{len(jobs) - len(missing)} of {len(jobs)} searches are served from the cache...")
+        return missing
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+
+def flight_data_scraper(origin,destination,start_date,end_date,period,**options):
+    """
+    Scrapes every date of one route. Options are passed to scrape_jobs.
+    """
+    jobs = [(origin,destination,starting_date,ending_date) for starting_date,ending_date in build_date_pairs(start_date,end_date,period)]
+    return scrape_jobs(jobs,**options)
+
+def calendar_scraper(queries,drill_dates=(),drill_cheapest=0,**options):
+    """
+    Ver 1.3 -- Calendar mode. Every query is searched as calendar windows of up to CALENDAR_DAYS departures with the trip length of
+    start_date - end_date as the length of stay, so a month of dates costs one search. The lowest fare of every departure is written to
+    {origin}{destination}_calendar.csv (or parquet). Only the flagged dates and the drill_cheapest cheapest dates of every route are then
+    searched in full with scrape_jobs, the other options are passed to it.
+
+    Args:
+        queries (list): route queries, {"origin","destination","start_date","end_date","period"} like the batch file
+        drill_dates (list): departures in MM/DD/YYYY format to search in full
+        drill_cheapest (int): number of the cheapest departures of every route to search in full
+
+    Returns:
+        pandas.DataFrame: lowest fares of every route
+    """
+    calendars = []
+    routes = {}
+    output = options.get("output","csv")
+    typed = options.get("typed",False)
+    limiter = TokenBucket(options["rate"]/60,options.get("burst",1)) if options.get("rate") else None
+    with sync_playwright() as p, BrowserManager(p,headless=True,max_searches=options.get("max_searches",MAX_SEARCHES_PER_BROWSER),
+                                                request_filter=options.get("request_filter"),browser_cache=options.get("browser_cache")) as manager:
+        for query in queries:
+            origin,destination = query["origin"],query["destination"]
+            date_pairs = build_date_pairs(query["start_date"],query["end_date"],query["period"])
+            routes.setdefault((origin,destination),[]).extend(date_pairs)
+            departures = {starting_date for starting_date,_ in date_pairs}
+            windows = calendar_windows(date_pairs)
+            print(f"Calendar search for {origin}-{destination}: {len(date_pairs)} dates in {len(windows)} searches...")
+            with open_sink(output,origin,destination,CALENDAR_SUFFIX,typed) as sink:
+                for window_start,window_end,stay in windows:
+                    METRICS.bind(route=f"{origin}-{destination}",date=window_start)
                     try:
-                        page.get_by_role("columnheader", name=f"{carrier} Carrier logo",exact= True).get_by_role("img",exact=True).click(no_wait_after=True)
-                        #Pages does not load instantly, so wait for the table object to be present/visible.
-                        #After screen is loaded we get the table content with pandas'es built in read_html function and concat the dataframe to the placeholder dataframe we created above.
-                        #Function below will also generate a sheetname for us to use in excel sheets.
-                        if wait_for_carrier_table_load(page,carrier):
-                            print("Couldn't get the table for the carrier, skipping.")
-                            
-                            continue
-                        break
-                    except TimeoutError:
-                        print("TimeoutError...Retrying...")
-                
-                sheet_name,dataframes = read_screen(page,starting_date,ending_date,dataframes)
-            #Here, we write all the information collected from parsing the screen to a single sheet.
-            with pd.ExcelWriter(out_path,mode="a",engine="openpyxl",if_sheet_exists="replace") as writer:   
-                dataframes.to_excel(writer,sheet_name = f"{sheet_name}",index=False)
-            print(f"Completed the search for date {sheet_name}... Continuing for the next day...")
-            browser.close()
-        print("All searches are now completed... Please go ahead and check your excel file...")    
-        return dataframes
-
-
-
-origin = origin_input()
-destination = destination_input()
-start_date = start_date_input()
-end_date = end_date_input()
-period = period_input()
-out_path = fr"{origin}{destination}.xlsx"
-#This part is added with ver1.2 to check if the excel file exists, if not it will create, if so it will start running right away. 
-#If the sheets to be created existed before, it will overwrite the existing sheets.
-
-if not path.exists(out_path):
-    print("Creating the initial file...")
-    place_holder_df = pd.DataFrame()
-    place_holder_df.to_excel(out_path,engine="openpyxl")
-    print("File created...")
-else:
-    print("File already exists... Continuing...")
-
-flight_data_scraper(origin,destination,start_date,end_date,period)
\ No newline at end of file
+                        with METRICS.stage("calendar",days=len(departures)):
+                            page,payload = search_date(manager,origin,destination,window_start,window_end,limiter=limiter,stay=stay)
+                    except BudgetExceeded as error:
+                        print(f"{error}... Skipping the calendar from {window_start}...")
+                        continue
+                    with METRICS.stage("parse_calendar"):
+                        calendar = parse_calendar_payload(payload,stay)
+                        #The calendar can show more days than the window, only the dates of the query are kept.
+                        calendar = calendar[calendar["start_date"].isin(departures)]
+                    with METRICS.stage("write_calendar",rows=len(calendar)):
+                        sink.write(sheet_name_for(window_start),normalize_calendar(calendar) if typed else calendar)
+                    calendars.append(calendar.assign(origin=origin,destination=destination))
+                print(f"Lowest fares are in {sink.path}...")
+    calendars = pd.concat(calendars,ignore_index=True) if calendars else pd.DataFrame(columns=CALENDAR_COLUMNS+["origin","destination"])
+    #Ver 1.3 --Every route is drilled, also when none of its windows could be searched, flagged dates without a calendar fare are searched anyway.
+    jobs = []
+    for (origin,destination),date_pairs in routes.items():
+        calendar = calendars[(calendars["origin"] == origin) & (calendars["destination"] == destination)]
+        jobs.extend((origin,destination,starting_date,ending_date)
+                    for starting_date,ending_date in flag_dates(calendar,drill_dates,drill_cheapest,date_pairs))
+    outside = [date for date in drill_dates if not any(date == starting_date for date_pairs in routes.values() for starting_date,_ in date_pairs)]
+    if outside:
+        print(f"Flagged dates {', '.join(outside)} are not departures of any query... They are not searched...")
+    if jobs:
+        print(f"Searching {len(jobs)} flagged dates in full...")
+        scrape_jobs(jobs,**options)
+    return calendars
+
+def batch_scraper(queries_path,**options):
+    """
+    Ver 1.3 -- Scrapes every query of a JSONL batch file in one run. The dates of all the routes go through the same engine,
+    so browsers, worker processes, the cache and the checkpoint journal are shared by every route.
+    Dates covered by more than one query are searched once. Options are passed to scrape_jobs.
+
+    Args:
+        queries_path (str): path of the batch file, one {"origin","destination","start_date","end_date","period"} object per line
+    """
+    return scrape_queries(read_queries(queries_path),**options)
+
+def scrape_queries(queries,**options):
+    """
+    Ver 1.3 -- Scrapes the dates of every route query in one run, see batch_scraper. Options are passed to scrape_jobs.
+
+    Args:
+        queries (list): validated queries, see batch_jobs.validate_query
+    """
+    jobs = []
+    for query in queries:
+        jobs.extend((query["origin"],query["destination"],starting_date,ending_date)
+                    for starting_date,ending_date in build_date_pairs(query["start_date"],query["end_date"],query["period"]))
+    jobs = unique_jobs(jobs)
+    print(f"Batch of {len(queries)} queries: {len(jobs)} searches on {len(dict.fromkeys(job[:2] for job in jobs))} routes...")
+    return scrape_jobs(jobs,**options)
+
+def scrape_jobs(all_jobs,max_searches=MAX_SEARCHES_PER_BROWSER,concurrency=1,processes=1,capture=False,
+                output="csv",excel=True,cache=None,journal=None,request_filter=None,metrics_events=None,typed=False,store=None,scheduler=None,
+                rate=None,burst=1,adaptive=False,browser_cache=None,failures=None,retry_rounds=RETRY_ROUNDS,retry_only=False):
+    """
+    Runs the searches of a list of (origin,destination,starting_date,ending_date) jobs, of one or more routes.
+    Stage timings go to METRICS, metrics_events is only passed to the worker processes, the main process is configured by the caller.
+    With a RefreshScheduler only the dates that are due for a refresh are searched, most overdue first.
+    With rate (searches per minute) every engine stays under the rate, worker processes get an equal share of it.
+    With adaptive=True the async engine runs between 1 and concurrency parallel searches, as many as the site answers without timeouts.
+    With a BrowserCache every engine answers the static files of the site from the disk and starts new contexts with the saved storage state.
+    With a FailureQueue dates and carriers that fail are recorded and the run moves on, they are retried in retry_rounds rounds at the end.
+    With retry_only=True only the failed units of the jobs waiting in the queue are searched.
+
+    Returns:
+        int: number of dates written, from the cache or searched
+    """
+    #Ver 1.3 --Results of every date are appended to a streaming sink (csv or parquet) carrier by carrier,
+    #the excel file is exported once at the end of the run instead of being rewritten after every date.
+    #Dates found in the result cache are written from the cache and not searched again.
+    #Dates finished before an interruption are skipped using the checkpoint journal, the run's dates are removed from it once every date is done or queued as failed.
+    writer = ResultWriter(output,cache,journal,typed,store,failures)
+    resumed = []
+    if retry_only:
+        #The jobs are only searched by the retry rounds below.
+        jobs = []
+        retry_rounds = max(1,retry_rounds)
+    else:
+        if scheduler is not None:
+            all_jobs = scheduler.select(all_jobs)
+        jobs = all_jobs
+        if journal is not None:
+            resumed = [job for job in jobs if journal.is_done(job)]
+            jobs = [job for job in jobs if not journal.is_done(job)]
+        jobs = writer.write_cached(jobs)
+    limiter = TokenBucket(rate/60,burst) if rate else None
+    engine = dict(max_searches=max_searches,capture=capture,journal=journal,limiter=limiter,request_filter=request_filter,browser_cache=browser_cache)
+    if retry_only:
+        pass
+    elif not jobs:
+        print("Every date is already in the cache or the checkpoint journal...")
+    elif processes > 1:
+        #Ver 1.3 --With processes above 1 the dates are sharded over worker processes, each with its own browser, so parsing runs on all the cores.
+        #This process only writes the results. Worker processes only checkpoint whole dates, through the writer.
+        blocked_types = request_filter.blocked_types if request_filter is not None else None
+        run_sharded(jobs,processes,scrape_shard,writer,
+                    worker_args=(max_searches,capture,blocked_types,metrics_events,rate/60/processes if rate else None,max(1,burst//processes),
+                                 browser_cache.directory if browser_cache is not None else None))
+    elif concurrency > 1:
+        #Ver 1.3 --With concurrency above 1 the dates are searched in parallel by the async engine, each worker has its own browser context.
+        #Results are written in the order the carriers are read.
+        #Ver 1.3 --One rate limiter is shared by every worker, with adaptive=True the AIMD controller decides how many of them search at a time.
+        controller = AimdController(concurrency) if adaptive else None
+        print(f"Starting Scraper with {'up to ' if adaptive else ''}{concurrency} parallel searches...")
+        asyncio.run(run_search_pool(jobs,concurrency,writer,capture=capture,journal=journal,request_filter=request_filter,
+                                    limiter=limiter,controller=controller,browser_cache=browser_cache))
+    else:
+        run_pipeline(jobs,writer,**engine)
+    if failures is not None and retry_rounds:
+        #Ver 1.3 --Failed dates and carriers don't hold up the run, they are retried after every other date is done.
+        retry_failures(failures,all_jobs if retry_only else jobs,writer,retry_rounds,**engine)
+    print("All searches are now completed...")
+    if request_filter is not None:
+        request_filter.summary()
+    if browser_cache is not None:
+        browser_cache.summary()
+    #Ver 1.3 --Dates that failed are left to the failure queue, the journal is finished once every other date is done.
+    #Only the dates of this run are removed, other interrupted runs sharing the journal can still be resumed.
+    if journal is not None and all(journal.is_done(job) or (failures is not None and failures.queued(job)) for job in all_jobs):
+        journal.finish(all_jobs)
+    for route in dict.fromkeys(job[:2] for job in all_jobs):
+        sink = writer.sink(*route)
+        print(f"Results are in {sink.path}...")
+        if excel:
+            with METRICS.stage("excel",route=f"{route[0]}-{route[1]}"):
+                #Ver 1.3 --Only this run's rows are exported, and the dates written before the run was interrupted.
+                export_excel(sink,[sheet_name_for(job[2]) for job in all_jobs if job[:2] == route],
+                             [sheet_name_for(job[2]) for job in resumed if job[:2] == route])
+    writer.close()
+    METRICS.summary()
+    if failures is not None:
+        failures.report()
+    if excel:
+        print("Please go ahead and check your excel file...")
+    return len(writer.dates)
+
+def run_pipeline(jobs,writer,max_searches=MAX_SEARCHES_PER_BROWSER,capture=False,journal=None,limiter=None,request_filter=None,browser_cache=None,
+                 carriers=None):
+    """
+    Ver 1.3 -- Sequential engine. One browser runs the jobs through the stages of the streaming pipeline, see search_stage.
+
+    Args:
+        jobs (list): (origin,destination,starting_date,ending_date) tuples
+        writer (ResultWriter): writer of the run
+        carriers (dict): job -> carriers to read for the retries of failed carriers, the other jobs are searched in full
+    """
+    ## First we initiate our page object from playwright.
+    ## Ver 1.3 --The browser is launched once for the whole date range by BrowserManager, it is only relaunched if it stops responding
+    ## or after max_searches searches.
+    ## Ver 1.3 --The request filter blocks the resources we don't need and measures the transfer and time of every search.
+    with sync_playwright() as p, BrowserManager(p,headless=True,max_searches=max_searches,request_filter=request_filter,
+                                                browser_cache=browser_cache) as manager:
+        #Ver 1.3 --The date is streamed through the pipeline stages, every carrier is written before the next one is clicked.
+        parts = search_stage(manager,jobs,capture=capture,journal=journal,limiter=limiter,request_filter=request_filter,carriers=carriers)
+        sink_stage(normalize_stage(parts,writer),writer)
+
+def retry_failures(failures,jobs,writer,rounds=RETRY_ROUNDS,**engine):
+    """
+    Ver 1.3 -- Deferred retries of the failure queue. Every round searches the failed units of the jobs that have attempts left once,
+    whole dates again and only the failed carriers of the other dates, with the sequential engine since there are only a few of them.
+    A unit that fails again costs an attempt, so a date that never loads is given up after max_attempts and doesn't stall any run.
+
+    Args:
+        failures (FailureQueue): failure queue of the run
+        jobs (list): jobs of the run, failures of other jobs are left for their own runs
+        writer (ResultWriter): writer of the run
+        rounds (int): number of retry rounds
+        engine: options of run_pipeline
+    """
+    for round_number in range(1,rounds+1):
+        units = failures.due(jobs)
+        if not units:
+            return
+        print(f"Retry round {round_number}/{rounds}: {len(units)} failed searches...")
+        writer.retry(units)
+        run_pipeline([job for job,_ in units],writer,carriers={job:carriers for job,carriers in units if carriers is not None},**engine)
+    writer.retry([])
+
+def retry_failed(**options):
+    """
+    Ver 1.3 -- Retries the dates and carriers left in the failure queue by earlier runs without searching anything else.
+    Options are passed to scrape_jobs, options["failures"] is the queue.
+
+    Returns:
+        int: number of dates written
+    """
+    units = options["failures"].due()
+    if not units:
+        print("No failed searches are waiting for a retry...")
+        options["failures"].report()
+        return 0
+    return scrape_jobs([job for job,_ in units],retry_only=True,**options)
+
+def run(args):
+    """
+    Ver 1.3 -- Runs the scraper with the validated command line arguments, args.queries holds the route queries.
+    """
+    cache = FareCache(args.cache_path,ttl=args.cache_ttl*3600,max_entries=args.cache_max_entries) if args.cache_ttl > 0 else None
+    if args.fresh and path.exists(args.checkpoint):
+        remove(args.checkpoint)
+    journal = CheckpointJournal(args.checkpoint)
+    store = FareStore(args.store) if not args.no_store else None
+    request_filter = None
+    if not args.no_request_filter:
+        request_filter = RequestFilter([resource_type for resource_type in args.block_types.split(",") if resource_type])
+    METRICS.configure(events_path=args.metrics_events,prometheus_path=args.metrics_file,port=args.metrics_port)
+    options = dict(max_searches=args.max_searches,concurrency=args.concurrency,processes=args.processes,capture=args.capture_responses,
+                   output=args.output,excel=not args.no_excel,cache=cache,journal=journal,request_filter=request_filter,
+                   metrics_events=args.metrics_events,typed=args.schema == "typed",store=store,
+                   scheduler=RefreshScheduler(store,args.budget) if args.schedule else None,
+                   rate=args.rate,burst=args.burst,adaptive=args.adaptive,
+                   browser_cache=BrowserCache(args.browser_cache_path) if args.browser_cache else None,
+                   failures=FailureQueue(args.failures,max_attempts=args.max_attempts),retry_rounds=args.retry_rounds)
+    if args.retry_failures:
+        retry_failed(**options)
+    elif args.calendar:
+        calendar_scraper(args.queries,drill_dates=args.drill,drill_cheapest=args.drill_cheapest,**options)
+    elif args.batch is not None:
+        scrape_queries(args.queries,**options)
+    else:
+        flight_data_scraper(**args.queries[0],**options)
+    journal.close()
+    METRICS.close()
+    if store is not None:
+        store.close()
+    if cache is not None:
+        cache.close()
+
+
+#Ver 1.3 --The prompts only run when the file is executed as a script without a route, worker processes import this file without asking anything.
+#matrix_scraper.py is the non-interactive entry point with the same options.
+if __name__ == "__main__":
+    args = parse_arguments(interactive=True)
+    if args.queries is None:
+        query = {"origin":origin_input(),"destination":destination_input(),"start_date":start_date_input(),"end_date":end_date_input(),
+                 "period":period_input()}
+        try:
+            args.queries = [validate_query(query,"input")]
+        except ValueError as error:
+            raise SystemExit(f"Invalid search, {error}")
+    run(args)
@@ -0,0 +1,143 @@
+import argparse
+import importlib.util
+import sys
+from datetime import datetime
+from os import path
+from batch_jobs import read_queries,validate_query
+from checkpoint import CHECKPOINT_PATH
+from request_filter import BLOCKED_RESOURCE_TYPES
+from settings import (CACHE_PATH,CACHE_TTL_HOURS,CACHE_MAX_ENTRIES,STORE_PATH,MAX_SEARCHES_PER_BROWSER,OUTPUT_FORMATS,BROWSER_CACHE_PATH,
+                      FAILURES_PATH,MAX_ATTEMPTS,RETRY_ROUNDS)
+
+#Ver 1.3 --Non-interactive entry point of the scraper: python -m matrix_scraper --origin IST --destination JFK --start-date 01/10/27 ...
+#Only light modules are imported here. Arguments and queries are validated first, pandas, bs4 and playwright are only imported
+#with the scraper once the run starts, so a cron job with a bad query fails in milliseconds.
+
+SCRAPER_PATH = path.join(path.dirname(path.abspath(__file__)),"flight_data_scraperv1.2.py")
+
+
+def load_scraper():
+    """
+    This function imports the scraper script. Its file name has a dot in it, so it is loaded from the path and registered
+    under an importable name, worker processes of the process pool find it the same way.
+    """
+    name = "flight_data_scraperv1_2"
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name,SCRAPER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_arguments(argv=None,interactive=False):
+    """
+    Ver 1.3 -- Command line options. The route is given with --origin, --destination, --start-date, --end-date and --period or
+    with a --batch file. Every query is validated here, before the scraper and its heavy imports are loaded.
+
+    Args:
+        argv (list): arguments, sys.argv if None
+        interactive (bool): the route can be left out and asked with the input prompts of the script
+
+    Returns:
+        argparse.Namespace: parsed arguments, queries holds the validated route queries (None if they are asked with the prompts)
+    """
+    parser = argparse.ArgumentParser(description="Scrapes flight prices from ITA Matrix into an excel file.")
+    parser.add_argument("--origin",help="origin airport, 3 char IATA code")
+    parser.add_argument("--destination",help="destination airport, 3 char IATA code")
+    parser.add_argument("--start-date",metavar="MM/DD/YY",help="departure of the first search")
+    parser.add_argument("--end-date",metavar="MM/DD/YY",help="return of the first search, every search has the same trip length")
+    parser.add_argument("--period",type=int,default=0,help="number of days searched after the start date (default: 0)")
+    parser.add_argument("--concurrency",type=int,default=1,help="number of dates searched in parallel (default: 1)")
+    parser.add_argument("--processes",type=int,default=1,help="number of worker processes, each with its own browser (default: 1)")
+    parser.add_argument("--capture-responses",action="store_true",help="read the results from the search response instead of clicking every carrier")
+    parser.add_argument("--rate",type=float,help="maximum searches per minute of the whole run, shared by every worker (default: no limit)")
+    parser.add_argument("--burst",type=int,default=1,help="searches that can start at once under --rate after a quiet spell (default: 1)")
+    parser.add_argument("--adaptive",action="store_true",
+                        help="with --concurrency, raise the parallel searches while the site answers fast and halve them when searches time out")
+    parser.add_argument("--max-searches",type=int,default=MAX_SEARCHES_PER_BROWSER,help="relaunch the browser after this many searches, 0 never relaunches")
+    parser.add_argument("--block-types",default=",".join(sorted(BLOCKED_RESOURCE_TYPES)),
+                        help="comma separated resource types answered without loading them, empty only measures (default: %(default)s)")
+    parser.add_argument("--no-request-filter",action="store_true",help="load every resource and third party host like a normal browser")
+    parser.add_argument("--browser-cache",action="store_true",
+                        help="keep the site's files and storage state on disk, shared by every browser, worker and run, cleared when the site changes")
+    parser.add_argument("--browser-cache-path",default=BROWSER_CACHE_PATH,help=f"directory of the browser cache (default: {BROWSER_CACHE_PATH})")
+    parser.add_argument("--output",choices=OUTPUT_FORMATS,default=OUTPUT_FORMATS[0],help="format the results are streamed to while scraping (default: %(default)s)")
+    parser.add_argument("--schema",choices=["raw","typed"],default="raw",
+                        help="raw keeps the table columns as text, typed writes prices in minor units, minutes, datetimes and categoricals (default: raw)")
+    parser.add_argument("--store",default=STORE_PATH,help=f"SQLite fare store every scrape is added to, query it with fare_store.py (default: {STORE_PATH})")
+    parser.add_argument("--no-store",action="store_true",help="don't add the scraped rows to the fare store")
+    parser.add_argument("--schedule",action="store_true",
+                        help="only search the dates due for a refresh by their distance and price volatility in the fare store, most overdue first")
+    parser.add_argument("--budget",type=int,help="with --schedule, maximum number of searches of the run")
+    parser.add_argument("--no-excel",action="store_true",help="skip the excel export at the end of the run")
+    parser.add_argument("--cache-ttl",type=float,default=CACHE_TTL_HOURS,help=f"hours a cached result is reused, 0 disables the cache (default: {CACHE_TTL_HOURS})")
+    parser.add_argument("--cache-path",default=CACHE_PATH,help=f"SQLite file of the result cache (default: {CACHE_PATH})")
+    parser.add_argument("--checkpoint",default=CHECKPOINT_PATH,help=f"journal of finished dates and carriers used to resume an interrupted run (default: {CHECKPOINT_PATH})")
+    parser.add_argument("--fresh",action="store_true",help="ignore the checkpoint journal of an interrupted run and start from scratch")
+    parser.add_argument("--cache-max-entries",type=int,default=CACHE_MAX_ENTRIES,help="least recently used results above this are evicted")
+    parser.add_argument("--failures",default=FAILURES_PATH,help=f"failure queue of the dates and carriers that failed (default: {FAILURES_PATH})")
+    parser.add_argument("--max-attempts",type=int,default=MAX_ATTEMPTS,help=f"failed attempts after which a date or carrier is given up (default: {MAX_ATTEMPTS})")
+    parser.add_argument("--retry-rounds",type=int,default=RETRY_ROUNDS,
+                        help=f"retries of the failed dates and carriers at the end of the run, 0 leaves them for --retry-failures (default: {RETRY_ROUNDS})")
+    parser.add_argument("--retry-failures",action="store_true",help="only retry the dates and carriers waiting in the failure queue")
+    parser.add_argument("--metrics-events",metavar="FILE",help="JSONL file every stage timing, retry and outcome is appended to")
+    parser.add_argument("--metrics-file",metavar="FILE",help="file the stage totals are written to in the Prometheus text format")
+    parser.add_argument("--metrics-port",type=int,help="serves the stage totals on http://127.0.0.1:PORT/metrics while scraping")
+    parser.add_argument("--batch",metavar="FILE",help="JSONL file of queries, one route and date window per line, scraped in one run without the prompts")
+    parser.add_argument("--calendar",action="store_true",
+                        help="search the calendar of lowest fares, one search per 30 departures, and only search the --drill dates in full")
+    parser.add_argument("--drill",metavar="DATES",default="",help="with --calendar, comma separated departures (MM/DD/YY) searched in full")
+    parser.add_argument("--drill-cheapest",type=int,default=0,metavar="N",help="with --calendar, also search the N cheapest departures of every route in full")
+    args = parser.parse_args(argv)
+    route = (args.origin,args.destination,args.start_date,args.end_date)
+    if args.retry_failures:
+        if args.batch is not None or any(route) or args.calendar:
+            parser.error("--retry-failures takes the searches from the failure queue, it can't be used with a route, --batch or --calendar")
+        args.queries = []
+    elif args.batch is not None:
+        if any(route):
+            parser.error("give the route either with --batch or with --origin/--destination/--start-date/--end-date")
+        try:
+            args.queries = read_queries(args.batch)
+        except OSError as error:
+            parser.error(f"can't read the batch file, {error}")
+        if not args.queries:
+            parser.error(f"{args.batch} has no queries")
+    elif any(route) or not interactive:
+        try:
+            args.queries = [validate_query({"origin":args.origin,"destination":args.destination,"start_date":args.start_date,
+                                            "end_date":args.end_date,"period":args.period},"arguments")]
+        except ValueError as error:
+            parser.error(str(error))
+    else:
+        args.queries = None
+    if args.schedule and args.no_store:
+        parser.error("--schedule needs the fare store, it can't be used with --no-store")
+    try:
+        args.drill = [datetime.strptime(date,"%m/%d/%y").strftime("%m/%d/%Y") for date in args.drill.split(",") if date.strip()]
+    except ValueError:
+        parser.error("--drill dates have to be in MM/DD/YY format")
+    if (args.drill or args.drill_cheapest) and not args.calendar:
+        parser.error("--drill and --drill-cheapest need --calendar")
+    if args.calendar and args.schedule:
+        parser.error("--schedule picks single dates, it can't be used with --calendar")
+    if args.max_attempts < 1 or args.retry_rounds < 0:
+        parser.error("--max-attempts has to be at least 1 and --retry-rounds can't be negative")
+    if args.adaptive and args.concurrency < 2:
+        parser.error("--adaptive needs --concurrency above 1, it is the highest number of parallel searches")
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    load_scraper().run(args)
+
+
+#Worker processes of --processes import this file as their main module, the scraper functions they run are looked up in the loaded script.
+if __name__ == "__mp_main__":
+    load_scraper()
+
+if __name__ == "__main__":
+    main()
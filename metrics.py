@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+
+#Ver 1.3 --Labels of the search running in the current thread or async task (route, date), added to every event.
+#A ContextVar keeps them apart for parallel async workers.
+LABELS = ContextVar("metrics_labels",default={})
+#The prometheus file is rewritten at most this often while scraping, and once more when the run finishes.
+PROMETHEUS_INTERVAL = 5
+
+
+class Stage:
+    """
+    Times one stage with a monotonic clock. The outcome is "ok", the name of the exception that ended the stage,
+    or whatever the caller sets, e.g. "timeout" for the waits that return True on error.
+    """
+
+    def __init__(self,metrics,name,tags):
+        self.metrics = metrics
+        self.name = name
+        self.tags = tags
+        self.outcome = "ok"
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self,exc_type,exc,traceback):
+        if exc_type is not None and self.outcome == "ok":
+            self.outcome = exc_type.__name__
+        self.metrics.record(self.name,time.monotonic() - self.started,self.outcome,self.tags)
+        return False
+
+
+class Metrics:
+    """
+    Ver 1.3 -- Timings of every stage of a run (browser launch, page load, form fill, search, table waits, carrier clicks, parsing,
+    output writes) with retry counters and outcome tags. Every finished stage can be written as one JSON line to an events file,
+    the totals per stage and outcome can be exported in the Prometheus text format to a file and/or a local /metrics endpoint.
+    Without configure() stages are still timed but nothing is written.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = None
+        self.prometheus_path = None
+        self.server = None
+        self.written_at = 0
+        self.totals = {}
+        self.retries = {}
+
+    def configure(self,events_path=None,prometheus_path=None,port=None):
+        """
+        Args:
+            events_path (str): JSONL file the events are appended to
+            prometheus_path (str): file rewritten with the totals in the Prometheus text format
+            port (int): serves the totals on http://127.0.0.1:port/metrics
+        """
+        if events_path is not None:
+            #Line buffered and opened for appending, so worker processes can write to the same file line by line.
+            self.events = open(events_path,"a",encoding="utf-8",buffering=1)
+        self.prometheus_path = prometheus_path
+        if port is not None:
+            self.serve(port)
+
+    def bind(self,**labels):
+        """
+        This function sets the labels of the current search, e.g. route and date, for the following events.
+        """
+        LABELS.set(labels)
+
+    def stage(self,name,**tags):
+        """
+        Returns:
+            Stage: context manager timing the stage
+        """
+        return Stage(self,name,tags)
+
+    def record(self,name,seconds,outcome="ok",tags=None):
+        with self.lock:
+            total = self.totals.setdefault((name,outcome),[0,0.0])
+            total[0] += 1
+            total[1] += seconds
+        self.emit({"event":"stage","stage":name,"seconds":round(seconds,4),"outcome":outcome,**(tags or {})})
+
+    def retry(self,name,**tags):
+        """
+        This function counts a retry of a stage.
+        """
+        with self.lock:
+            self.retries[name] = self.retries.get(name,0) + 1
+        self.emit({"event":"retry","stage":name,**tags})
+
+    def emit(self,event):
+        if self.events is not None:
+            line = json.dumps({"ts":round(time.time(),3),"pid":os.getpid(),**LABELS.get(),**event},default=str)
+            with self.lock:
+                self.events.write(line + "\n")
+        if self.prometheus_path is not None and time.monotonic() - self.written_at > PROMETHEUS_INTERVAL:
+            self.write_prometheus()
+
+    def prometheus_text(self):
+        """
+        Returns:
+            str: totals in the Prometheus text exposition format
+        """
+        with self.lock:
+            totals = sorted(self.totals.items())
+            retries = sorted(self.retries.items())
+        lines = ["# HELP scraper_stage_seconds Time spent in every stage of the scraper.",
+                 "# TYPE scraper_stage_seconds summary"]
+        for (name,outcome),(count,seconds) in totals:
+            lines.append(f'scraper_stage_seconds_count{{stage="{name}",outcome="{outcome}"}} {count}')
+            lines.append(f'scraper_stage_seconds_sum{{stage="{name}",outcome="{outcome}"}} {seconds:.4f}')
+        lines += ["# HELP scraper_retries_total Retries of every stage of the scraper.",
+                  "# TYPE scraper_retries_total counter"]
+        for name,count in retries:
+            lines.append(f'scraper_retries_total{{stage="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        self.written_at = time.monotonic()
+        #Written to a temporary file and renamed, so a collector never reads half a file.
+        temporary = self.prometheus_path + ".tmp"
+        with open(temporary,"w",encoding="utf-8") as output:
+            output.write(self.prometheus_text())
+        os.replace(temporary,self.prometheus_path)
+
+    def serve(self,port):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self,*args):
+                pass
+
+            def do_GET(self):
+                body = metrics.prometheus_text().encode()
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type","text/plain; version=0.0.4")
+                self.send_header("Content-Length",str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1",port),Handler)
+        threading.Thread(target=self.server.serve_forever,daemon=True).start()
+        print(f"Metrics are served on http://127.0.0.1:{port}/metrics...")
+
+    def summary(self):
+        """
+        This function prints the total time and count of every stage, the slowest stages first.
+        """
+        with self.lock:
+            totals = {}
+            for (name,outcome),(count,seconds) in self.totals.items():
+                total = totals.setdefault(name,[0,0.0,0])
+                total[0] += count
+                total[1] += seconds
+                if outcome != "ok":
+                    total[2] += count
+        if not totals:
+            return
+        print("Time per stage:")
+        for name,(count,seconds,failed) in sorted(totals.items(),key=lambda item: -item[1][1]):
+            print(f"  {name}: {seconds:.1f}s in {count} runs ({failed} failed, {self.retries.get(name,0)} retries)")
+
+    def close(self):
+        if self.prometheus_path is not None:
+            self.write_prometheus()
+        if self.events is not None:
+            self.events.close()
+            self.events = None
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+
+#Shared by every module of the process, like the adaptive timeouts.
+METRICS = Metrics()
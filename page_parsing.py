@@ -0,0 +1,151 @@
+from io import StringIO
+from bs4 import BeautifulSoup,SoupStrainer
+import pandas as pd
+
+#Ver 1.3 --Only the upper table is parsed out of the page, the rest of the document is skipped by the parser.
+UPPER_TABLE_STRAINER = SoupStrainer("mat-table",attrs={"role":"table"})
+#Key of the fare matrix in the attrs of the dataframe of a date, it travels with the rows through every engine to the writer.
+#It is kept as a list of dicts, pandas compares attrs when it combines frames and that doesn't work with a dataframe.
+FARE_MATRIX_ATTR = "fare_matrix"
+FARE_MATRIX_COLUMNS = ["carrier","stops","lowest_price"]
+
+#Ver 1.3 --Runs inside the page and returns only the upper table, header texts are returned unchanged since they are used to find the carrier logos.
+UPPER_TABLE_SCRIPT = """
+() => {
+    const table = document.querySelector('mat-table[role="table"]');
+    if (!table) {
+        return null;
+    }
+    const header = table.querySelector("mat-header-row");
+    const carriers = header ? Array.from(header.querySelectorAll("mat-header-cell"), (cell) => cell.textContent) : [];
+    const rows = Array.from(table.querySelectorAll("mat-row"), (row) => Array.from(row.querySelectorAll("mat-cell"), (cell) => cell.textContent.trim()));
+    return {carriers: carriers, rows: rows};
+}
+"""
+
+
+def parse_upper_table(page_content):
+    """
+    This function parses the upper table of the results page. When we click the carrier names/images in the upper table
+    we get a seperate table that only includes their prices, so we collect their names in carriers list.
+    Ver 1.3 -- Only the mat-table is parsed with a SoupStrainer instead of building a tree of the whole page, and the cells are kept
+    row by row so the fare matrix can be built from them.
+
+    Args:
+        page_content (str): html of the results page
+
+    Returns:
+        carriers,rows: carrier names from the header row and the text of the cells of every row
+    """
+    soup = BeautifulSoup(page_content,"lxml",parse_only=UPPER_TABLE_STRAINER)
+    upper_table_content = soup.find("mat-table",attrs={"role":"table"})
+    headers = upper_table_content.find("mat-header-row")
+    carriers = [header_cell.text for header_cell in headers.find_all("mat-header-cell")]
+    rows = [[cell.text.strip() for cell in row.find_all("mat-cell")] for row in upper_table_content.find_all("mat-row")]
+    return carriers,rows
+
+
+def fare_matrix(carriers,rows):
+    """
+    Ver 1.3 -- This function turns the upper table into the lowest fare of every carrier for every stop count.
+    The first column of a row is its stop count (e.g. Nonstop, 1 stop) and the first header is the label of that column.
+
+    Args:
+        carriers (list): header texts of the upper table
+        rows (list): cell texts of every row
+
+    Returns:
+        list: {"carrier","stops","lowest_price"} dicts for every filled cell
+    """
+    records = []
+    for row in rows:
+        if not row:
+            continue
+        for carrier,price in zip(carriers[1:],row[1:]):
+            if price:
+                records.append(dict(zip(FARE_MATRIX_COLUMNS,(carrier.strip(),row[0],price))))
+    return records
+
+
+def parse_carrier_table(page_content,starting_date=None,ending_date=None):
+    """
+    This function reads the itinerary table that is shown after clicking a carrier and adds the searched dates to every row.
+    Ver 1.3 -- Dates are only added if they are given, the RowCollector adds them once for the whole date.
+
+    Args:
+        page_content (str): html of the results page
+        starting_date (str): start date
+        ending_date (str): end date
+
+    Returns:
+        pandas.DataFrame: rows of the carrier table
+    """
+    df = pd.read_html(StringIO(page_content),attrs = {"role":"table"})
+    df = df[0]
+    df = df[df["Airline filter_alt"].notnull()]
+    if starting_date is not None:
+        df["start_date"] = starting_date
+        df["end_date"] = ending_date
+    return df
+
+
+#Ver 1.3 --Runs inside the page and returns only the carrier table as JSON, so we don't need to serialize the whole page with page.content()
+#and parse it again for every carrier. Header and cell texts are whitespace normalized the same way read_html does it, empty cells come back as null.
+CARRIER_TABLE_SCRIPT = """
+() => {
+    const table = document.querySelector('table[role="table"]');
+    if (!table) {
+        return null;
+    }
+    const text = (element) => element.textContent.replace(/\\s+/g, " ").trim();
+    const headerRow = table.querySelector("thead tr");
+    const columns = headerRow ? Array.from(headerRow.querySelectorAll("th,td"), text) : [];
+    const bodyRows = table.tBodies.length ? Array.from(table.tBodies).flatMap((body) => Array.from(body.rows)) : Array.from(table.rows).slice(1);
+    const rows = bodyRows.map((row) => Array.from(row.cells, (cell) => text(cell) || null));
+    return {columns: columns, rows: rows};
+}
+"""
+
+
+def table_rows(table):
+    """
+    This function filters the rows of the JSON returned by CARRIER_TABLE_SCRIPT the same way parse_carrier_table does.
+    Rows with a different number of cells (spanning rows like "show more") are not itineraries, rows without an airline are dropped too.
+
+    Args:
+        table (dict): {"columns": [...], "rows": [[...], ...]} returned from page.evaluate
+
+    Returns:
+        columns,rows: column names and the itinerary rows
+    """
+    columns = table["columns"]
+    airline = columns.index("Airline filter_alt")
+    rows = [row for row in table["rows"] if len(row) == len(columns) and row[airline] is not None]
+    return columns,rows
+
+
+def dataframe_rows(df):
+    """
+    This function turns a carrier dataframe into plain column names and row lists, missing values become None.
+
+    Args:
+        df (pandas.DataFrame): carrier table
+
+    Returns:
+        columns,rows: column names and row lists
+    """
+    values = df.astype(object).where(df.notnull(),None)
+    return [str(column) for column in df.columns],values.values.tolist()
+
+
+def sheet_name_for(starting_date):
+    """
+    This function generates the excel sheet name for a search, dots are used since excel does not accept slashes.
+
+    Args:
+        starting_date (str): start date in MM/DD/YYYY format
+
+    Returns:
+        str: sheet name
+    """
+    return starting_date.replace("/",".")
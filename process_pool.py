@@ -0,0 +1,76 @@
+import multiprocessing
+import queue
+
+
+def shard_jobs(jobs,processes):
+    """
+    This function splits the jobs into one shard per process. Jobs are dealt out in turns so every shard gets near and far dates alike.
+
+    Args:
+        jobs (list): (origin,destination,starting_date,ending_date) tuples
+        processes (int): number of worker processes
+
+    Returns:
+        list: list of shards, empty shards are left out
+    """
+    shards = [jobs[index::processes] for index in range(processes)]
+    return [shard for shard in shards if shard]
+
+
+def _run_shard(worker,shard,results,worker_args):
+    """
+    Entry point of a worker process. Runs the worker over its shard and puts None on the queue when it is finished,
+    so the writer knows the process did not die halfway.
+    """
+    try:
+        worker(shard,results,*worker_args)
+    finally:
+        results.put(None)
+
+
+def run_sharded(jobs,processes,worker,on_result,worker_args=()):
+    """
+    This function runs the jobs on several processes, every process owns its own playwright instance and browser and parses the pages itself,
+    so html parsing is not limited to a single core. Results are streamed back over a queue and handed to on_result in this process,
+    which stays the only writer of the output files.
+
+    Args:
+        jobs (list): (origin,destination,starting_date,ending_date) tuples
+        processes (int): number of worker processes
+        worker (callable): top level function called as worker(shard,results,*worker_args) in the child process,
+            it has to put one tuple on results for every finished job
+        on_result (callable): called with the tuples put by the workers
+        worker_args (tuple): extra arguments for the worker
+
+    Returns:
+        int: number of results received
+    """
+    #Playwright starts its own threads, so the workers are spawned instead of forked.
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue(maxsize=processes*4)
+    shards = shard_jobs(jobs,processes)
+    workers = [context.Process(target=_run_shard,args=(worker,shard,results,tuple(worker_args)),daemon=True) for shard in shards]
+    for process in workers:
+        process.start()
+    print(f"Started {len(workers)} worker processes for {len(jobs)} searches...")
+
+    received = 0
+    finished = 0
+    while finished < len(workers):
+        try:
+            item = results.get(timeout=5)
+        except queue.Empty:
+            if not any(process.is_alive() for process in workers):
+                print("All worker processes stopped before finishing their shards...")
+                break
+            continue
+        if item is None:
+            finished += 1
+            continue
+        on_result(*item)
+        received += 1
+
+    for process in workers:
+        process.join()
+    print(f"Received {received} of {len(jobs)} results from the worker processes...")
+    return received
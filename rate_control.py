@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from metrics import METRICS
+
+
+class TokenBucket:
+    """
+    Ver 1.3 -- Rate limiter shared by every worker of a run. A search takes a token, tokens come back at rate per second
+    up to burst, so short bursts are allowed but the average never goes above the rate.
+
+    Args:
+        rate (float): searches per second
+        burst (int): tokens that can be saved up
+    """
+
+    def __init__(self,rate,burst=1):
+        self.rate = rate
+        self.burst = max(1,burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        This function takes a token and returns how long the caller has to wait before using it.
+        Tokens can go negative, so waiting callers are served in the order they came.
+
+        Returns:
+            float: seconds to wait
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def acquire_async(self):
+        await asyncio.sleep(self.reserve())
+
+
+class AimdController:
+    """
+    Ver 1.3 -- Additive increase, multiplicative decrease control of the number of parallel searches, like TCP congestion control.
+    Every healthy search raises the limit by increase/limit (about +increase per round of searches), a timeout or a search much slower
+    than the best seen cuts it by decrease. After a cut the next one waits for a round of searches, so one slow spell of the site
+    doesn't collapse the limit to the minimum.
+
+    Args:
+        maximum (int): highest limit, the --concurrency option
+        initial (int): starting limit
+        minimum (int): lowest limit
+        increase (float): added to the limit per round of healthy searches
+        decrease (float): factor of the limit after a congestion signal
+        latency_factor (float): a search slower than this times the best average latency counts as congestion
+    """
+
+    def __init__(self,maximum,initial=2,minimum=1,increase=1,decrease=0.5,latency_factor=2):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(max(minimum,min(initial,maximum)))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.average = None
+        self.best = None
+        self.since_cut = 0
+        self.active = 0
+        self.timeouts = 0
+        self.changed = None
+
+    def success(self,seconds):
+        """
+        This function records the latency of a search that loaded without a timeout.
+        """
+        self.average = seconds if self.average is None else 0.8 * self.average + 0.2 * seconds
+        self.since_cut += 1
+        #The best average is only trusted after a few searches.
+        if self.since_cut >= 3:
+            self.best = self.average if self.best is None else min(self.best,self.average)
+        if self.best is not None and seconds > self.latency_factor * self.best:
+            self.congestion(f"search took {seconds:.1f}s")
+            return
+        previous = int(self.limit)
+        self.limit = min(self.maximum,self.limit + self.increase / self.limit)
+        if int(self.limit) > previous:
+            METRICS.emit({"event":"concurrency","limit":int(self.limit),"reason":"healthy"})
+            self.notify()
+
+    def timeout(self):
+        """
+        This function records a search that timed out.
+        """
+        self.timeouts += 1
+        self.congestion("timeout")
+
+    def congestion(self,reason):
+        if self.since_cut < self.limit:
+            return
+        previous = int(self.limit)
+        self.limit = max(self.minimum,self.limit * self.decrease)
+        self.since_cut = 0
+        if int(self.limit) < previous:
+            print(f"Congestion ({reason})... Parallel searches {previous} -> {int(self.limit)}...")
+            METRICS.emit({"event":"concurrency","limit":int(self.limit),"reason":reason})
+
+    def notify(self):
+        if self.changed is not None:
+            self.changed.set()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Async context manager a worker holds while it searches, it waits while the limit of parallel searches is reached.
+        """
+        if self.changed is None:
+            self.changed = asyncio.Event()
+        while self.active >= int(self.limit):
+            self.changed.clear()
+            await self.changed.wait()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.notify()
@@ -0,0 +1,166 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+#Ver 1.3 --Hard limits of the time spent on one date (search and retries) and on one carrier, in seconds.
+DATE_BUDGET = 180
+CARRIER_BUDGET = 45
+
+#Returns the number of rows in a table and the text of its first row, used to see if the table is still changing
+#and if it is not the table of the previous carrier anymore.
+TABLE_STATE_SCRIPT = """
+(selector) => {
+    const table = document.querySelector(selector);
+    if (!table) {
+        return null;
+    }
+    const rows = table.querySelectorAll("tbody tr, mat-row");
+    return {rows: rows.length, first: rows.length ? rows[0].textContent.trim() : ""};
+}
+"""
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised when a date or a carrier used up its time budget.
+    """
+
+
+class Budget:
+    """
+    Ver 1.3 -- Deadline of a date or a carrier. Waits are cut to the time that is left, so a bad date or carrier can't keep a worker busy forever.
+
+    Args:
+        seconds (float): time budget
+        label (str): name used in the error message
+    """
+
+    def __init__(self,seconds,label):
+        self.seconds = seconds
+        self.label = label
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def check(self):
+        """
+        Raises:
+            BudgetExceeded: if the budget is used up
+        """
+        if self.remaining() <= 0:
+            raise BudgetExceeded(f"{self.label} took more than {self.seconds}s")
+
+    def cap(self,timeout):
+        """
+        This function cuts a timeout in seconds to the time that is left and raises if nothing is left.
+        """
+        self.check()
+        return min(timeout,self.remaining())
+
+
+class AdaptiveTimeout:
+    """
+    Ver 1.3 -- Timeout learned from the latencies of the recent successful waits instead of a fixed 10 seconds.
+    The timeout is factor times the 90th percentile of the last window latencies, kept between minimum and maximum.
+
+    Args:
+        initial (float): timeout in seconds until enough latencies are recorded
+        minimum (float): lower limit in seconds
+        maximum (float): upper limit in seconds
+        factor (float): safety factor over the 90th percentile
+        window (int): number of latencies kept
+    """
+
+    def __init__(self,initial=10,minimum=2,maximum=30,factor=2,window=50):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.latencies = deque(maxlen=window)
+
+    def record(self,seconds):
+        self.latencies.append(seconds)
+
+    def percentile(self,fraction):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1,int(fraction * len(ordered)))]
+
+    def current(self):
+        """
+        Returns:
+            float: timeout in seconds
+        """
+        if len(self.latencies) < 5:
+            return self.initial
+        return max(self.minimum,min(self.maximum,self.factor * self.percentile(0.9)))
+
+
+#Ver 1.3 --Timeouts of the search and carrier tables, shared by every search of the process and learned from the recent waits.
+SEARCH_TIMEOUT = AdaptiveTimeout(initial=10,minimum=3,maximum=40)
+CARRIER_TIMEOUT = AdaptiveTimeout(initial=10,minimum=2,maximum=30)
+UPPER_TABLE_SELECTOR = 'mat-table[role="table"]'
+CARRIER_TABLE_SELECTOR = 'table[role="table"]'
+
+
+def backoff_delay(attempt,base=0.5,maximum=8):
+    """
+    This function returns the wait before the next retry, exponential in the attempt number with full jitter
+    so parallel workers don't retry at the same moment.
+
+    Args:
+        attempt (int): number of failed attempts so far, starting from 1
+
+    Returns:
+        float: seconds to wait
+    """
+    return random.uniform(0,min(maximum,base * 2 ** (attempt - 1)))
+
+
+def wait_for_stable_table(page,selector,timeout,previous=None,interval=0.25,stable_checks=3):
+    """
+    This function waits until the table is on the page, is not the table of the previous carrier anymore
+    and its row count did not change for stable_checks checks in a row.
+
+    Args:
+        page (playwright.page): page object
+        selector (str): css selector of the table
+        timeout (float): seconds to wait
+        previous (dict): state of the table before the click, None if there was no table
+        interval (float): seconds between checks
+        stable_checks (int): number of equal checks needed
+
+    Returns:
+        dict: final state of the table, None if it did not get ready within the timeout
+    """
+    deadline = time.monotonic() + timeout
+    last = None
+    equal = 0
+    while time.monotonic() < deadline:
+        state = page.evaluate(TABLE_STATE_SCRIPT,selector)
+        if state is not None and state["rows"] > 0 and state != previous:
+            equal = equal + 1 if state == last else 0
+            if equal >= stable_checks - 1:
+                return state
+        last = state
+        page.wait_for_timeout(interval * 1000)
+    return None
+
+
+async def wait_for_stable_table_async(page,selector,timeout,previous=None,interval=0.25,stable_checks=3):
+    """
+    Async version of wait_for_stable_table.
+    """
+    deadline = time.monotonic() + timeout
+    last = None
+    equal = 0
+    while time.monotonic() < deadline:
+        state = await page.evaluate(TABLE_STATE_SCRIPT,selector)
+        if state is not None and state["rows"] > 0 and state != previous:
+            equal = equal + 1 if state == last else 0
+            if equal >= stable_checks - 1:
+                return state
+        last = state
+        await asyncio.sleep(interval)
+    return None
@@ -0,0 +1,327 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime,timedelta
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from urllib.parse import urlparse,parse_qs
+
+#Ver 1.3 --Local stand-in for matrix.itasoftware.com used by benchmark.py, so the scraper can be measured without the real site.
+#The page has the same search form, upper mat-table and carrier tables the scraper reads, rendered from a search payload in the same
+#format as the backend response. Payloads are generated from the route and date, or replayed from a recorded response body.
+
+CARRIERS = [("TK","Turkish Airlines"),("LH","Lufthansa"),("AF","Air France"),("KL","KLM"),("BA","British Airways"),("UA","United"),
+            ("DL","Delta"),("AA","American Airlines"),("QR","Qatar Airways"),("EK","Emirates"),("LX","Swiss"),("OS","Austrian")]
+HUBS = ["FRA","MUC","CDG","AMS","LHR","DOH","DXB","ZRH","VIE"]
+#Logos are answered with a 1x1 gif.
+LOGO_GIF = bytes.fromhex("47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b")
+
+PAGE = """<!doctype html>
+<html>
+<head><meta charset="utf-8"><title>Matrix replay</title></head>
+<body>
+<form id="search" onsubmit="return false">
+  <mat-chip-grid id="origin-chips"></mat-chip-grid>
+  <input id="mat-mdc-chip-list-input-0" autocomplete="off">
+  <mat-chip-grid id="destination-chips"></mat-chip-grid>
+  <input id="mat-mdc-chip-list-input-1" autocomplete="off">
+  <input placeholder="Start Date">
+  <input placeholder="End Date">
+  <label><input type="checkbox" id="calendar-mode"> See calendar of lowest fares</label>
+  <input placeholder="Length of stay">
+  <button type="button" value="Search">Search</button>
+</form>
+<div id="results"></div>
+<script>
+const query = (extra) => {
+  const params = new URLSearchParams({origin: chips("origin-chips"), destination: chips("destination-chips"),
+    start: document.querySelector('input[placeholder="Start Date"]').value, end: document.querySelector('input[placeholder="End Date"]').value});
+  for (const key in extra) { params.set(key, extra[key]); }
+  return params.toString();
+};
+const chips = (id) => Array.from(document.getElementById(id).querySelectorAll("mat-chip-row"), (chip) => chip.dataset.code).join(",");
+const addChip = (input, id) => {
+  const code = input.value.trim().toUpperCase();
+  input.value = "";
+  if (!code) { return; }
+  const chip = document.createElement("mat-chip-row");
+  chip.dataset.code = code;
+  chip.textContent = code;
+  const remove = document.createElement("button");
+  remove.type = "button";
+  remove.setAttribute("matchipremove", "");
+  remove.textContent = "x";
+  remove.onclick = () => chip.remove();
+  chip.appendChild(remove);
+  document.getElementById(id).appendChild(chip);
+};
+const origin = document.getElementById("mat-mdc-chip-list-input-0");
+const destination = document.getElementById("mat-mdc-chip-list-input-1");
+origin.addEventListener("keydown", (event) => { if (event.key === "Enter") { addChip(origin, "origin-chips"); } });
+destination.addEventListener("keydown", (event) => { if (event.key === "Enter") { addChip(destination, "destination-chips"); } });
+const text = (value) => value === null || value === undefined ? "" : String(value);
+const minutes = (value) => value === null || value === undefined ? "None" : Math.floor(value / 60) + "h " + (value % 60) + "m";
+const carrierName = (solution) => solution.itinerary.carriers.map((carrier) => carrier.shortName || carrier.code).join(", ");
+const row = (solution) => {
+  const slices = solution.itinerary.slices;
+  const join = (fn) => slices.map(fn).join(" | ");
+  return [solution.displayTotal, carrierName(solution), join((s) => text(s.departure)), join((s) => text(s.arrival)),
+    join((s) => minutes(s.duration)), join((s) => s.origin.code + "-" + s.destination.code),
+    join((s) => String((s.stops || []).length)), join((s) => (s.flights || []).join(" "))];
+};
+const COLUMNS = ["Price", "Airline filter_alt", "Departure", "Arrival", "Duration", "Route", "Stops", "Flights"];
+const STOPS = ["Nonstop", "1 stop", "2+ stops"];
+const renderUpper = (solutions) => {
+  const carriers = Array.from(new Set(solutions.map(carrierName)));
+  const lowest = {};
+  for (const solution of solutions) {
+    const stops = Math.min(2, (solution.itinerary.slices[0].stops || []).length);
+    const key = carrierName(solution) + "|" + stops;
+    if (!(key in lowest) || solution.amount < lowest[key].amount) { lowest[key] = solution; }
+  }
+  let html = '<div id="cdk-accordion-child-0"><mat-table role="table"><mat-header-row role="row"><mat-header-cell role="columnheader">Stops</mat-header-cell>';
+  for (const carrier of carriers) {
+    html += '<mat-header-cell role="columnheader" aria-label="' + carrier + ' Carrier logo"><img role="img" alt="' + carrier +
+      ' Carrier logo" src="/logo/' + encodeURIComponent(carrier) + '.gif" data-carrier="' + carrier + '">' + carrier + '</mat-header-cell>';
+  }
+  html += "</mat-header-row>";
+  STOPS.forEach((label, stops) => {
+    html += '<mat-row role="row"><mat-cell role="cell">' + label + "</mat-cell>";
+    for (const carrier of carriers) {
+      const best = lowest[carrier + "|" + stops];
+      html += '<mat-cell role="cell">' + (best ? best.displayTotal : "") + "</mat-cell>";
+    }
+    html += "</mat-row>";
+  });
+  html += '</mat-table></div><div id="carrier"></div>';
+  document.getElementById("results").innerHTML = html;
+  for (const img of document.querySelectorAll("img[data-carrier]")) {
+    img.onclick = () => loadCarrier(img.dataset.carrier);
+  }
+};
+const loadCarrier = async (carrier) => {
+  const response = await fetch("/v1/carrier?" + query({carrier: carrier}));
+  if (!response.ok) { return; }
+  const solutions = JSON.parse((await response.text()).slice(4)).solutionList.solutions;
+  let html = '<table role="table"><thead><tr>' + COLUMNS.map((column) => "<th>" + column + "</th>").join("") + "</tr></thead><tbody>";
+  for (const solution of solutions) {
+    html += "<tr>" + row(solution).map((cell) => "<td>" + cell + "</td>").join("") + "</tr>";
+  }
+  document.getElementById("carrier").innerHTML = html + "</tbody></table>";
+};
+const renderCalendar = (calendar) => {
+  let html = '<div role="grid" class="calendar">';
+  for (const month of calendar.months) {
+    for (const week of month.weeks) {
+      html += '<div role="row">';
+      for (const day of week.days) {
+        html += '<div role="gridcell" data-date="' + day.date + '"><span>' + Number(day.date.slice(8)) + "</span><span>" + text(day.minPrice) + "</span></div>";
+      }
+      html += "</div>";
+    }
+  }
+  document.getElementById("results").innerHTML = html + "</div>";
+};
+document.querySelector('button[value="Search"]').onclick = async () => {
+  addChip(origin, "origin-chips");
+  addChip(destination, "destination-chips");
+  document.getElementById("results").innerHTML = "";
+  const calendarMode = document.getElementById("calendar-mode").checked;
+  const extra = calendarMode ? {calendar: "1", stay: document.querySelector('input[placeholder="Length of stay"]').value} : {};
+  const response = await fetch("/v1/search?" + query(extra));
+  if (!response.ok) {
+    document.getElementById("results").textContent = "Something went wrong, please try again.";
+    return;
+  }
+  const payload = JSON.parse((await response.text()).slice(4));
+  if (calendarMode) { renderCalendar(payload.calendar); } else { renderUpper(payload.solutionList.solutions); }
+};
+</script>
+</body>
+</html>
+"""
+
+
+def generate_payload(origin,destination,start,end,carriers=8,rows=15):
+    """
+    This function generates a search payload in the format of the backend response. The same route and dates always give the same payload.
+
+    Args:
+        origin (str): origin IATA code
+        destination (str): destination IATA code
+        start (str): start date in MM/DD/YYYY format
+        end (str): end date in MM/DD/YYYY format
+        carriers (int): number of carriers in the results
+        rows (int): number of itineraries per carrier
+
+    Returns:
+        dict: payload with solutionList.solutions
+    """
+    seed = int(hashlib.sha1(f"{origin}{destination}{start}{end}".encode()).hexdigest()[:8],16)
+    generator = random.Random(seed)
+    departure_day = datetime.strptime(start,"%m/%d/%Y") if start else datetime(2030,1,1)
+    return_day = datetime.strptime(end,"%m/%d/%Y") if end else departure_day + timedelta(days=7)
+    solutions = []
+    for code,name in generator.sample(CARRIERS,min(carriers,len(CARRIERS))):
+        for number in range(rows):
+            amount = generator.randint(250,2500) * 100 + generator.choice([0,50,99])
+            slices = []
+            for day,(slice_origin,slice_destination) in ((departure_day,(origin,destination)),(return_day,(destination,origin))):
+                stops = generator.choice([0,0,1,1,1,2])
+                departure = day + timedelta(minutes=generator.randint(5*60,22*60))
+                duration = generator.randint(180,1200) + stops * 120
+                slices.append({
+                    "origin":{"code":slice_origin},
+                    "destination":{"code":slice_destination},
+                    "departure":departure.strftime("%Y-%m-%dT%H:%M"),
+                    "arrival":(departure + timedelta(minutes=duration)).strftime("%Y-%m-%dT%H:%M"),
+                    "duration":duration,
+                    "stops":[{"code":hub} for hub in generator.sample(HUBS,stops)],
+                    "flights":[f"{code}{generator.randint(1,2999)}" for _ in range(stops + 1)],
+                })
+            solutions.append({"displayTotal":f"USD{amount // 100:,}.{amount % 100:02d}","amount":amount,
+                              "itinerary":{"carriers":[{"code":code,"shortName":name}],"slices":slices}})
+    solutions.sort(key=lambda solution: solution["amount"])
+    return {"solutionList":{"solutions":solutions}}
+
+
+def generate_calendar(origin,destination,start,end,stay,carriers=8,rows=15):
+    """
+    This function generates a calendar search payload: the lowest fare of every departure from start to end with stay days long trips,
+    taken from the generated payload of that date, so a full search of a calendar date shows the same lowest fare.
+
+    Returns:
+        dict: payload with calendar.months[].weeks[].days[]
+    """
+    first = datetime.strptime(start,"%m/%d/%Y")
+    last = datetime.strptime(end,"%m/%d/%Y") if end else first
+    months = {}
+    day = first
+    while day <= last:
+        solutions = generate_payload(origin,destination,day.strftime("%m/%d/%Y"),(day + timedelta(days=stay)).strftime("%m/%d/%Y"),
+                                     carriers,rows)["solutionList"]["solutions"]
+        weeks = months.setdefault(day.strftime("%Y-%m"),{})
+        weeks.setdefault(day.isocalendar()[1],[]).append({"date":day.strftime("%Y-%m-%d"),"minPrice":solutions[0]["displayTotal"] if solutions else None,
+                                                          "solutionCount":len(solutions)})
+        day += timedelta(days=1)
+    return {"calendar":{"months":[{"month":month,"weeks":[{"days":days} for days in weeks.values()]} for month,weeks in months.items()]}}
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the replay server, the settings are read from the server object.
+    """
+
+    def log_message(self,*args):
+        pass
+
+    def send(self,status,content_type,body):
+        self.send_response(status)
+        self.send_header("Content-Type",content_type)
+        self.send_header("Content-Length",str(len(body)))
+        self.send_header("Cache-Control","no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        request = urlparse(self.path)
+        params = {key:values[0] for key,values in parse_qs(request.query).items()}
+        if request.path == "/":
+            self.send(200,"text/html; charset=utf-8",PAGE.encode())
+        elif request.path.startswith("/logo/"):
+            self.send(200,"image/gif",LOGO_GIF)
+        elif request.path in ("/v1/search","/v1/carrier"):
+            self.server.delay()
+            if self.server.fails():
+                self.send(503,"text/plain","Service Unavailable".encode())
+                return
+            payload = self.server.payload(params)
+            if request.path == "/v1/carrier":
+                solutions = [solution for solution in payload["solutionList"]["solutions"]
+                             if ", ".join(carrier.get("shortName") or carrier.get("code") for carrier in solution["itinerary"]["carriers"]) == params.get("carrier")]
+                payload = {"solutionList":{"solutions":solutions}}
+            self.send(200,"application/json",(")]}'\n" + json.dumps(payload)).encode())
+        else:
+            self.send(404,"text/plain",b"Not Found")
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Ver 1.3 -- HTTP server replaying the ITA Matrix search pages. Every backend call waits latency seconds (with jitter)
+    and fails with a 503 with the failure_rate probability, so retries and timeouts are exercised as well.
+
+    Args:
+        port (int): port to listen on, 0 picks a free one
+        latency (float): mean delay of a backend call in seconds
+        failure_rate (float): probability of a failed backend call
+        carriers (int): carriers per generated search
+        rows (int): itineraries per carrier of a generated search
+        recording (str): recorded search response body replayed for every search instead of the generated payloads
+        seed (int): seed of the latency and failure draws
+    """
+
+    daemon_threads = True
+
+    def __init__(self,port=0,latency=0.3,failure_rate=0.0,carriers=8,rows=15,recording=None,seed=0):
+        super().__init__(("127.0.0.1",port),ReplayHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.carriers = carriers
+        self.rows = rows
+        self.recorded = None
+        if recording is not None:
+            with open(recording,encoding="utf-8") as body:
+                text = body.read().lstrip()
+            self.recorded = json.loads(text[4:] if text.startswith(")]}'") else text)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def delay(self):
+        with self.lock:
+            seconds = self.random.uniform(0.5,1.5) * self.latency
+        time.sleep(seconds)
+
+    def fails(self):
+        with self.lock:
+            return self.random.random() < self.failure_rate
+
+    def payload(self,params):
+        if params.get("calendar"):
+            return generate_calendar(params.get("origin",""),params.get("destination",""),params.get("start",""),params.get("end",""),
+                                     int(params.get("stay") or 0),self.carriers,self.rows)
+        if self.recorded is not None:
+            return self.recorded
+        return generate_payload(params.get("origin",""),params.get("destination",""),params.get("start",""),params.get("end",""),
+                                self.carriers,self.rows)
+
+
+def start_server(**settings):
+    """
+    This function starts a replay server in a background thread.
+
+    Returns:
+        ReplayServer: running server, stop it with shutdown()
+    """
+    server = ReplayServer(**settings)
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves recorded or generated ITA Matrix result pages locally.")
+    parser.add_argument("--port",type=int,default=8765)
+    parser.add_argument("--latency",type=float,default=0.3,help="mean delay of a backend call in seconds (default: 0.3)")
+    parser.add_argument("--failure-rate",type=float,default=0.0,help="probability of a failed backend call (default: 0)")
+    parser.add_argument("--carriers",type=int,default=8,help="carriers per search (default: 8)")
+    parser.add_argument("--rows",type=int,default=15,help="itineraries per carrier (default: 15)")
+    parser.add_argument("--recording",help="recorded search response body replayed for every search")
+    args = parser.parse_args()
+    server = ReplayServer(args.port,args.latency,args.failure_rate,args.carriers,args.rows,args.recording)
+    print(f"Serving on {server.url}, point the scraper at it with MATRIX_URL={server.url}")
+    server.serve_forever()
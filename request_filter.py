@@ -0,0 +1,151 @@
+import time
+from urllib.parse import urlparse
+
+#Ver 1.3 --Resource types that are not needed to read the result tables.
+BLOCKED_RESOURCE_TYPES = {"image","font","media"}
+#Hosts the site needs, the app itself and its backend. Requests to any other host (analytics, tag managers, ads) are aborted.
+#Local hosts are for the replay server of the benchmark.
+ALLOWED_HOSTS = ("matrix.itasoftware.com","googleapis.com","127.0.0.1","localhost")
+#Carrier logos are the click targets of the carrier loop, they are never blocked so the columnheader/img elements keep their size.
+ALLOWED_URL_PARTS = ("logo","airline")
+#Blocked images are answered with a transparent 1x1 gif instead of an error, so img elements are still laid out and clickable.
+EMPTY_GIF = bytes.fromhex("47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b")
+
+
+class RequestFilter:
+    """
+    Ver 1.3 -- Request filtering layer attached to every browser context with context.route. It aborts third party hosts and
+    answers images, fonts and media with empty bodies, while the app, its backend and the carrier logos are let through.
+    It also measures the bytes transferred and the time of every search, so the savings can be seen in the output.
+
+    Args:
+        blocked_types (set): resource types to block, an empty set only measures
+        allowed_hosts (tuple): host suffixes that are never aborted
+        block_third_party (bool): abort requests to hosts outside allowed_hosts
+    """
+
+    def __init__(self,blocked_types=BLOCKED_RESOURCE_TYPES,allowed_hosts=ALLOWED_HOSTS,block_third_party=True):
+        self.blocked_types = set(blocked_types)
+        self.allowed_hosts = allowed_hosts
+        self.block_third_party = block_third_party
+        self.searches = []
+        self.reset()
+
+    def clone(self):
+        """
+        This function returns a filter with the same settings for another context, e.g. one per async worker so their measurements
+        don't mix. The finished searches are collected in the same list.
+        """
+        other = RequestFilter(self.blocked_types,self.allowed_hosts,self.block_third_party)
+        other.searches = self.searches
+        return other
+
+    def start_search(self):
+        """
+        This function starts the measurement of a search.
+        """
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.blocked = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    def decide(self,url,resource_type):
+        """
+        This function decides what happens to a request.
+
+        Args:
+            url (str): url of the request
+            resource_type (str): playwright resource type, e.g. document, script, image
+
+        Returns:
+            str: "allow", "abort" or "stub"
+        """
+        host = urlparse(url).hostname or ""
+        if url.startswith("data:"):
+            return "allow"
+        #Carrier logos can come from a static content host, so they are checked before the host.
+        if resource_type == "image" and any(part in url.lower() for part in ALLOWED_URL_PARTS):
+            return "allow"
+        if self.block_third_party and not any(host == allowed or host.endswith("." + allowed) for allowed in self.allowed_hosts):
+            return "abort"
+        if resource_type in self.blocked_types:
+            return "stub" if resource_type == "image" else "abort"
+        return "allow"
+
+    def attach(self,context):
+        """
+        This function installs the filter and the byte counter on a sync browser context.
+        """
+        context.route("**/*",self.handle)
+        context.on("requestfinished",self.count)
+
+    def attach_async(self,context):
+        """
+        Async version of attach, returns the coroutine of context.route.
+        """
+        context.on("requestfinished",self.count_async)
+        return context.route("**/*",self.handle_async)
+
+    def handle(self,route):
+        action = self.decide(route.request.url,route.request.resource_type)
+        self.requests += 1
+        #Ver 1.3 --Allowed requests fall back to the handlers attached before the filter, e.g. the browser cache, or go to the network.
+        if action == "allow":
+            route.fallback()
+            return
+        self.blocked += 1
+        if action == "stub":
+            route.fulfill(status=200,content_type="image/gif",body=EMPTY_GIF)
+        else:
+            route.abort()
+
+    async def handle_async(self,route):
+        action = self.decide(route.request.url,route.request.resource_type)
+        self.requests += 1
+        if action == "allow":
+            await route.fallback()
+            return
+        self.blocked += 1
+        if action == "stub":
+            await route.fulfill(status=200,content_type="image/gif",body=EMPTY_GIF)
+        else:
+            await route.abort()
+
+    def count(self,request):
+        sizes = request.sizes()
+        self.bytes += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+
+    async def count_async(self,request):
+        sizes = await request.sizes()
+        self.bytes += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+
+    def finish_search(self,label):
+        """
+        This function closes the measurement of a search, prints it and starts the next one.
+
+        Args:
+            label (str): name of the search in the output, e.g. the date
+
+        Returns:
+            dict: requests, blocked requests, bytes and seconds of the search
+        """
+        stats = {"search":label,"requests":self.requests,"blocked":self.blocked,"bytes":self.bytes,
+                 "seconds":round(time.monotonic() - self.started,2)}
+        self.searches.append(stats)
+        print(f"{label}: transferred {stats['bytes']/1024:.0f} KB in {stats['requests']} requests "
+              f"({stats['blocked']} blocked), search took {stats['seconds']}s...")
+        self.reset()
+        return stats
+
+    def summary(self):
+        """
+        This function prints the average transfer and time per search of the run.
+        """
+        if not self.searches:
+            return
+        count = len(self.searches)
+        print(f"Average per search: {sum(stats['bytes'] for stats in self.searches)/count/1024:.0f} KB, "
+              f"{sum(stats['seconds'] for stats in self.searches)/count:.2f}s over {count} searches...")
@@ -0,0 +1,105 @@
+import json
+import re
+import pandas as pd
+
+#Ver 1.3 --The results page gets all of its data from one backend call when the search button is clicked.
+#The pattern can be changed to point at a local stand-in server that serves recorded payloads.
+SEARCH_RESPONSE_PATTERN = re.compile(r"/v1/search\b")
+
+#Columns are named after the carrier table on the page, so the output looks the same as the click loop.
+RESULT_COLUMNS = ["Price","Airline filter_alt","Departure","Arrival","Duration","Route","Stops","Flights"]
+
+
+def is_search_response(response):
+    """
+    This function is used as the predicate of page.expect_response to find the search result call.
+
+    Args:
+        response (playwright.Response): any response received by the page
+
+    Returns:
+        bool: True if the response carries the search results
+    """
+    return response.request.method in ("GET","POST") and SEARCH_RESPONSE_PATTERN.search(response.url) is not None
+
+
+def check_response(status):
+    """
+    This function checks the status of the search response, a failed backend call (e.g. 503) has no results to read.
+
+    Args:
+        status (int): HTTP status of the response
+
+    Raises:
+        ValueError: if the status is not 2xx
+    """
+    if not 200 <= status < 300:
+        raise ValueError(f"Search response failed with status {status}")
+
+
+def load_payload(body):
+    """
+    This function decodes the body of the search response. Google apis prefix their JSON with )]}' to prevent it from being
+    executed as a script, so the prefix is stripped before decoding.
+
+    Args:
+        body (str): response text
+
+    Returns:
+        dict: decoded payload
+
+    Raises:
+        ValueError: if the body is not JSON
+    """
+    body = body.lstrip()
+    if body.startswith(")]}'"):
+        body = body[4:]
+    return json.loads(body)
+
+
+def format_minutes(minutes):
+    """
+    This function formats a duration in minutes like the page does, e.g. 11h 5m.
+    """
+    if minutes is None:
+        return None
+    return f"{int(minutes) // 60}h {int(minutes) % 60}m"
+
+
+def parse_search_payload(payload,starting_date,ending_date):
+    """
+    This function derives the rows of every carrier from the captured search payload, so we don't need to click
+    each carrier in the upper table and wait for its table to load.
+    Every solution becomes one row, for round trips the values of the outbound and return slices are joined with " | ".
+
+    Args:
+        payload (dict): decoded search response
+        starting_date (str): start date
+        ending_date (str): end date
+
+    Returns:
+        pandas.DataFrame: rows of all the carriers for the date
+    """
+    solutions = payload.get("solutionList",{}).get("solutions",[])
+    rows = []
+    for solution in solutions:
+        itinerary = solution.get("itinerary",{})
+        carriers = [carrier.get("shortName") or carrier.get("code") for carrier in itinerary.get("carriers",[])]
+        slices = itinerary.get("slices",[])
+        rows.append([
+            solution.get("displayTotal"),
+            ", ".join(carrier for carrier in carriers if carrier) or None,
+            " | ".join(str(part.get("departure","")) for part in slices),
+            " | ".join(str(part.get("arrival","")) for part in slices),
+            " | ".join(str(format_minutes(part.get("duration"))) for part in slices),
+            " | ".join(f'{part.get("origin",{}).get("code","")}-{part.get("destination",{}).get("code","")}' for part in slices),
+            " | ".join(str(len(part.get("stops") or [])) for part in slices),
+            " | ".join(" ".join(part.get("flights") or []) for part in slices),
+        ])
+    df = pd.DataFrame(rows,columns=RESULT_COLUMNS)
+    df = df[df["Airline filter_alt"].notnull()]
+    #Rows are grouped by carrier like the click loop collects them, the backend order (cheapest first) is kept inside each carrier.
+    df = df.sort_values(["Airline filter_alt"],kind="stable").reset_index(drop=True)
+    df["start_date"] = starting_date
+    df["end_date"] = ending_date
+    return df
@@ -0,0 +1,270 @@
+from datetime import datetime
+from os import path,makedirs,listdir,remove
+import pandas as pd
+
+#Ver 1.3 --Every row gets the time it was written, the excel export uses it to keep only the latest scrape of a date
+#when the same date was written more than once to the append-only files.
+SCRAPED_AT_COLUMN = "scraped_at"
+#Ver 1.3 --The fare matrix of the upper table is written next to the results, e.g. ISTJFK_matrix.csv.
+MATRIX_SUFFIX = "_matrix"
+#Ver 1.3 --Typed rows (--schema typed) have other columns than the raw ones, they go to their own files, e.g. ISTJFK_typed.csv,
+#so a typed run never appends to the header of a raw run.
+TYPED_SUFFIX = "_typed"
+#Ver 1.3 --The append-only files keep every run, the excel export reads them this many rows at a time and keeps only the rows it exports.
+EXPORT_CHUNK_ROWS = 50000
+
+
+class ResultSink:
+    """
+    Ver 1.3 -- Base class of the output layer. A sink receives the rows of every date as soon as the date is finished,
+    write() only appends, nothing written before is loaded or rewritten.
+
+    Args:
+        origin (str): origin IATA code
+        destination (str): destination IATA code
+        suffix (str): added to the file name, for the outputs other than the results
+    """
+
+    extension = ""
+
+    def __init__(self,origin,destination,suffix=""):
+        self.origin = origin
+        self.destination = destination
+        self.path = fr"{origin}{destination}{suffix}{self.extension}"
+        self.sheets = []
+        self.stamps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def write(self,sheet_name,dataframes,stamp=None,append=False):
+        """
+        This function stamps the rows with the scrape time and appends them to the output.
+        A date is written in several parts, one per carrier, all the parts get the stamp of the first one.
+
+        Args:
+            sheet_name (str): sheet name generated from the start date
+            dataframes (pandas.DataFrame): rows of all the carriers for the date
+            stamp (str): stamp of an earlier scrape the rows belong to, e.g. carriers retried in a later run, now if None
+            append (bool): the rows are added to the rows written for the date earlier, they don't replace them
+        """
+        if sheet_name not in self.stamps:
+            if not append:
+                self.replace(sheet_name)
+            self.sheets.append(sheet_name)
+            self.stamps[sheet_name] = stamp or datetime.now().isoformat(timespec="seconds")
+            if dataframes.empty:
+                print(f"No rows for {sheet_name}, nothing is written...")
+        if dataframes.empty:
+            return
+        dataframes = dataframes.copy()
+        dataframes[SCRAPED_AT_COLUMN] = self.stamps[sheet_name]
+        self.append(sheet_name,dataframes)
+
+    def discard(self,sheet_name):
+        """
+        This function forgets the stamp of a date whose search failed after some of its parts were written,
+        the retry of the date is written as a new scrape and replaces them in the export.
+        """
+        if self.stamps.pop(sheet_name,None) is not None:
+            self.sheets.remove(sheet_name)
+
+    def replace(self,sheet_name):
+        """
+        This function is called before the first part of a date that is searched again, the sinks that keep the dates apart
+        remove the rows of the earlier scrape here.
+        """
+
+    def append(self,sheet_name,dataframes):
+        raise NotImplementedError
+
+    def read_chunks(self,columns=None):
+        """
+        This function reads everything written to the output so far, a chunk at a time.
+
+        Args:
+            columns (list): only these columns, every column if None
+
+        Yields:
+            pandas.DataFrame: rows of the next chunk
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvSink(ResultSink):
+    """
+    Appends the rows of every date to a single {origin}{destination}.csv file. The header is taken from the first date written to the file,
+    later dates are aligned to it so the file stays readable as one table.
+    """
+
+    extension = ".csv"
+
+    def __init__(self,origin,destination,suffix=""):
+        super().__init__(origin,destination,suffix)
+        self.columns = None
+        if path.exists(self.path) and path.getsize(self.path) > 0:
+            self.columns = list(pd.read_csv(self.path,nrows=0).columns)
+
+    def append(self,sheet_name,dataframes):
+        if self.columns is None:
+            self.columns = list(dataframes.columns)
+            dataframes.to_csv(self.path,mode="w",header=True,index=False)
+            return
+        missing = [column for column in dataframes.columns if column not in self.columns]
+        if missing:
+            print(f"Columns {missing} are not in the header of {self.path}, they are left out...")
+        dataframes.reindex(columns=self.columns).to_csv(self.path,mode="a",header=False,index=False)
+
+    def read_chunks(self,columns=None):
+        if not path.exists(self.path) or self.columns is None:
+            return
+        yield from pd.read_csv(self.path,dtype=str,usecols=columns,chunksize=EXPORT_CHUNK_ROWS)
+
+
+class ParquetSink(ResultSink):
+    """
+    Writes every date as its own part file into the {origin}{destination}_parquet directory, which pandas and pyarrow read as one dataset.
+    Searching a date again replaces only its part files, like the sheets in the excel file, retried carriers are added to them. Needs pyarrow to be installed.
+    """
+
+    extension = "_parquet"
+
+    def __init__(self,origin,destination,suffix=""):
+        super().__init__(origin,destination,suffix)
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow, please install it with: pip install pyarrow")
+        makedirs(self.path,exist_ok=True)
+        self.parts = {}
+
+    def part_files(self,sheet_name):
+        return [name for name in listdir(self.path) if name.startswith(f"{sheet_name}-") or name == f"{sheet_name}.parquet"]
+
+    def replace(self,sheet_name):
+        #Parts of an earlier run of the same date are removed before the first part of this run is written.
+        for name in self.part_files(sheet_name):
+            remove(path.join(self.path,name))
+
+    def append(self,sheet_name,dataframes):
+        if sheet_name not in self.parts:
+            #Retried carriers are added after the parts of the earlier run, which are kept.
+            numbers = [int(name[len(sheet_name) + 1:-8]) for name in self.part_files(sheet_name) if name != f"{sheet_name}.parquet"]
+            self.parts[sheet_name] = max(numbers,default=-1) + 1
+        part = self.parts[sheet_name]
+        name = f"{sheet_name}-{part:04d}.parquet"
+        self.parts[sheet_name] += 1
+        #Text and numpy columns are stored as strings, the carrier tables don't always have the same dtypes for the same column.
+        #Columns of the typed schema (nullable integers, categoricals, datetimes) keep their types.
+        untyped = {column:"string" for column,dtype in dataframes.dtypes.items()
+                   if not isinstance(dtype,pd.api.extensions.ExtensionDtype) and not pd.api.types.is_datetime64_any_dtype(dtype)}
+        dataframes.astype(untyped).to_parquet(path.join(self.path,name),index=False)
+
+    def read_chunks(self,columns=None):
+        #Every part file is a chunk.
+        for name in sorted(listdir(self.path)):
+            if name.endswith(".parquet"):
+                yield pd.read_parquet(path.join(self.path,name),columns=columns)
+
+
+#The keys are the OUTPUT_FORMATS of settings.py.
+SINKS = {"csv":CsvSink,"parquet":ParquetSink}
+
+
+def open_sink(kind,origin,destination,suffix="",typed=False):
+    """
+    This function creates the sink selected with the --output option.
+
+    Args:
+        kind (str): csv or parquet
+        origin (str): origin IATA code
+        destination (str): destination IATA code
+        suffix (str): added to the file name, e.g. MATRIX_SUFFIX
+        typed (bool): the rows are in the typed schema, TYPED_SUFFIX is added to the file name
+
+    Returns:
+        ResultSink: sink for the route
+    """
+    return SINKS[kind](origin,destination,suffix + TYPED_SUFFIX if typed else suffix)
+
+
+def sheet_names_of(dataframes):
+    """
+    Returns:
+        pandas.Series: sheet name of every row, dates are text in MM/DD/YYYY in the raw schema and dates in the typed schema,
+        both give the same sheet name
+    """
+    return pd.to_datetime(dataframes["start_date"],format="mixed").dt.strftime("%m.%d.%Y")
+
+
+def export_stamps(sink,sheet_names=None,earlier=()):
+    """
+    This function picks the scrape of every date that is exported: the one written by this run, and for the dates in earlier,
+    e.g. the dates finished before an interrupted run was resumed, their latest scrape.
+
+    Args:
+        sink (ResultSink): sink of the route
+        sheet_names (list): sheets to export, the dates written by this run if None
+        earlier (list): sheets this run didn't write that are exported from an earlier run
+
+    Returns:
+        dict: sheet name -> scraped_at of the rows to export
+    """
+    stamps = dict(sink.stamps)
+    if sheet_names is not None:
+        stamps = {sheet_name:stamp for sheet_name,stamp in stamps.items() if sheet_name in set(sheet_names)}
+    earlier = set(earlier) - set(stamps)
+    if earlier:
+        #Only the two columns are read to find them.
+        for chunk in sink.read_chunks(["start_date",SCRAPED_AT_COLUMN]):
+            chunk = chunk.assign(sheet_name=sheet_names_of(chunk))
+            latest = chunk[chunk["sheet_name"].isin(earlier)].groupby("sheet_name")[SCRAPED_AT_COLUMN].max()
+            for sheet_name,stamp in latest.items():
+                stamps[sheet_name] = max(stamps.get(sheet_name,stamp),stamp)
+    return stamps
+
+
+def export_excel(sink,sheet_names=None,earlier=()):
+    """
+    This function writes the excel file in one go at the end of the run, one sheet per date like before.
+    The workbook is opened once, instead of loading and rewriting the whole file after every date.
+    Ver 1.3 -- Only the rows of the scrapes picked by export_stamps are kept while the output is read chunk by chunk,
+    so the export doesn't load the history of every earlier run.
+
+    Args:
+        sink (ResultSink): sink of the route
+        sheet_names (list): sheets to export, the dates written by this run if None
+        earlier (list): sheets this run didn't write that are exported from an earlier run, see export_stamps
+
+    Returns:
+        str: path of the excel file
+    """
+    out_path = fr"{sink.origin}{sink.destination}.xlsx"
+    stamps = export_stamps(sink,sheet_names,earlier)
+    frames = []
+    for chunk in sink.read_chunks() if stamps else ():
+        chunk = chunk.assign(sheet_name=sheet_names_of(chunk))
+        chunk = chunk[chunk[SCRAPED_AT_COLUMN] == chunk["sheet_name"].map(stamps)]
+        if not chunk.empty:
+            frames.append(chunk)
+    if not frames:
+        print("Nothing to export to excel...")
+        return out_path
+    data = pd.concat(frames,ignore_index=True)
+    mode = "a" if path.exists(out_path) else "w"
+    options = {"if_sheet_exists":"replace"} if mode == "a" else {}
+    print(f"Exporting {data['sheet_name'].nunique()} sheets to {out_path}...")
+    with pd.ExcelWriter(out_path,mode=mode,engine="openpyxl",**options) as writer:
+        #Ver 1.3 --Parts of different dates can be written interleaved, the sheets follow the order of sheet_names.
+        sheets = dict(list(data.groupby("sheet_name",sort=False)))
+        order = [sheet_name for sheet_name in dict.fromkeys(sheet_names) if sheet_name in sheets] if sheet_names is not None else list(sheets)
+        for sheet_name in order:
+            rows = sheets[sheet_name]
+            rows.drop(columns=["sheet_name",SCRAPED_AT_COLUMN]).to_excel(writer,sheet_name=sheet_name,index=False)
+    return out_path
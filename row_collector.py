@@ -0,0 +1,52 @@
+import pandas as pd
+
+
+class RowCollector:
+    """
+    Ver 1.3 -- This class collects the carrier tables of a date without concatenating them one by one.
+    Raw rows are kept in a list and turned into a single dataframe when the part is handed down the pipeline,
+    the start_date and end_date columns are added once at that point instead of on every fragment.
+
+    Args:
+        starting_date (str): start date
+        ending_date (str): end date
+    """
+
+    def __init__(self,starting_date,ending_date):
+        self.starting_date = starting_date
+        self.ending_date = ending_date
+        self.fragments = []
+        self.rows = 0
+
+    def __len__(self):
+        return self.rows
+
+    def add_rows(self,columns,rows):
+        """
+        This function adds raw rows, e.g. the JSON returned from the page, without creating a dataframe for them yet.
+
+        Args:
+            columns (list): column names
+            rows (list): list of row lists
+        """
+        if not rows:
+            return
+        self.fragments.append((columns,rows))
+        self.rows += len(rows)
+
+    def materialize(self):
+        """
+        This function builds one dataframe from everything collected so far and empties the collector.
+
+        Returns:
+            pandas.DataFrame: collected rows with start_date and end_date columns
+        """
+        frames = [pd.DataFrame(rows,columns=columns) for columns,rows in self.fragments]
+        self.fragments = []
+        self.rows = 0
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames,ignore_index=True) if len(frames) > 1 else frames[0]
+        df["start_date"] = self.starting_date
+        df["end_date"] = self.ending_date
+        return df
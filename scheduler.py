@@ -0,0 +1,134 @@
+import math
+from datetime import datetime
+import pandas as pd
+
+#Ver 1.3 --Refresh interval of a date by how many days it is away, (days out up to, hours). Near dates change the most and matter the most.
+REFRESH_HOURS = [(7,6),(30,12),(90,24),(180,72),(None,168)]
+#Number of latest scrapes of a date its volatility is computed from.
+VOLATILITY_WINDOW = 5
+#A date whose cheapest fare moves by this much between scrapes (coefficient of variation) is refreshed twice as often,
+#a date that did not move at all over the window is refreshed half as often.
+VOLATILE = 0.05
+STABLE = 0.005
+
+
+def base_interval(days_out):
+    """
+    Returns:
+        float: refresh interval in hours of a date days_out days away
+    """
+    for limit,hours in REFRESH_HOURS:
+        if limit is None or days_out <= limit:
+            return hours
+
+
+def refresh_interval(days_out,volatility,scrapes):
+    """
+    This function returns the refresh interval of a date, the base interval of its distance scaled by how much its price moved.
+
+    Args:
+        days_out (int): days between today and the departure
+        volatility (float): coefficient of variation of the cheapest fare over the latest scrapes, NaN if unknown
+        scrapes (int): number of scrapes the volatility is computed from
+
+    Returns:
+        float: hours
+    """
+    hours = base_interval(days_out)
+    if scrapes < 2 or math.isnan(volatility):
+        return hours
+    #Between STABLE and VOLATILE the interval goes from 2x to 0.5x of the base on a log scale.
+    position = (math.log(max(volatility,STABLE)) - math.log(STABLE)) / (math.log(VOLATILE) - math.log(STABLE))
+    factor = 2 ** (1 - 2 * min(1,max(0,position)))
+    if scrapes < VOLATILITY_WINDOW and factor > 1:
+        #A date is only called stable after a full window of scrapes.
+        factor = 1
+    return hours * factor
+
+
+class RefreshScheduler:
+    """
+    Ver 1.3 -- Picks the dates of a run from the scrape history in the fare store. Every (route, departure, return) is due when it is older
+    than its refresh interval, which is short for near and volatile dates and long for far and stable ones. Due dates are ordered by
+    how overdue they are (never scraped first), and with a budget only the most overdue ones are searched.
+
+    Args:
+        store (FareStore): fare store with the scrape history
+        budget (int): maximum number of searches of a run, None searches every due date
+        now (datetime): time of the run, now if None
+    """
+
+    def __init__(self,store,budget=None,now=None):
+        self.store = store
+        self.budget = budget
+        self.now = now or datetime.now()
+
+    def history(self,jobs):
+        """
+        This function reads the cheapest fare of every scrape of the dates of the jobs.
+
+        Returns:
+            pandas.DataFrame: origin, destination, departure_date, return_date, scraped_at and price_minor
+        """
+        frames = []
+        for (origin,destination),route_jobs in pd.DataFrame(jobs,columns=["origin","destination","start","end"]).groupby(["origin","destination"]):
+            departures = pd.to_datetime(route_jobs["start"],format="%m/%d/%Y")
+            frames.append(self.store.query("""
+                SELECT origin,destination,departure_date,return_date,scraped_at,MIN(price_minor) AS price_minor FROM carrier_fares
+                WHERE origin=? AND destination=? AND departure_date >= ? AND departure_date <= ?
+                GROUP BY departure_date,return_date,scraped_at
+            """,(origin,destination,departures.min().date().isoformat(),departures.max().date().isoformat())))
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=["origin","destination","departure_date","return_date","scraped_at","price_minor"])
+        return pd.concat(frames,ignore_index=True)
+
+    def plan(self,jobs):
+        """
+        This function computes the last scrape, volatility, interval and priority of every job.
+
+        Returns:
+            pandas.DataFrame: one row per job in the original order
+        """
+        plan = pd.DataFrame(jobs,columns=["origin","destination","start","end"])
+        plan["departure_date"] = pd.to_datetime(plan["start"],format="%m/%d/%Y").dt.date.astype(str)
+        plan["return_date"] = pd.to_datetime(plan["end"],format="%m/%d/%Y").dt.date.astype(str)
+        keys = ["origin","destination","departure_date","return_date"]
+        history = self.history(jobs)
+        if not history.empty:
+            latest = history.sort_values("scraped_at").groupby(keys).tail(VOLATILITY_WINDOW)
+            prices = latest.groupby(keys)["price_minor"]
+            stats = pd.DataFrame({"last_scraped":latest.groupby(keys)["scraped_at"].max(),
+                                  "scrapes":prices.size(),
+                                  "volatility":prices.std(ddof=0) / prices.mean()}).reset_index()
+            plan = plan.merge(stats,on=keys,how="left")
+        else:
+            plan = plan.assign(last_scraped=None,scrapes=0,volatility=float("nan"))
+        plan["scrapes"] = plan["scrapes"].fillna(0).astype(int)
+        plan["volatility"] = plan["volatility"].astype(float)
+        days_out = (pd.to_datetime(plan["departure_date"]) - pd.Timestamp(self.now.date())).dt.days
+        plan["interval_hours"] = [refresh_interval(days,volatility,scrapes)
+                                  for days,volatility,scrapes in zip(days_out,plan["volatility"],plan["scrapes"])]
+        age_hours = (pd.Timestamp(self.now) - pd.to_datetime(plan["last_scraped"])).dt.total_seconds() / 3600
+        #Never scraped dates come first, the rest by how many intervals they are overdue, near dates first on a tie.
+        plan["priority"] = (age_hours / plan["interval_hours"]).fillna(float("inf"))
+        plan["days_out"] = days_out
+        return plan
+
+    def select(self,jobs):
+        """
+        This function returns the jobs that are due, most overdue first, cut to the budget.
+
+        Args:
+            jobs (list): (origin,destination,starting_date,ending_date) tuples
+
+        Returns:
+            list: jobs to search in this run
+        """
+        if not jobs:
+            return jobs
+        plan = self.plan(jobs)
+        due = plan[plan["priority"] >= 1].sort_values(["priority","days_out"],ascending=[False,True],kind="stable")
+        selected = due if self.budget is None else due.head(self.budget)
+        print(f"Scheduler: {len(due)} of {len(plan)} dates are due for a refresh, searching {len(selected)}...")
+        return [tuple(job) for job in selected[["origin","destination","start","end"]].itertuples(index=False,name=None)]
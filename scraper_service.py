@@ -0,0 +1,469 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from urllib.parse import urlparse,parse_qs
+from playwright.async_api import async_playwright,Error as PlaywrightError
+import pandas as pd
+import async_engine
+from async_engine import scrape_date
+from batch_jobs import parse_query,unique_jobs,build_date_pairs
+from page_parsing import sheet_name_for,FARE_MATRIX_ATTR,FARE_MATRIX_COLUMNS
+from fare_cache import FareCache,CACHE_PATH,CACHE_TTL_HOURS,CACHE_MAX_ENTRIES
+from fare_schema import normalize_fares
+from fare_store import FareStore,STORE_PATH
+from metrics import METRICS
+from rate_control import TokenBucket
+from readiness import BudgetExceeded
+from request_filter import RequestFilter,BLOCKED_RESOURCE_TYPES
+from browser_cache import BrowserCache
+from settings import BROWSER_CACHE_PATH,MAX_SEARCHES_PER_BROWSER
+
+#Ver 1.3 --Service mode: one long running process keeps the browser and a pool of contexts with the search form already loaded,
+#route queries are submitted over a local HTTP/JSON API and their dates are streamed back as they finish.
+#Next to the default port of replay_server.py (8765), so both can run side by side locally.
+SERVICE_PORT = 8766
+POOL_SIZE = 2
+#Finished queries are kept this many seconds for the clients that read them late.
+QUERY_TTL = 3600
+
+
+class WarmSlot:
+    """
+    One browser context of the pool with its request filter and the page that shows the empty search form.
+    """
+
+    def __init__(self,number):
+        self.number = number
+        self.context = None
+        self.page = None
+        self.request_filter = None
+        self.searches = 0
+        self.state_saved = False
+
+
+class WarmPool:
+    """
+    Ver 1.3 -- Pool of warm browser contexts shared by every query of the service. The site is loaded on a new page of a slot
+    while it waits for its next search, so a search starts at the filled form instead of a cold browser launch and page load.
+    A slot's context is renewed after max_searches searches or a failed page load, the browser is relaunched if it disconnects.
+
+    Args:
+        size (int): number of contexts, the number of dates searched in parallel
+        headless (bool): runs firefox headless if True
+        max_searches (int): renew the context of a slot after this many searches, 0 never renews
+        request_filter (RequestFilter): settings of the filter installed on every context, None disables it
+        browser_cache (BrowserCache): on-disk cache of the site's files and storage state shared by the contexts, None disables it
+    """
+
+    def __init__(self,size=POOL_SIZE,headless=True,max_searches=MAX_SEARCHES_PER_BROWSER,request_filter=None,browser_cache=None):
+        self.size = size
+        self.headless = headless
+        self.max_searches = max_searches
+        self.request_filter = request_filter
+        self.browser_cache = browser_cache
+        self.playwright = None
+        self.browser = None
+        self.slots = [WarmSlot(number) for number in range(1,size+1)]
+        self.idle = asyncio.Queue()
+        self.warming = set()
+        self.searches = 0
+
+    async def start(self):
+        self.playwright = await async_playwright().start()
+        await self.launch()
+        await asyncio.gather(*(self.warm(slot) for slot in self.slots))
+        for slot in self.slots:
+            self.idle.put_nowait(slot)
+        print(f"{self.size} warm browser contexts are ready...")
+
+    async def launch(self):
+        with METRICS.stage("launch"):
+            self.browser = await self.playwright.firefox.launch(headless=self.headless,timeout=10000)
+
+    async def new_context(self,slot):
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except PlaywrightError:
+                pass
+        if not self.browser.is_connected():
+            print("Browser disconnected... Relaunching...")
+            await self.launch()
+        with METRICS.stage("new_context",worker=slot.number):
+            if self.browser_cache is not None:
+                slot.context = await self.browser.new_context(**self.browser_cache.context_options())
+                await self.browser_cache.attach_async(slot.context)
+            else:
+                slot.context = await self.browser.new_context()
+            if self.request_filter is not None:
+                slot.request_filter = self.request_filter.clone()
+                await slot.request_filter.attach_async(slot.context)
+        slot.searches = 0
+        slot.state_saved = False
+
+    async def warm(self,slot):
+        """
+        This function opens a new page on the slot's context and loads the search form, renewing the context when it is due or broken.
+        Errors are never raised, a slot that can't be warmed is still given back to the pool.
+        """
+        slot.page = None
+        for attempt in range(3):
+            try:
+                #A failed attempt renews the context before the next one.
+                if attempt or slot.context is None or not self.browser.is_connected() or (self.max_searches and slot.searches >= self.max_searches):
+                    await self.new_context(slot)
+                with METRICS.stage("warm",worker=slot.number):
+                    page = await slot.context.new_page()
+                    await page.goto(async_engine.url)
+                slot.page = page
+                if self.browser_cache is not None and not slot.state_saved:
+                    await self.browser_cache.save_state_async(slot.context)
+                    slot.state_saved = True
+                return
+            except (PlaywrightError,OSError) as error:
+                print(f"[slot {slot.number}] Couldn't load the search page ({str(error).splitlines()[0]})... Renewing the context...")
+        #The search opens a page itself when the slot could not be warmed.
+
+    async def rewarm(self,slot):
+        """
+        This function warms a slot after its search and puts it back in the idle queue, whatever happens.
+        """
+        try:
+            await self.warm(slot)
+        finally:
+            self.idle.put_nowait(slot)
+
+    async def search(self,job,capture=False,limiter=None):
+        """
+        This function searches one date on the next idle slot. The slot is warmed again in the background,
+        the result is returned without waiting for the next page to load.
+
+        Returns:
+            pandas.DataFrame: rows of the date
+        """
+        slot = await self.idle.get()
+        try:
+            origin,destination,starting_date,ending_date = job
+            METRICS.bind(route=f"{origin}-{destination}",date=starting_date,worker=slot.number)
+            if slot.request_filter is not None:
+                slot.request_filter.start_search()
+            with METRICS.stage("date"):
+                dataframes = await scrape_date(slot.context,*job,slot.number,capture=capture,limiter=limiter,page=slot.page)
+            if slot.request_filter is not None:
+                slot.request_filter.finish_search(f"[slot {slot.number}] {origin}{destination} {sheet_name_for(starting_date)}")
+            return dataframes
+        finally:
+            slot.searches += 1
+            self.searches += 1
+            #A reference is kept so the task isn't garbage collected while it runs.
+            task = asyncio.create_task(self.rewarm(slot))
+            self.warming.add(task)
+            task.add_done_callback(self.warming.discard)
+
+    def status(self):
+        return {"slots":self.size,"idle":self.idle.qsize(),"searches":self.searches}
+
+    async def close(self):
+        for task in list(self.warming):
+            task.cancel()
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+
+
+class Query:
+    """
+    A submitted query and the results of its dates. Results are added by the event loop and read by the HTTP handler threads,
+    a reader blocks until the next result arrives.
+    """
+
+    def __init__(self,jobs):
+        self.id = uuid.uuid4().hex[:12]
+        self.jobs = jobs
+        self.created = time.time()
+        self.finished = None
+        self.results = []
+        self.condition = threading.Condition()
+
+    def add(self,result):
+        with self.condition:
+            self.results.append(result)
+            self.condition.notify_all()
+
+    def finish(self):
+        with self.condition:
+            self.finished = time.time()
+            self.condition.notify_all()
+
+    def stream(self):
+        """
+        Yields every result, the ones already there first, then the new ones as they arrive, until the query is finished.
+        """
+        sent = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: len(self.results) > sent or self.finished is not None)
+                results = self.results[sent:]
+                finished = self.finished is not None
+            for result in results:
+                yield result
+            sent += len(results)
+            if finished and sent == len(self.results):
+                return
+
+    def status(self,results=False):
+        status = {"id":self.id,"searches":len(self.jobs),"done":len(self.results),"finished":self.finished is not None}
+        if results:
+            status["results"] = list(self.results)
+        return status
+
+
+class ScraperService:
+    """
+    Ver 1.3 -- Runs the submitted queries on the warm pool. Dates found in the result cache are answered at once, the rest are searched
+    in parallel on the pool and every date is added to the query as soon as it is done, in the order they finish.
+    Scraped dates go to the result cache and the fare store like in a normal run.
+    Queries are submitted from the HTTP threads, the cache, the store and the browsers are only used on the event loop.
+
+    Args:
+        pool (WarmPool): started pool of warm contexts
+        loop (asyncio.AbstractEventLoop): event loop of the pool
+        cache (FareCache): result cache, None disables it
+        store (FareStore): fare store, None disables it
+        typed (bool): return the rows in the typed fare schema
+        capture (bool): read the results from the captured search payload
+        limiter (TokenBucket): rate limiter of the searches, None doesn't limit
+    """
+
+    def __init__(self,pool,loop,cache=None,store=None,typed=False,capture=False,limiter=None):
+        self.pool = pool
+        self.loop = loop
+        self.cache = cache
+        self.store = store
+        self.typed = typed
+        self.capture = capture
+        self.limiter = limiter
+        self.queries = {}
+        self.lock = threading.Lock()
+
+    def submit(self,queries):
+        """
+        This function creates a query for the date windows of the route queries and starts it on the event loop.
+
+        Args:
+            queries (list): validated route queries, see batch_jobs.parse_query
+
+        Returns:
+            Query: the started query
+        """
+        jobs = []
+        for query in queries:
+            jobs.extend((query["origin"],query["destination"],starting_date,ending_date)
+                        for starting_date,ending_date in build_date_pairs(query["start_date"],query["end_date"],query["period"]))
+        query = Query(unique_jobs(jobs))
+        with self.lock:
+            for query_id in [query_id for query_id,old in self.queries.items() if old.finished and time.time() - old.finished > QUERY_TTL]:
+                del self.queries[query_id]
+            self.queries[query.id] = query
+        asyncio.run_coroutine_threadsafe(self.run(query),self.loop)
+        return query
+
+    def get(self,query_id):
+        with self.lock:
+            return self.queries.get(query_id)
+
+    async def run(self,query):
+        try:
+            missing = []
+            for job in query.jobs:
+                dataframes = self.cache.get(*job) if self.cache is not None else None
+                if dataframes is None:
+                    missing.append(job)
+                else:
+                    query.add(self.result(job,dataframes,"cache"))
+            tasks = [asyncio.create_task(self.search(job)) for job in missing]
+            for task in asyncio.as_completed(tasks):
+                query.add(await task)
+        finally:
+            query.finish()
+
+    async def search(self,job):
+        try:
+            dataframes = await self.pool.search(job,capture=self.capture,limiter=self.limiter)
+        except BudgetExceeded as error:
+            return self.result(job,error=str(error))
+        except Exception as error:
+            #One broken date must not end the query or the service, the error is returned with the date.
+            return self.result(job,error=f"{type(error).__name__}: {error}")
+        if self.store is not None:
+            with METRICS.stage("store",rows=len(dataframes)):
+                #Every search of the long running service is its own scrape, a refreshed date gets a new snapshot.
+                self.store.add(*job,dataframes,scraped_at=datetime.now().isoformat(timespec="seconds"))
+        if self.cache is not None:
+            self.cache.put(*job,dataframes)
+        return self.result(job,dataframes,"search")
+
+    def result(self,job,dataframes=None,source=None,error=None):
+        """
+        Returns:
+            dict: one date of a query as it is sent to the clients, with its rows and fare matrix or the error
+        """
+        result = dict(zip(("origin","destination","start_date","end_date"),job))
+        if error is not None:
+            result["error"] = error
+            return result
+        result["source"] = source
+        rows = normalize_fares(dataframes) if self.typed else dataframes
+        result["rows"] = json.loads(rows.to_json(orient="records",date_format="iso"))
+        matrix = dataframes.attrs.get(FARE_MATRIX_ATTR)
+        if matrix:
+            result["matrix"] = pd.DataFrame(matrix,columns=FARE_MATRIX_COLUMNS).to_dict(orient="records")
+        return result
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    Local HTTP/JSON API of the service:
+        POST /v1/queries               submit one query or a list of queries in the batch file format, returns the query id
+        POST /v1/queries?stream=1      submit and stream the results in the same request
+        GET  /v1/queries/<id>          status and the results so far
+        GET  /v1/queries/<id>/stream   results as JSON lines as the dates finish
+        GET  /health                   pool status
+    Streams are newline delimited JSON, one line per date and a last {"finished": true} line.
+    """
+
+    def log_message(self,*args):
+        pass
+
+    def send_json(self,status,body):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type","application/json")
+        self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self,query):
+        #No Content-Length, the stream ends when the connection is closed after the last line.
+        self.send_response(200)
+        self.send_header("Content-Type","application/x-ndjson")
+        self.send_header("X-Query-Id",query.id)
+        self.end_headers()
+        try:
+            for result in query.stream():
+                self.wfile.write((json.dumps(result) + "\n").encode())
+                self.wfile.flush()
+            self.wfile.write((json.dumps({"id":query.id,"finished":True}) + "\n").encode())
+        except (BrokenPipeError,ConnectionResetError):
+            #The client went away, the query keeps running and can be read again.
+            pass
+
+    def do_POST(self):
+        request = urlparse(self.path)
+        if request.path != "/v1/queries":
+            self.send_json(404,{"error":"not found"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+        try:
+            loaded = json.loads(body)
+            lines = loaded if isinstance(loaded,list) else [loaded]
+            queries = [parse_query(json.dumps(line),number) for number,line in enumerate(lines,1)]
+        except ValueError as error:
+            self.send_json(400,{"error":str(error)})
+            return
+        if not queries:
+            self.send_json(400,{"error":"no queries"})
+            return
+        query = self.server.service.submit(queries)
+        if parse_qs(request.query).get("stream",["0"])[0] not in ("0","false"):
+            self.stream(query)
+        else:
+            self.send_json(202,{**query.status(),"stream":f"/v1/queries/{query.id}/stream"})
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        service = self.server.service
+        if parts == ["health"]:
+            self.send_json(200,{**service.pool.status(),"queries":len(service.queries)})
+            return
+        if len(parts) in (3,4) and parts[:2] == ["v1","queries"]:
+            query = service.get(parts[2])
+            if query is None:
+                self.send_json(404,{"error":f"unknown query {parts[2]}"})
+            elif len(parts) == 4 and parts[3] == "stream":
+                self.stream(query)
+            elif len(parts) == 3:
+                self.send_json(200,query.status(results=True))
+            else:
+                self.send_json(404,{"error":"not found"})
+            return
+        self.send_json(404,{"error":"not found"})
+
+
+async def serve(args):
+    """
+    This function starts the warm pool and the HTTP server and runs until the process is interrupted.
+    """
+    request_filter = None
+    if not args.no_request_filter:
+        request_filter = RequestFilter([resource_type for resource_type in args.block_types.split(",") if resource_type])
+    cache = FareCache(args.cache_path,ttl=args.cache_ttl*3600,max_entries=args.cache_max_entries) if args.cache_ttl > 0 else None
+    store = FareStore(args.store) if not args.no_store else None
+    browser_cache = BrowserCache(args.browser_cache_path) if args.browser_cache else None
+    pool = WarmPool(args.pool_size,headless=True,max_searches=args.max_searches,request_filter=request_filter,browser_cache=browser_cache)
+    await pool.start()
+    service = ScraperService(pool,asyncio.get_running_loop(),cache,store,typed=args.schema == "typed",capture=args.capture_responses,
+                             limiter=TokenBucket(args.rate/60,args.burst) if args.rate else None)
+    server = ThreadingHTTPServer(("127.0.0.1",args.port),ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever,daemon=True).start()
+    print(f"Scraper service is listening on http://127.0.0.1:{server.server_address[1]}/v1/queries...")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.shutdown()
+        await pool.close()
+        if store is not None:
+            store.close()
+        if cache is not None:
+            cache.close()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Keeps warm browser contexts and answers route queries over a local HTTP/JSON API.")
+    parser.add_argument("--port",type=int,default=SERVICE_PORT,help=f"port on 127.0.0.1 (default: {SERVICE_PORT})")
+    parser.add_argument("--pool-size",type=int,default=POOL_SIZE,help=f"number of warm browser contexts, dates searched in parallel (default: {POOL_SIZE})")
+    parser.add_argument("--max-searches",type=int,default=MAX_SEARCHES_PER_BROWSER,
+                        help=f"renew a context after this many searches, 0 never renews (default: {MAX_SEARCHES_PER_BROWSER})")
+    parser.add_argument("--capture-responses",action="store_true",help="read the results from the search response instead of clicking every carrier")
+    parser.add_argument("--schema",choices=["raw","typed"],default="raw",help="rows as table text or in the typed fare schema (default: raw)")
+    parser.add_argument("--rate",type=float,help="maximum searches per minute (default: no limit)")
+    parser.add_argument("--burst",type=int,default=1,help="searches that can start at once under --rate (default: 1)")
+    parser.add_argument("--block-types",default=",".join(sorted(BLOCKED_RESOURCE_TYPES)),help="comma separated resource types that are not loaded")
+    parser.add_argument("--no-request-filter",action="store_true",help="load every resource and third party host like a normal browser")
+    parser.add_argument("--browser-cache",action="store_true",help="keep the site's files and storage state on disk for every context and restart")
+    parser.add_argument("--browser-cache-path",default=BROWSER_CACHE_PATH,help=f"directory of the browser cache (default: {BROWSER_CACHE_PATH})")
+    parser.add_argument("--cache-ttl",type=float,default=CACHE_TTL_HOURS,help=f"hours a cached result is answered from the cache, 0 disables it (default: {CACHE_TTL_HOURS})")
+    parser.add_argument("--cache-path",default=CACHE_PATH,help=f"SQLite file of the result cache (default: {CACHE_PATH})")
+    parser.add_argument("--cache-max-entries",type=int,default=CACHE_MAX_ENTRIES,help="least recently used results above this are evicted")
+    parser.add_argument("--store",default=STORE_PATH,help=f"SQLite fare store every scrape is added to (default: {STORE_PATH})")
+    parser.add_argument("--no-store",action="store_true",help="don't add the scraped rows to the fare store")
+    parser.add_argument("--metrics-port",type=int,help="serves the stage totals on http://127.0.0.1:PORT/metrics")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    METRICS.configure(port=args.metrics_port)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("Scraper service stopped...")
+    METRICS.close()
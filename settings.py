@@ -0,0 +1,20 @@
+#Ver 1.3 --Defaults of the command line options. They are kept out of the modules that use them, which import pandas and playwright,
+#so the command line can be parsed and validated before any heavy import. The modules import them from here under the same names.
+
+#Result cache (fare_cache.py).
+CACHE_PATH = "fare_cache.sqlite"
+CACHE_TTL_HOURS = 6
+CACHE_MAX_ENTRIES = 20000
+#Fare store (fare_store.py), every scrape is added to it unless --no-store is given.
+STORE_PATH = "fares.sqlite"
+#The browser is relaunched after this many searches to keep its memory usage in check.
+MAX_SEARCHES_PER_BROWSER = 50
+#Formats of the streaming output (result_sinks.py), the first one is the default.
+OUTPUT_FORMATS = ("csv","parquet")
+#Browser cache (browser_cache.py), static files of the site and its storage state, used with --browser-cache.
+BROWSER_CACHE_PATH = "browser_cache"
+#Failure queue (failure_queue.py), dates and carriers that failed are retried at the end of the run and with --retry-failures.
+FAILURES_PATH = "failed_searches.json"
+FAILURE_REPORT_PATH = "failure_report.csv"
+MAX_ATTEMPTS = 3
+RETRY_ROUNDS = 1
@@ -0,0 +1,71 @@
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import pytest
+from playwright.sync_api import sync_playwright,Error as PlaywrightError
+import async_engine
+from benchmark import benchmark_jobs,count_written
+from failure_queue import FailureQueue
+from matrix_scraper import load_scraper
+from replay_server import start_server
+from response_capture import check_response,load_payload,parse_search_payload
+
+#Ver 1.3 --Checks of the scraper against the local replay server (replay_server.py). The backend calls fail with a 503 at the
+#failure rate, a failed search has to be retried or recorded in the failure queue and never end the run.
+
+scraper = load_scraper()
+
+
+@pytest.fixture
+def server():
+    server = start_server(latency=0.01,failure_rate=0.5,carriers=3,rows=4,seed=7)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def firefox():
+    #The end to end checks need the playwright firefox build, they are skipped where it is not installed.
+    with sync_playwright() as p:
+        try:
+            p.firefox.launch(headless=True).close()
+        except PlaywrightError as error:
+            pytest.skip(f"firefox is not available: {error.message.splitlines()[0]}")
+    yield
+
+
+def search(server,**params):
+    query = "&".join(f"{key}={value}" for key,value in {"origin":"IST","destination":"JFK","start":"01/10/2027","end":"01/17/2027",**params}.items())
+    try:
+        with urlopen(f"{server.url}/v1/search?{query}") as response:
+            return response.status,response.read().decode()
+    except HTTPError as error:
+        return error.code,error.read().decode()
+
+
+def test_failed_backend_call_is_rejected(server):
+    statuses = set()
+    for _ in range(20):
+        status,body = search(server)
+        statuses.add(status)
+        if status == 200:
+            check_response(status)
+            assert not parse_search_payload(load_payload(body),"01/10/2027","01/17/2027").empty
+        else:
+            with pytest.raises(ValueError):
+                check_response(status)
+            with pytest.raises(ValueError):
+                load_payload(body)
+    assert statuses == {200,503}
+
+
+@pytest.mark.parametrize("concurrency",[1,2])
+def test_capture_run_survives_failures(server,firefox,concurrency,tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scraper,"url",server.url)
+    monkeypatch.setattr(async_engine,"url",server.url)
+    jobs = benchmark_jobs(["IST-JFK"],4)
+    failures = FailureQueue(str(tmp_path / "failed_searches.json"))
+    scraper.scrape_jobs(jobs,concurrency=concurrency,capture=True,excel=False,failures=failures)
+    #Every date is either written or waiting in the failure queue.
+    queued = {key[:4] for key in failures.entries}
+    assert count_written(jobs) + len(queued) == len(jobs)